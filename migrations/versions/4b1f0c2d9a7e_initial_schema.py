@@ -0,0 +1,73 @@
+"""initial schema
+
+Revision ID: 4b1f0c2d9a7e
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1f0c2d9a7e'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('registered_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('hashed_password', sa.String(length=1024), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('is_superuser', sa.Boolean(), nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'task',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], )
+    )
+    op.create_table(
+        'figi',
+        sa.Column('ticker', sa.String(), nullable=True),
+        sa.Column('figi', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('class_code', sa.String(), nullable=True),
+        sa.Column('uid', sa.String(), nullable=True),
+        sa.Column('asset_uid', sa.String(), nullable=True),
+        sa.Column('sector', sa.String(), nullable=True),
+        sa.Column('api_trade_available_flag', sa.Boolean(), nullable=True),
+        sa.Column('exchange', sa.String(), nullable=True),
+        sa.Column('buy_available_flag', sa.Boolean(), nullable=True),
+        sa.Column('sell_available_flag', sa.Boolean(), nullable=True)
+    )
+    op.create_table(
+        'fundamental',
+        sa.Column('asset_uid', sa.String(), nullable=False),
+        sa.Column('pe_ratio_ttm', sa.Float(), nullable=True),
+        sa.Column('price_to_sales_ttm', sa.Float(), nullable=True),
+        sa.Column('price_to_book_ttm', sa.Float(), nullable=True),
+        sa.Column('ev_to_ebitda_mrq', sa.Float(), nullable=True),
+        sa.Column('roe', sa.Float(), nullable=True),
+        sa.Column('total_debt_to_equity_mrq', sa.Float(), nullable=True),
+        sa.Column('update_time', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('asset_uid')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fundamental')
+    op.drop_table('figi')
+    op.drop_table('task')
+    op.drop_table('user')
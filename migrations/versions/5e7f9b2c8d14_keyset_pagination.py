@@ -0,0 +1,67 @@
+"""keyset pagination keys for share_ranking and task
+
+Revision ID: 5e7f9b2c8d14
+Revises: d2a8b6c41e93
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7f9b2c8d14'
+down_revision: Union[str, None] = 'd2a8b6c41e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RANKING_RULES = {
+    'pe_ratio_ttm': ('fu.pe_ratio_ttm > 0', 'ASC'),
+    'ev_to_ebitda_mrq': ('fu.ev_to_ebitda_mrq > 0', 'ASC'),
+    'total_debt_to_equity_mrq': ('fu.total_debt_to_equity_mrq > 0', 'ASC'),
+    'price_to_sales_ttm': ('fu.price_to_sales_ttm > 0 AND fu.price_to_sales_ttm < 1', 'ASC'),
+    'price_to_book_ttm': ('fu.price_to_book_ttm > 0 AND fu.price_to_book_ttm < 1', 'ASC'),
+    'roe': ('fu.roe > 0', 'DESC'),
+}
+
+
+def create_share_ranking(with_sort_value: bool) -> None:
+    selects = []
+    for metric, (condition, direction) in RANKING_RULES.items():
+        # sort_value всегда растёт вдоль рейтинга, чтобы курсор (sort_value, uid) шёл по одному индексу
+        sort_value = f"-fu.{metric}" if direction == 'DESC' else f"fu.{metric}"
+        selects.append(
+            f"SELECT f.sector, '{metric}'::varchar AS metric, "
+            f"row_number() OVER (PARTITION BY f.sector ORDER BY fu.{metric} {direction}, f.uid) AS rank, "
+            f"fu.{metric} AS value, "
+            + (f"{sort_value} AS sort_value, " if with_sort_value else "") +
+            f"f.uid "
+            f"FROM figi f JOIN fundamental fu ON f.asset_uid = fu.asset_uid "
+            f"WHERE f.buy_available_flag = true AND f.sell_available_flag = true "
+            f"AND f.exchange NOT LIKE '%close%' AND {condition}"
+        )
+    op.execute("CREATE MATERIALIZED VIEW share_ranking AS " + " UNION ALL ".join(selects))
+    op.create_index('ux_share_ranking_page', 'share_ranking', ['sector', 'metric', 'rank'], unique=True)
+    if with_sort_value:
+        op.create_index('ux_share_ranking_cursor', 'share_ranking',
+                        ['sector', 'metric', 'sort_value', 'uid'], unique=True)
+
+
+def upgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW share_ranking")
+    create_share_ranking(with_sort_value=True)
+
+    op.add_column('task', sa.Column('id', sa.Integer(), sa.Identity(), nullable=False))
+    op.create_primary_key('task_pkey', 'task', ['id'])
+    op.create_index('ix_task_user_id_id', 'task', ['user_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_user_id_id', table_name='task')
+    op.drop_constraint('task_pkey', 'task', type_='primary')
+    op.drop_column('task', 'id')
+
+    op.execute("DROP MATERIALIZED VIEW share_ranking")
+    create_share_ranking(with_sort_value=False)
@@ -0,0 +1,62 @@
+"""fundamental_history partitioned table
+
+Revision ID: 7a4d2e9f0b61
+Revises: 5e7f9b2c8d14
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4d2e9f0b61'
+down_revision: Union[str, None] = '5e7f9b2c8d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'fundamental_history',
+        sa.Column('asset_uid', sa.String(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('pe_ratio_ttm', sa.Float(), nullable=True),
+        sa.Column('price_to_sales_ttm', sa.Float(), nullable=True),
+        sa.Column('price_to_book_ttm', sa.Float(), nullable=True),
+        sa.Column('ev_to_ebitda_mrq', sa.Float(), nullable=True),
+        sa.Column('roe', sa.Float(), nullable=True),
+        sa.Column('total_debt_to_equity_mrq', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('asset_uid', 'recorded_at'),
+        postgresql_partition_by='RANGE (recorded_at)',
+    )
+    # месячные партиции от самых старых данных до следующего месяца,
+    # дальше их заранее создаёт fundamentals_updater (границы в UTC)
+    op.execute("SET LOCAL TIME ZONE 'UTC'")
+    op.execute("""
+        DO $$
+        DECLARE
+            month date := date_trunc('month', coalesce((SELECT min(update_time) FROM fundamental), now()));
+        BEGIN
+            WHILE month <= date_trunc('month', now()) + interval '1 month' LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF fundamental_history FOR VALUES FROM (%L) TO (%L)',
+                    'fundamental_history_' || to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+    # начальная точка истории - текущие значения
+    op.execute(
+        "INSERT INTO fundamental_history (asset_uid, recorded_at, pe_ratio_ttm, price_to_sales_ttm, "
+        "price_to_book_ttm, ev_to_ebitda_mrq, roe, total_debt_to_equity_mrq) "
+        "SELECT asset_uid, update_time, pe_ratio_ttm, price_to_sales_ttm, price_to_book_ttm, "
+        "ev_to_ebitda_mrq, roe, total_debt_to_equity_mrq FROM fundamental WHERE update_time IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fundamental_history')
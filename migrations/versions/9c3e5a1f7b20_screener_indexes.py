@@ -0,0 +1,59 @@
+"""figi primary key and screener indexes
+
+Revision ID: 9c3e5a1f7b20
+Revises: 4b1f0c2d9a7e
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5a1f7b20'
+down_revision: Union[str, None] = '4b1f0c2d9a7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FUNDAMENTAL_METRICS = [
+    'pe_ratio_ttm', 'price_to_sales_ttm', 'price_to_book_ttm',
+    'ev_to_ebitda_mrq', 'roe', 'total_debt_to_equity_mrq',
+]
+
+
+def upgrade() -> None:
+    # figi перезаливался через DELETE+INSERT, дубли uid могли остаться
+    op.execute("DELETE FROM figi a USING figi b WHERE a.uid = b.uid AND a.ctid < b.ctid")
+    op.execute("DELETE FROM figi WHERE uid IS NULL")
+    op.alter_column('figi', 'uid', existing_type=sa.String(), nullable=False)
+    op.create_primary_key('figi_pkey', 'figi', ['uid'])
+
+    op.create_index('ix_figi_ticker', 'figi', ['ticker'])
+    op.create_index('ix_figi_figi', 'figi', ['figi'])
+    op.create_index('ix_figi_asset_uid', 'figi', ['asset_uid'])
+    op.create_index('ix_figi_lower_name', 'figi', [sa.text('lower(name)')])
+    op.create_index(
+        'ix_figi_tradable_sector', 'figi', ['sector', 'asset_uid'],
+        postgresql_where=sa.text("buy_available_flag = true AND sell_available_flag = true "
+                                 "AND exchange NOT LIKE '%close%'")
+    )
+
+    for metric in FUNDAMENTAL_METRICS:
+        op.create_index(f'ix_fundamental_{metric}', 'fundamental', [metric, 'asset_uid'])
+    op.create_index('ix_fundamental_update_time', 'fundamental', ['update_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fundamental_update_time', table_name='fundamental')
+    for metric in FUNDAMENTAL_METRICS:
+        op.drop_index(f'ix_fundamental_{metric}', table_name='fundamental')
+
+    op.drop_index('ix_figi_tradable_sector', table_name='figi')
+    op.drop_index('ix_figi_lower_name', table_name='figi')
+    op.drop_index('ix_figi_asset_uid', table_name='figi')
+    op.drop_index('ix_figi_figi', table_name='figi')
+    op.drop_index('ix_figi_ticker', table_name='figi')
+    op.drop_constraint('figi_pkey', 'figi', type_='primary')
+    op.alter_column('figi', 'uid', existing_type=sa.String(), nullable=True)
@@ -0,0 +1,37 @@
+"""candle table for technical indicators
+
+Revision ID: b3c9e1d7a582
+Revises: 7a4d2e9f0b61
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3c9e1d7a582'
+down_revision: Union[str, None] = '7a4d2e9f0b61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'candle',
+        sa.Column('uid', sa.String(), nullable=False),
+        sa.Column('interval', sa.String(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('open', sa.Float(), nullable=True),
+        sa.Column('high', sa.Float(), nullable=True),
+        sa.Column('low', sa.Float(), nullable=True),
+        sa.Column('close', sa.Float(), nullable=True),
+        sa.Column('volume', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('uid', 'interval', 'time'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('candle')
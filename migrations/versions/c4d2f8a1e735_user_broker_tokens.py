@@ -0,0 +1,28 @@
+"""encrypted broker tokens on user
+
+Revision ID: c4d2f8a1e735
+Revises: b3c9e1d7a582
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d2f8a1e735'
+down_revision: Union[str, None] = 'b3c9e1d7a582'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('broker_tokens', postgresql.ARRAY(sa.String()),
+                                    server_default=sa.text("'{}'"), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'broker_tokens')
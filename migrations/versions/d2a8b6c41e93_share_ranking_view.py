@@ -0,0 +1,47 @@
+"""share_ranking materialized view
+
+Revision ID: d2a8b6c41e93
+Revises: 9c3e5a1f7b20
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8b6c41e93'
+down_revision: Union[str, None] = '9c3e5a1f7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# metric: (условие отбора, сортировка) - те же правила, что были в get_top_shares_by_sector
+RANKING_RULES = {
+    'pe_ratio_ttm': ('fu.pe_ratio_ttm > 0', 'ASC'),
+    'ev_to_ebitda_mrq': ('fu.ev_to_ebitda_mrq > 0', 'ASC'),
+    'total_debt_to_equity_mrq': ('fu.total_debt_to_equity_mrq > 0', 'ASC'),
+    'price_to_sales_ttm': ('fu.price_to_sales_ttm > 0 AND fu.price_to_sales_ttm < 1', 'ASC'),
+    'price_to_book_ttm': ('fu.price_to_book_ttm > 0 AND fu.price_to_book_ttm < 1', 'ASC'),
+    'roe': ('fu.roe > 0', 'DESC'),
+}
+
+
+def upgrade() -> None:
+    selects = [
+        f"SELECT f.sector, '{metric}'::varchar AS metric, "
+        f"row_number() OVER (PARTITION BY f.sector ORDER BY fu.{metric} {direction}, f.uid) AS rank, "
+        f"fu.{metric} AS value, f.uid "
+        f"FROM figi f JOIN fundamental fu ON f.asset_uid = fu.asset_uid "
+        f"WHERE f.buy_available_flag = true AND f.sell_available_flag = true "
+        f"AND f.exchange NOT LIKE '%close%' AND {condition}"
+        for metric, (condition, direction) in RANKING_RULES.items()
+    ]
+    op.execute("CREATE MATERIALIZED VIEW share_ranking AS " + " UNION ALL ".join(selects))
+    # уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ux_share_ranking_page', 'share_ranking', ['sector', 'metric', 'rank'], unique=True)
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW share_ranking")
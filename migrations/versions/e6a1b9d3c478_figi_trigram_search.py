@@ -0,0 +1,28 @@
+"""pg_trgm indexes for instrument search
+
+Revision ID: e6a1b9d3c478
+Revises: c4d2f8a1e735
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1b9d3c478'
+down_revision: Union[str, None] = 'c4d2f8a1e735'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX ix_figi_name_trgm ON figi USING gin (lower(name) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_figi_ticker_trgm ON figi USING gin (lower(ticker) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX ix_figi_ticker_trgm")
+    op.execute("DROP INDEX ix_figi_name_trgm")
@@ -0,0 +1,28 @@
+"""drop ix_figi_lower_name
+
+Revision ID: f1b7c3a9d250
+Revises: e6a1b9d3c478
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b7c3a9d250'
+down_revision: Union[str, None] = 'e6a1b9d3c478'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # get_data_by_name отвечает из индекса в памяти, а lower(name) в search_db
+    # обслуживает ix_figi_name_trgm - btree только замедлял запись в figi
+    op.drop_index('ix_figi_lower_name', table_name='figi')
+
+
+def downgrade() -> None:
+    op.create_index('ix_figi_lower_name', 'figi', [sa.text('lower(name)')])
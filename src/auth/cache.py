@@ -0,0 +1,146 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from cachetools import TTLCache
+from loguru import logger
+
+from src.auth.models import User
+from src.cache import WRITE_IF_GENERATION
+from src.config import AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL
+
+USER_FIELDS = ["id", "email", "username", "registered_at", "is_active", "is_superuser", "is_verified"]
+INVALIDATE_CHANNEL = "auth-user-invalidate"
+GENERATION_PREFIX = "auth-user-generation"
+
+
+def user_to_dict(user: User) -> dict:
+    data = {field: getattr(user, field) for field in USER_FIELDS}
+    if data["registered_at"] is not None:
+        data["registered_at"] = data["registered_at"].isoformat()
+    return data
+
+
+def user_from_dict(data: dict) -> User:
+    data = dict(data)
+    if data["registered_at"] is not None:
+        data["registered_at"] = datetime.fromisoformat(data["registered_at"])
+    # хэш пароля в кеш не кладём, для проверки токена он не нужен
+    return User(hashed_password="", **data)
+
+
+class UserCache:
+    """
+    Кеш пользователей для current_user.
+    Первый уровень - LRU в памяти процесса по (user_id, token), второй - Redis
+    по user_id, общий для воркеров. Запись живёт не дольше токена и
+    AUTH_USER_CACHE_TTL. При изменении пользователя запись удаляется из Redis,
+    а остальные воркеры чистят свой LRU по сообщению в INVALIDATE_CHANNEL.
+    Как в ResponseCache, запись идёт только если поколение пользователя не
+    сменилось с начала чтения из БД: иначе чтение, начатое до invalidate(),
+    вернуло бы в кеш, например, уже деактивированного пользователя.
+    """
+
+    def __init__(self, maxsize: int = AUTH_USER_CACHE_SIZE, ttl: int = AUTH_USER_CACHE_TTL):
+        self.ttl = ttl
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: dict = {}
+        self._redis = None
+        self._listener: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self, redis):
+        self._redis = redis
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    @staticmethod
+    def _redis_key(user_id) -> str:
+        return f"auth-user:{user_id}"
+
+    @staticmethod
+    def _generation_key(user_id) -> str:
+        return f"{GENERATION_PREFIX}:{user_id}"
+
+    async def generation(self, user_id) -> tuple[int, str | None]:
+        """
+        Поколение пользователя перед чтением из БД, передаётся в set().
+        :return: (поколение в процессе, поколение в Redis)
+        """
+        shared = None
+        if self._redis is not None:
+            shared = await self._redis.get(self._generation_key(user_id)) or "0"
+        return self._generations.get(user_id, 0), shared
+
+    async def get(self, user_id, token: str) -> User | None:
+        user = self._local.get((user_id, token))
+        if user is not None:
+            self.hits += 1
+            return user
+        if self._redis is not None:
+            raw = await self._redis.get(self._redis_key(user_id))
+            if raw is not None:
+                user = user_from_dict(json.loads(raw))
+                self._local[(user_id, token)] = user
+                self.hits += 1
+                return user
+        self.misses += 1
+        return None
+
+    async def set(self, user: User, token: str, expires_at: float | None, generation: tuple[int, str | None]):
+        """
+        :param generation: результат generation() до чтения пользователя из БД
+        """
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, int(expires_at - time.time()))
+        local_generation, shared_generation = generation
+        if ttl <= 0 or self._generations.get(user.id, 0) != local_generation:
+            return
+        self._local[(user.id, token)] = user
+        if self._redis is not None and shared_generation is not None:
+            written = await self._redis.eval(WRITE_IF_GENERATION, 2, self._redis_key(user.id),
+                                             self._generation_key(user.id), json.dumps(user_to_dict(user)),
+                                             ttl, shared_generation)
+            if not written:
+                # пользователя сбросили в другом процессе, сообщение о сбросе ещё в пути
+                self._local.pop((user.id, token), None)
+
+    def _drop_local(self, user_id):
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [key for key in list(self._local.keys()) if key[0] == user_id]:
+            self._local.pop(key, None)
+
+    async def invalidate(self, user_id):
+        self._drop_local(user_id)
+        if self._redis is not None:
+            # сначала поколение: запись, начатая до сброса, после этого не пройдёт.
+            # Ключ живёт дольше любого чтения из БД, бесконечно копить их незачем
+            generation_key = self._generation_key(user_id)
+            await self._redis.incr(generation_key)
+            await self._redis.expire(generation_key, self.ttl * 2)
+            await self._redis.delete(self._redis_key(user_id))
+            await self._redis.publish(INVALIDATE_CHANNEL, str(user_id))
+
+    async def _listen(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._drop_local(int(message["data"]))
+        except asyncio.CancelledError:
+            await pubsub.unsubscribe(INVALIDATE_CHANNEL)
+            raise
+        except Exception as e:
+            logger.error(f"user cache invalidation listener stopped: {e}")
+
+
+user_cache = UserCache()
@@ -1,16 +1,51 @@
-from fastapi_users import FastAPIUsers
+import jwt
+from fastapi_users import FastAPIUsers, exceptions
 from fastapi_users.authentication import CookieTransport, AuthenticationBackend
 from fastapi_users.authentication import JWTStrategy
+from fastapi_users.jwt import decode_jwt
 
+from src.auth.cache import user_cache
 from src.auth.manager import get_user_manager
 from src.auth.models import User
-from src.config import SECRET_AUTH
+from src.config import SECRET_AUTH, AUTH_LIFETIME_SECONDS
 
-cookie_transport = CookieTransport(cookie_name="jwt_auth", cookie_max_age=3600)
+cookie_transport = CookieTransport(cookie_name="jwt_auth", cookie_max_age=AUTH_LIFETIME_SECONDS)
+
+
+class CachedJWTStrategy(JWTStrategy):
+    """
+    JWTStrategy, которая после проверки подписи берёт пользователя из
+    user_cache, а в БД идёт только при промахе.
+    """
+
+    async def read_token(self, token, user_manager):
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+            parsed_id = user_manager.parse_id(user_id)
+        except (jwt.PyJWTError, exceptions.InvalidID):
+            return None
+
+        user = await user_cache.get(parsed_id, token)
+        if user is not None:
+            return user
+
+        generation = await user_cache.generation(parsed_id)
+        try:
+            user = await user_manager.get(parsed_id)
+        except exceptions.UserNotExists:
+            return None
+        await user_cache.set(user, token, data.get("exp"), generation)
+        return user
 
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET_AUTH, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=SECRET_AUTH, lifetime_seconds=AUTH_LIFETIME_SECONDS)
 
 
 auth_backend = AuthenticationBackend(
@@ -1,7 +1,8 @@
 from datetime import datetime
 
 from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
-from sqlalchemy import Table, Column, Integer, String, TIMESTAMP, Boolean, MetaData
+from sqlalchemy import Table, Column, Integer, String, TIMESTAMP, Boolean, MetaData, text
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from src.database import Base
 
@@ -19,6 +20,8 @@ user = Table(
     Column("is_active", Boolean, default=True, nullable=False),
     Column("is_superuser", Boolean, default=False, nullable=False),
     Column("is_verified", Boolean, default=False, nullable=False),
+    # API токены брокера, зашифрованы (auth.tokens)
+    Column("broker_tokens", ARRAY(String), server_default=text("'{}'"), nullable=False),
 )
 
 
@@ -30,4 +33,5 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     hashed_password: str = Column(String(length=1024), nullable=False)
     is_active: bool = Column(Boolean, default=True, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
-    is_verified: bool = Column(Boolean, default=False, nullable=False)
\ No newline at end of file
+    is_verified: bool = Column(Boolean, default=False, nullable=False)
+    broker_tokens: list[str] = Column(ARRAY(String), server_default=text("'{}'"), nullable=False)
\ No newline at end of file
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet, InvalidToken
+from loguru import logger
+from sqlalchemy import select, update, func
+
+from src.auth.models import user as user_table
+from src.config import BROKER_TOKEN_KEY, SECRET_AUTH
+
+
+def _fernet() -> Fernet:
+    """
+    Ключ шифрования токенов брокера: BROKER_TOKEN_KEY или производный от SECRET_AUTH.
+    Производный ключ меняется вместе с SECRET_AUTH - после ротации секрета
+    JWT сохранённые токены не расшифруются.
+    """
+    key = BROKER_TOKEN_KEY
+    if key is None:
+        if not SECRET_AUTH:
+            # иначе ключ вывелся бы из строки "None" и был бы одинаковым у всех инсталляций
+            raise RuntimeError("set BROKER_TOKEN_KEY or SECRET_AUTH to encrypt broker tokens")
+        logger.warning("BROKER_TOKEN_KEY is not set, broker tokens are encrypted with a key derived from "
+                       "SECRET_AUTH and become unreadable if it is rotated")
+        key = base64.urlsafe_b64encode(hashlib.sha256(f"broker-tokens:{SECRET_AUTH}".encode()).digest())
+    return Fernet(key)
+
+
+fernet = _fernet()
+
+
+def encrypt_token(token: str) -> str:
+    return fernet.encrypt(token.encode()).decode()
+
+
+def decrypt_token(encrypted: str) -> str | None:
+    try:
+        return fernet.decrypt(encrypted.encode()).decode()
+    except InvalidToken:
+        # сменили ключ - токен придётся добавить заново
+        logger.error("broker token can not be decrypted")
+        return None
+
+
+def mask_token(token: str) -> str:
+    return f"...{token[-4:]}"
+
+
+async def get_broker_tokens(session, user_id: int) -> list[str]:
+    """
+    Расшифрованные токены брокера пользователя, в порядке добавления.
+    В кеш пользователей (auth.cache) они не попадают, поэтому читаются из БД.
+    """
+    encrypted = (await session.execute(
+        select(user_table.c.broker_tokens).where(user_table.c.id == user_id)
+    )).scalar()
+    tokens = [decrypt_token(value) for value in encrypted or []]
+    return [token for token in tokens if token is not None]
+
+
+async def add_broker_token(session, user_id: int, token: str):
+    if token in await get_broker_tokens(session, user_id):
+        return
+    await session.execute(
+        update(user_table).
+        where(user_table.c.id == user_id).
+        values(broker_tokens=func.array_append(user_table.c.broker_tokens, encrypt_token(token)))
+    )
+    await session.commit()
+
+
+async def remove_broker_token(session, user_id: int, index: int) -> bool:
+    """
+    :param index: позиция токена в списке get_broker_tokens
+    :return: False, если такого токена нет
+    """
+    encrypted = (await session.execute(
+        select(user_table.c.broker_tokens).where(user_table.c.id == user_id).with_for_update()
+    )).scalar() or []
+    readable = [value for value in encrypted if decrypt_token(value) is not None]
+    if not 0 <= index < len(readable):
+        return False
+    await session.execute(
+        update(user_table).
+        where(user_table.c.id == user_id).
+        values(broker_tokens=[value for value in encrypted if value != readable[index]])
+    )
+    await session.commit()
+    return True
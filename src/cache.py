@@ -0,0 +1,233 @@
+import asyncio
+import functools
+import hashlib
+import json
+import time
+
+from cachetools import TTLCache
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from prometheus_client import Counter, Histogram
+from redis import asyncio as aioredis
+
+from src.config import REDIS_URL, RESPONSE_CACHE_LOCAL_SIZE
+
+CACHE_PREFIX = "response-cache"
+INVALIDATE_CHANNEL = "response-cache-invalidate"
+GENERATION_PREFIX = "response-cache-generation"
+# запись в Redis только если поколение неймспейса не сменилось с начала вычисления
+WRITE_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+cache_requests_total = Counter(
+    "response_cache_requests_total",
+    "Обращения к кешу ответов",
+    ["namespace", "result"],
+)
+cache_compute_seconds = Histogram(
+    "response_cache_compute_seconds",
+    "Время вычисления ответа при промахе кеша",
+    ["namespace"],
+)
+
+
+def hash_key(value: str) -> str:
+    """
+    Для чувствительных частей ключа (api токены и т.п.).
+    """
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+class ResponseCache:
+    """
+    Двухуровневый кеш ответов: LRU в памяти процесса перед Redis.
+    Запись свежая ttl секунд, после этого ещё stale_ttl секунд отдаётся как есть,
+    а пересчёт идёт в фоне. Одновременные промахи по одному ключу ждут
+    одно вычисление. Сбрасывается по неймспейсу при изменении данных.
+    Сброс увеличивает поколение неймспейса: значение, вычисленное до сброса
+    (например, фоновым пересчётом), после него уже не записывается.
+    """
+
+    def __init__(self, local_size: int = RESPONSE_CACHE_LOCAL_SIZE):
+        # TTL записи контролируем сами, здесь только верхняя граница жизни
+        self._local: TTLCache = TTLCache(maxsize=local_size, ttl=24 * 3600)
+        self._redis = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._listener: asyncio.Task | None = None
+        self._subscribers: dict[str, list] = {}
+        self._generations: dict[str, int] = {}
+
+    def subscribe(self, namespace: str, callback):
+        """
+        Вызывать callback() при сбросе неймспейса - в этом процессе или в любом другом.
+        """
+        self._subscribers.setdefault(namespace, []).append(callback)
+
+    async def start(self, redis):
+        self._redis = redis
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def _get_redis(self):
+        # вне API процесса (celery, скрипты) кеш не стартует, но сбрасывать его нужно
+        if self._redis is None:
+            self._redis = aioredis.from_url(REDIS_URL, encoding="utf8", decode_responses=True)
+        return self._redis
+
+    async def _read(self, key: str, shared: bool):
+        entry = self._local.get(key)
+        if entry is not None:
+            return entry, "local"
+        if shared and self._redis is not None:
+            raw = await self._redis.get(key)
+            if raw is not None:
+                entry = json.loads(raw)
+                self._local[key] = entry
+                return entry, "redis"
+        return None, None
+
+    async def _shared_generation(self, namespace: str) -> str:
+        return await self._redis.get(f"{GENERATION_PREFIX}:{namespace}") or "0"
+
+    async def _write(self, namespace: str, key: str, value, ttl: int, stale_ttl: int, shared: bool,
+                     generation: int, shared_generation: str | None):
+        if self._generations.get(namespace, 0) != generation:
+            cache_requests_total.labels(namespace, "discarded").inc()
+            return
+        now = time.time()
+        entry = {"value": value, "fresh_until": now + ttl, "stale_until": now + ttl + stale_ttl}
+        self._local[key] = entry
+        if shared_generation is not None:
+            written = await self._redis.eval(WRITE_IF_GENERATION, 2, key, f"{GENERATION_PREFIX}:{namespace}",
+                                             json.dumps(entry), ttl + stale_ttl, shared_generation)
+            if not written:
+                # неймспейс сбросили в другом процессе, сообщение о сбросе ещё в пути
+                self._local.pop(key, None)
+                cache_requests_total.labels(namespace, "discarded").inc()
+
+    async def _compute(self, namespace: str, key: str, compute, ttl: int, stale_ttl: int, shared: bool):
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            generation = self._generations.get(namespace, 0)
+            shared_generation = None
+            if shared and self._redis is not None:
+                shared_generation = await self._shared_generation(namespace)
+            start = time.perf_counter()
+            value = jsonable_encoder(await compute())
+            cache_compute_seconds.labels(namespace).observe(time.perf_counter() - start)
+            await self._write(namespace, key, value, ttl, stale_ttl, shared, generation, shared_generation)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # исключение уже отдано вызывающему, ждущие получат его через future
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_compute(self, namespace: str, key_parts: tuple, compute,
+                             ttl: int, stale_ttl: int = 0, shared: bool = True):
+        key = ":".join([CACHE_PREFIX, namespace, *map(str, key_parts)])
+        entry, tier = await self._read(key, shared)
+        now = time.time()
+
+        if entry is not None and now < entry["fresh_until"]:
+            cache_requests_total.labels(namespace, f"hit_{tier}").inc()
+            return entry["value"]
+
+        if entry is not None and now < entry["stale_until"]:
+            cache_requests_total.labels(namespace, "stale").inc()
+            if key not in self._inflight:
+                task = asyncio.create_task(self._compute(namespace, key, compute, ttl, stale_ttl, shared))
+                task.add_done_callback(_log_refresh_error)
+            return entry["value"]
+
+        cache_requests_total.labels(namespace, "miss").inc()
+        return await self._compute(namespace, key, compute, ttl, stale_ttl, shared)
+
+    def _drop_local(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        prefix = f"{CACHE_PREFIX}:{namespace}:"
+        for key in [key for key in list(self._local.keys()) if key.startswith(prefix)]:
+            self._local.pop(key, None)
+        for callback in self._subscribers.get(namespace, []):
+            callback()
+
+    async def invalidate(self, *namespaces: str):
+        redis = self._get_redis()
+        for namespace in namespaces:
+            self._drop_local(namespace)
+            try:
+                # сначала поколение: запись, начатая до сброса, после этого не пройдёт
+                await redis.incr(f"{GENERATION_PREFIX}:{namespace}")
+                keys = [key async for key in redis.scan_iter(match=f"{CACHE_PREFIX}:{namespace}:*")]
+                if keys:
+                    await redis.delete(*keys)
+                await redis.publish(INVALIDATE_CHANNEL, namespace)
+            except aioredis.RedisError as e:
+                logger.error(f"response cache invalidation failed for {namespace}: {e}")
+
+    async def _listen(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._drop_local(message["data"])
+        except asyncio.CancelledError:
+            await pubsub.unsubscribe(INVALIDATE_CHANNEL)
+            raise
+        except Exception as e:
+            logger.error(f"response cache invalidation listener stopped: {e}")
+
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"background cache refresh failed: {task.exception()}")
+
+
+response_cache = ResponseCache()
+
+
+def cached(namespace, key_builder, ttl: int = 30, stale_ttl: int = 0, shared: bool = True):
+    """
+    Кеширование ответа эндпоинта.
+    :param namespace: строка или функция от аргументов эндпоинта (например, неймспейс на пользователя)
+    :param key_builder: функция от аргументов эндпоинта, возвращает кортеж частей ключа;
+        сессия и прочие зависимости в ключ не попадают
+    :param shared: False - только локальный уровень, для данных, которые нельзя класть в Redis
+    :param stale_ttl: только для эндпоинтов, которые не ходят в БД через сессию запроса -
+        фоновый пересчёт идёт уже после того, как сессия закрыта
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            ns = namespace(**kwargs) if callable(namespace) else namespace
+            return await response_cache.get_or_compute(
+                ns, tuple(key_builder(**kwargs)), lambda: func(*args, **kwargs),
+                ttl=ttl, stale_ttl=stale_ttl, shared=shared,
+            )
+
+        return wrapper
+
+    return decorator
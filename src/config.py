@@ -12,8 +12,76 @@ DB_NAME = os.environ.get("DB_NAME")
 SECRET_AUTH = os.environ.get("SECRET_AUTH")
 
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
-SMTP_HOST = "smtp.gmail.com"
-SMTP_PORT = 465
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 465))
 SMTP_USER = os.environ.get("SMTP_USER")
+# для локального отладочного сервера (python -m aiosmtpd -n) выставить SMTP_USE_TLS=0
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "1") == "1"
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 2))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_MAX_TRIES = int(os.environ.get("SMTP_MAX_TRIES", 4))
 
 TINKOFF_API_KEY = os.environ.get("TINKOFF_API_KEY")
+TINKOFF_POOL_MAX_CONCURRENCY = int(os.environ.get("TINKOFF_POOL_MAX_CONCURRENCY", 10))
+TINKOFF_POOL_IDLE_TIMEOUT = int(os.environ.get("TINKOFF_POOL_IDLE_TIMEOUT", 600))
+
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.5))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", 0.25))
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+# за pgbouncer в transaction mode выставить 0
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+# реплика для read-only эндпоинтов, если не задана - всё идёт в основную БД
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+
+AUTH_LIFETIME_SECONDS = 3600
+AUTH_USER_CACHE_SIZE = int(os.environ.get("AUTH_USER_CACHE_SIZE", 10_000))
+AUTH_USER_CACHE_TTL = min(int(os.environ.get("AUTH_USER_CACHE_TTL", 60)), AUTH_LIFETIME_SECONDS)
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost")
+RESPONSE_CACHE_LOCAL_SIZE = int(os.environ.get("RESPONSE_CACHE_LOCAL_SIZE", 10_000))
+
+# обновление рыночных данных по расписанию (celery beat), интервалы в секундах
+FIGI_REFRESH_INTERVAL = int(os.environ.get("FIGI_REFRESH_INTERVAL", 24 * 3600))
+FUNDAMENTALS_REFRESH_INTERVAL = int(os.environ.get("FUNDAMENTALS_REFRESH_INTERVAL", 3600))
+FUNDAMENTALS_STALE_AFTER = int(os.environ.get("FUNDAMENTALS_STALE_AFTER", 24 * 3600))
+FUNDAMENTALS_RETENTION = int(os.environ.get("FUNDAMENTALS_RETENTION", 7 * 24 * 3600))
+FUNDAMENTALS_SHARDS = int(os.environ.get("FUNDAMENTALS_SHARDS", 1))
+CANDLES_REFRESH_INTERVAL = int(os.environ.get("CANDLES_REFRESH_INTERVAL", 24 * 3600))
+CANDLES_HOUR_REFRESH_INTERVAL = int(os.environ.get("CANDLES_HOUR_REFRESH_INTERVAL", 3600))
+
+# живой портфель: подписка закрывается, если её не читали idle_timeout секунд;
+# LIVE_PORTFOLIO_SOURCE=fake - локальный поток цен без брокера
+LIVE_PORTFOLIO_IDLE_TIMEOUT = int(os.environ.get("LIVE_PORTFOLIO_IDLE_TIMEOUT", 300))
+LIVE_PORTFOLIO_SOURCE = os.environ.get("LIVE_PORTFOLIO_SOURCE", "broker")
+
+# ключ Fernet для токенов брокера в user.broker_tokens (Fernet.generate_key()). Без него ключ
+# выводится из SECRET_AUTH: тогда смена SECRET_AUTH делает сохранённые токены нечитаемыми,
+# и пользователям придётся добавить их заново. Для продакшена задавайте отдельный ключ.
+BROKER_TOKEN_KEY = os.environ.get("BROKER_TOKEN_KEY")
+# одновременных get_portfolio при сборе портфеля по всем счетам и токенам
+PORTFOLIO_CONCURRENCY = int(os.environ.get("PORTFOLIO_CONCURRENCY", 8))
+# список счетов токена меняется редко, держим его в памяти
+BROKER_ACCOUNTS_TTL = int(os.environ.get("BROKER_ACCOUNTS_TTL", 3600))
+
+# поиск инструментов: memory - индекс в каждом процессе, postgres - через pg_trgm
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "memory")
+# фундаменталы, которые /fonds/lookup взял у брокера (и отсутствие их у брокера), сек
+LOOKUP_FUNDAMENTALS_TTL = int(os.environ.get("LOOKUP_FUNDAMENTALS_TTL", 3600))
+
+# вызовы брокера (fonds.resilience): попыток на вызов, после скольких сбоев подряд
+# и на сколько секунд circuit breaker перестаёт пускать запросы
+BROKER_MAX_TRIES = int(os.environ.get("BROKER_MAX_TRIES", 4))
+BROKER_BREAKER_THRESHOLD = int(os.environ.get("BROKER_BREAKER_THRESHOLD", 5))
+BROKER_BREAKER_RESET = int(os.environ.get("BROKER_BREAKER_RESET", 30))
+
+# бюджет холодного старта API процесса для python -m src.startup --budget, мс
+STARTUP_BUDGET_MS = int(os.environ.get("STARTUP_BUDGET_MS", 3000))
+
+# TTL блокировок задач celery, сек; пока задача идёт, блокировка продлевается каждую треть TTL
+TASK_LOCK_TIMEOUT = int(os.environ.get("TASK_LOCK_TIMEOUT", 300))
@@ -1,34 +1,115 @@
-from asyncio import current_task
+import time
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_scoped_session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncEngine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
 
 from src.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from src.config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_REPLICA_HOST, DB_REPLICA_PORT
+)
+from src.monitoring import (
+    current_route, db_pool_checkout_wait_seconds, db_pool_in_use,
+    db_queries_total, db_query_duration_seconds
+)
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DATABASE_REPLICA_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
 Base = declarative_base()  # что-то типо метаданных для таблиц
 
 
-engine_async = create_async_engine(DATABASE_URL)
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который меряет, сколько запрос ждал свободное соединение.
+    """
+
+    _engine_name = "default"
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._engine_name = self._engine_name
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait_seconds.labels(self._engine_name).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    """
+    Число и время запросов в разрезе эндпоинта (см. current_route).
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        route = current_route.get()
+        db_queries_total.labels(name, route).inc()
+        db_query_duration_seconds.labels(name, route).observe(time.perf_counter() - conn.info["query_started"].pop())
+
+    if isinstance(sync_engine.pool, InstrumentedQueuePool):
+        sync_engine.pool._engine_name = name
+        db_pool_in_use.labels(name).set_function(lambda: sync_engine.pool.checkedout())
+
+
+def create_pooled_engine(url: str, name: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+    instrument_engine(engine, name)
+    return engine
+
+
+engine_async = create_pooled_engine(DATABASE_URL, "primary")
 async_session_maker = sessionmaker(engine_async, class_=AsyncSession, expire_on_commit=False)
 
+engine_replica = create_pooled_engine(DATABASE_REPLICA_URL, "replica") if DB_REPLICA_HOST else engine_async
+replica_session_maker = sessionmaker(engine_replica, class_=AsyncSession, expire_on_commit=False)
+
+# celery воркеры держат свой event loop на поток, asyncpg соединения нельзя
+# переносить между loop'ами, поэтому без пула
+engine_worker = create_async_engine(DATABASE_URL, poolclass=NullPool)
+instrument_engine(engine_worker, "worker")
+worker_session_maker = sessionmaker(engine_worker, class_=AsyncSession, expire_on_commit=False)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
 
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия для эндпоинтов, которые только читают: уходит на реплику, если она настроена.
+    """
+    async with replica_session_maker() as session:
+        yield session
+
+
 @asynccontextmanager
-async def scoped_session():
-    scoped_factory = async_scoped_session(
-        async_session_maker,
-        scopefunc=current_task,
-    )
-    try:
-        async with scoped_factory() as s:
-            yield s
-    finally:
-        await scoped_factory.remove()
+async def scoped_session(read_only: bool = False):
+    session_maker = replica_session_maker if read_only else async_session_maker
+    async with session_maker() as s:
+        yield s
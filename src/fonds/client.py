@@ -0,0 +1,181 @@
+import asyncio
+import importlib
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+from src.config import TINKOFF_API_KEY, TINKOFF_POOL_MAX_CONCURRENCY, TINKOFF_POOL_IDLE_TIMEOUT
+
+if TYPE_CHECKING:
+    from tinkoff.invest import AsyncClient
+
+# держим канал живым между запросами, чтобы не платить за TLS handshake заново
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30_000),
+    ("grpc.keepalive_timeout_ms", 10_000),
+    ("grpc.keepalive_permit_without_calls", 1),
+]
+
+
+@dataclass
+class PooledClient:
+    client: "AsyncClient"
+    services: object
+    semaphore: asyncio.Semaphore
+    # выданные вызовы, включая ждущие семафор: пока refs > 0, канал не закрывается
+    refs: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class LoopClients:
+    """
+    Клиенты одного event loop: gRPC каналы, lock и evictor привязаны к loop,
+    в котором созданы (в API это один loop, у celery - свой на каждый поток).
+    """
+    clients: dict[str, PooledClient] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    evictor: asyncio.Task | None = None
+
+
+class ClientPool:
+    """
+    Пул долгоживущих AsyncClient, по одному gRPC каналу на API токен в каждом event loop.
+    Ограничивает число одновременных запросов на токен и закрывает
+    каналы, которые простаивали дольше idle_timeout.
+    """
+
+    def __init__(self, max_concurrency: int = TINKOFF_POOL_MAX_CONCURRENCY,
+                 idle_timeout: float = TINKOFF_POOL_IDLE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self._loops: WeakKeyDictionary[asyncio.AbstractEventLoop, LoopClients] = WeakKeyDictionary()
+        self._preload: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _local(self) -> LoopClients:
+        loop = asyncio.get_running_loop()
+        local = self._loops.get(loop)
+        if local is None:
+            local = self._loops[loop] = LoopClients()
+        return local
+
+    async def start(self):
+        local = self._local()
+        if local.evictor is None:
+            local.evictor = asyncio.create_task(self._evict_loop(local))
+        if self._preload is None:
+            # SDK брокера импортируется сотни миллисекунд: не держим им старт процесса,
+            # а грузим в фоне, чтобы первый запрос к брокеру его уже не ждал
+            self._preload = asyncio.create_task(asyncio.to_thread(importlib.import_module, "tinkoff.invest"))
+
+    async def close(self):
+        """
+        Закрыть клиентов текущего event loop.
+        """
+        local = self._local()
+        if local.evictor is not None:
+            local.evictor.cancel()
+            local.evictor = None
+        async with local.lock:
+            for token in list(local.clients):
+                await self._close_client(local, token)
+
+    @asynccontextmanager
+    async def client(self, token: str | None = None):
+        """
+        Выдать сервисы клиента для токена (по умолчанию TINKOFF_API_KEY).
+        Использование: async with client_pool.client(token) as client: ...
+        """
+        token = token or TINKOFF_API_KEY
+        pooled = await self._acquire(token)
+        try:
+            async with pooled.semaphore:
+                yield pooled.services
+        finally:
+            pooled.refs -= 1
+            pooled.last_used = time.monotonic()
+
+    def stats(self) -> dict:
+        clients = [pooled for local in list(self._loops.values()) for pooled in local.clients.values()]
+        return {
+            "clients": len(clients),
+            "in_use": sum(pooled.refs for pooled in clients),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    async def _open(self, token: str) -> tuple["AsyncClient", object]:
+        from tinkoff.invest import AsyncClient
+
+        client = AsyncClient(token, options=CHANNEL_OPTIONS)
+        return client, await client.__aenter__()
+
+    async def _acquire(self, token: str) -> PooledClient:
+        """
+        Клиент токена, уже учтённый в refs: evictor не закроет его,
+        пока вызов ждёт семафор.
+        """
+        local = self._local()
+        async with local.lock:
+            pooled = local.clients.get(token)
+            if pooled is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                client, services = await self._open(token)
+                pooled = PooledClient(client, services, asyncio.Semaphore(self.max_concurrency))
+                local.clients[token] = pooled
+            pooled.refs += 1
+            return pooled
+
+    async def _close_client(self, local: LoopClients, token: str):
+        pooled = local.clients.pop(token, None)
+        if pooled is None:
+            return
+        try:
+            await pooled.client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.error(f"failed to close broker client: {e}")
+
+    async def evict_idle(self, local: LoopClients | None = None):
+        """
+        Закрыть каналы без выданных вызовов, простаивавшие дольше idle_timeout.
+        """
+        local = local or self._local()
+        now = time.monotonic()
+        async with local.lock:
+            idle = [
+                token for token, pooled in local.clients.items()
+                if not pooled.refs and now - pooled.last_used > self.idle_timeout
+            ]
+            for token in idle:
+                await self._close_client(local, token)
+                self.evictions += 1
+
+    async def _evict_loop(self, local: LoopClients):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            await self.evict_idle(local)
+
+
+@asynccontextmanager
+async def stream_client(token: str | None = None):
+    """
+    Отдельный канал для долгой подписки на стрим: стрим не занимает слот
+    семафора client_pool и не мешает обычным запросам по тому же токену.
+    Использование: async with stream_client(token) as client: ...
+    """
+    from tinkoff.invest import AsyncClient
+
+    async with AsyncClient(token or TINKOFF_API_KEY, options=CHANNEL_OPTIONS) as services:
+        yield services
+
+
+client_pool = ClientPool()
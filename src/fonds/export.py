@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import select
+
+from src.database import replica_session_maker
+from src.fonds.models import figi as figi_table
+from src.fonds.models import fundamental as fundamental_table
+
+EXPORT_CHUNK_ROWS = 1000
+
+
+class ExportFormat(Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    arrow = "arrow"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+}
+
+
+def export_query():
+    """
+    Вся вселенная figi x fundamental; инструменты без фундаменталов тоже попадают.
+    """
+    metrics = [column for column in fundamental_table.c if column.name != "asset_uid"]
+    return (select(figi_table, *metrics).select_from(figi_table).
+            outerjoin(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
+            order_by(figi_table.c.uid))
+
+
+async def stream_partitions(chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Строки пачками через серверный курсор: в памяти не больше одной пачки.
+    Сессия своя - сессия запроса закрывается до того, как ответ дочитан.
+    """
+    async with replica_session_maker() as session:
+        result = await session.stream(export_query().execution_options(yield_per=chunk_rows))
+        async for partition in result.mappings().partitions(chunk_rows):
+            yield partition
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+async def ndjson_chunks(partitions):
+    async for partition in partitions:
+        yield "".join(json.dumps(dict(row), default=_json_default, ensure_ascii=False) + "\n"
+                      for row in partition).encode()
+
+
+async def csv_chunks(partitions):
+    header_written = False
+    async for partition in partitions:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(partition[0].keys())
+            header_written = True
+        writer.writerows(row.values() for row in partition)
+        yield buffer.getvalue().encode()
+
+
+async def arrow_chunks(partitions):
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [(column.name, pa.string()) for column in figi_table.c
+         if column.name not in ("api_trade_available_flag", "buy_available_flag", "sell_available_flag")] +
+        [(name, pa.bool_()) for name in ("api_trade_available_flag", "buy_available_flag", "sell_available_flag")] +
+        [(column.name, pa.float64()) for column in fundamental_table.c
+         if column.name not in ("asset_uid", "update_time")] +
+        [("update_time", pa.timestamp("us", tz="UTC"))]
+    )
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    async for partition in partitions:
+        columns = {name: [row[name] for row in partition] for name in schema.names}
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        # Z_SYNC_FLUSH, чтобы клиент получал данные по мере готовности
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_stream(export_format: ExportFormat, gzip: bool):
+    serializers = {
+        ExportFormat.ndjson: ndjson_chunks,
+        ExportFormat.csv: csv_chunks,
+        ExportFormat.arrow: arrow_chunks,
+    }
+    chunks = serializers[export_format](stream_partitions())
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,138 @@
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import select, func, text, any_, bindparam, String, literal_column
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from src.database import scoped_session
+from src.fonds.models import figi as figi_table
+from src.fonds.models import fundamental as fundamental_table
+from src.fonds.models import fundamental_history as history_table
+
+HISTORY_METRICS = ['pe_ratio_ttm', 'price_to_sales_ttm', 'price_to_book_ttm',
+                   'ev_to_ebitda_mrq', 'roe', 'total_debt_to_equity_mrq']
+HISTORY_BUCKETS = ("day", "week", "month", "quarter", "year")
+SNAPSHOT_CHUNK_ROWS = 10_000
+
+
+def _month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+async def ensure_history_partitions(session, moment: datetime):
+    """
+    Партиции fundamental_history на месяц moment и на следующий.
+    """
+    month = _month_start(moment)
+    for _ in range(2):
+        next_month = _next_month(month)
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS fundamental_history_y{month:%Y}m{month:%m} "
+            f"PARTITION OF fundamental_history "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+        month = next_month
+
+
+async def changed_rows(session, rows: list[dict]) -> list[dict]:
+    """
+    Строки, у которых показатели отличаются от текущих в fundamental.
+    Вызывать до upsert в fundamental.
+    """
+    if not rows:
+        return []
+    query = select(fundamental_table).where(
+        fundamental_table.c.asset_uid == any_(bindparam("uids", [row["asset_uid"] for row in rows],
+                                                        type_=ARRAY(String)))
+    )
+    current = {row["asset_uid"]: row for row in (await session.execute(query)).mappings().all()}
+    return [
+        row for row in rows
+        if row["asset_uid"] not in current or
+        any(row[metric] != current[row["asset_uid"]][metric] for metric in HISTORY_METRICS)
+    ]
+
+
+async def write_history(session, rows: list[dict], batch_bounds):
+    """
+    Дописать изменившиеся показатели в fundamental_history.
+    :param batch_bounds: границы батчей из utils.batch
+    """
+    if not rows:
+        return
+    await ensure_history_partitions(session, rows[0]["update_time"])
+    history_rows = [
+        {"asset_uid": row["asset_uid"], "recorded_at": row["update_time"],
+         **{metric: row[metric] for metric in HISTORY_METRICS}}
+        for row in rows
+    ]
+    for start, end in batch_bounds:
+        stmt = insert(history_table).values(history_rows[start:end]).on_conflict_do_nothing()
+        await session.execute(stmt)
+
+
+async def get_history(metric: str, start: datetime, end: datetime, bucket: str,
+                      asset_uid: str | None = None, sector: str | None = None) -> list[dict]:
+    """
+    Ряд показателя, сжатый до bucket. Для asset_uid - среднее за интервал,
+    для сектора - медиана по всем бумагам сектора за интервал.
+    """
+    if bucket not in HISTORY_BUCKETS:
+        raise ValueError(f"unknown bucket: {bucket}")
+    # единица - литерал, чтобы выражение в SELECT и GROUP BY совпадало
+    bucket_column = func.date_trunc(literal_column(f"'{bucket}'"), history_table.c.recorded_at).label("bucket")
+    column = history_table.c[metric]
+
+    if asset_uid is not None:
+        value = func.avg(column)
+        condition = history_table.c.asset_uid == asset_uid
+    else:
+        value = literal_column(f"percentile_cont(0.5) WITHIN GROUP (ORDER BY fundamental_history.{metric})")
+        condition = history_table.c.asset_uid.in_(
+            select(figi_table.c.asset_uid).where(figi_table.c.sector == sector)
+        )
+
+    query = (select(bucket_column, value.label("value")).
+             where(condition &
+                   (history_table.c.recorded_at >= start) &
+                   (history_table.c.recorded_at < end) &
+                   column.is_not(None)).
+             group_by(bucket_column).
+             order_by(bucket_column))
+
+    async with scoped_session(read_only=True) as s:
+        result = await s.execute(query)
+        return [dict(row) for row in result.mappings().all()]
+
+
+async def write_history_snapshot(path: str, since: datetime | None = None):
+    """
+    Снимок истории в Parquet (нужен pyarrow). Читается серверным курсором,
+    пишется по группам строк.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [("asset_uid", pa.string()), ("recorded_at", pa.timestamp("us", tz="UTC"))] +
+        [(metric, pa.float64()) for metric in HISTORY_METRICS]
+    )
+    query = select(history_table).order_by(history_table.c.recorded_at)
+    if since is not None:
+        query = query.where(history_table.c.recorded_at >= since)
+
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        async with scoped_session(read_only=True) as s:
+            result = await s.stream(query.execution_options(yield_per=SNAPSHOT_CHUNK_ROWS))
+            async for partition in result.mappings().partitions(SNAPSHOT_CHUNK_ROWS):
+                columns = {name: [row[name] for row in partition] for name in schema.names}
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+
+if __name__ == "__main__":
+    asyncio.run(write_history_snapshot(sys.argv[1] if len(sys.argv) > 1 else "fundamental_history.parquet"))
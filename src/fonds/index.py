@@ -0,0 +1,117 @@
+import asyncio
+
+from sqlalchemy import select, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.database import scoped_session
+from src.fonds.models import figi as figi_table
+
+
+def instruments_by_figi_query(figis: list[str]):
+    return select(figi_table).where(
+        figi_table.c.figi == any_(bindparam("figis", list(set(figis)), type_=ARRAY(String)))
+    )
+
+
+async def get_instruments_by_figi(figis: list[str]) -> dict[str, dict]:
+    """
+    Все инструменты по списку figi одним запросом WHERE figi = ANY(...).
+    :return: {figi: строка таблицы figi}
+    """
+    if not figis:
+        return {}
+    async with scoped_session(read_only=True) as s:
+        result = await s.execute(instruments_by_figi_query(figis))
+        return {row["figi"]: dict(row) for row in result.mappings().all()}
+
+
+class InstrumentIndex:
+    """
+    Локальный для процесса индекс таблицы figi по figi, ticker, uid,
+    asset_uid и lower(name). Загружается при первом обращении и
+    перестраивается целиком после figi_updater (по событию "instruments").
+    """
+
+    def __init__(self):
+        self._by_figi: dict[str, dict] = {}
+        self._by_uid: dict[str, dict] = {}
+        self._by_ticker: dict[str, list[dict]] = {}
+        self._by_asset_uid: dict[str, list[dict]] = {}
+        self._by_name: dict[str, list[dict]] = {}
+        self.rows: list[dict] = []
+        # растёт при каждой перезагрузке, по нему перестраивается поисковый индекс
+        self.generation = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self._load()
+
+    def invalidate(self):
+        """
+        Перечитать индекс при следующем обращении.
+        """
+        self._loaded = False
+
+    async def refresh(self):
+        async with self._lock:
+            await self._load(read_only=False)
+
+    async def _load(self, read_only: bool = True):
+        # сразу после figi_updater читаем с основной БД, реплика может отставать
+        async with scoped_session(read_only=read_only) as s:
+            result = await s.execute(select(figi_table))
+            rows = [dict(row) for row in result.mappings().all()]
+
+        by_figi, by_uid, by_ticker, by_asset_uid, by_name = {}, {}, {}, {}, {}
+        for row in rows:
+            by_figi[row["figi"]] = row
+            by_uid[row["uid"]] = row
+            by_ticker.setdefault(row["ticker"], []).append(row)
+            by_asset_uid.setdefault(row["asset_uid"], []).append(row)
+            by_name.setdefault((row["name"] or "").lower(), []).append(row)
+
+        # подменяем словари целиком, чтобы читатели не видели полупостроенный индекс
+        self._by_figi, self._by_uid, self._by_ticker = by_figi, by_uid, by_ticker
+        self._by_asset_uid, self._by_name = by_asset_uid, by_name
+        self.rows = rows
+        self.generation += 1
+        self._loaded = True
+
+    async def resolve_figis(self, figis: list[str]) -> dict[str, dict]:
+        """
+        figi -> инструмент; отсутствующие в индексе добираются одним запросом в БД.
+        """
+        await self.ensure_loaded()
+        found = {figi: self._by_figi[figi] for figi in figis if figi in self._by_figi}
+        missing = [figi for figi in figis if figi not in found]
+        if missing:
+            found.update(await get_instruments_by_figi(missing))
+        return found
+
+    async def by_figi(self, figi: str) -> dict | None:
+        await self.ensure_loaded()
+        return self._by_figi.get(figi)
+
+    async def by_uid(self, uid: str) -> dict | None:
+        await self.ensure_loaded()
+        return self._by_uid.get(uid)
+
+    async def by_ticker(self, ticker: str) -> list[dict]:
+        await self.ensure_loaded()
+        return self._by_ticker.get(ticker.upper(), [])
+
+    async def by_asset_uid(self, asset_uid: str) -> list[dict]:
+        await self.ensure_loaded()
+        return self._by_asset_uid.get(asset_uid, [])
+
+    async def by_name(self, name: str) -> list[dict]:
+        await self.ensure_loaded()
+        return self._by_name.get(name.lower(), [])
+
+
+instrument_index = InstrumentIndex()
@@ -0,0 +1,177 @@
+import numpy as np
+
+RSI_PERIOD = 14
+SMA_PERIOD = 20
+EMA_PERIOD = 20
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+BOLLINGER_PERIOD = 20
+BOLLINGER_WIDTH = 2.0
+
+
+class EmaState:
+    """
+    EMA по строкам-инструментам. Первое значение - SMA за period (как в TA-Lib),
+    до этого nan. alpha=1/period даёт сглаживание Уайлдера для RSI.
+    """
+
+    def __init__(self, period: int, alpha: float | None = None):
+        self.period = period
+        self.alpha = alpha if alpha is not None else 2 / (period + 1)
+        self.value = np.empty(0)
+        self.count = np.empty(0, dtype=np.int64)
+        self._sum = np.empty(0)
+
+    def grow(self, k: int):
+        self.value = np.concatenate([self.value, np.full(k, np.nan)])
+        self.count = np.concatenate([self.count, np.zeros(k, dtype=np.int64)])
+        self._sum = np.concatenate([self._sum, np.zeros(k)])
+
+    def update(self, x: np.ndarray, mask: np.ndarray):
+        self.count[mask] += 1
+        warming = mask & (self.count <= self.period)
+        self._sum[warming] += x[warming]
+        seeded = warming & (self.count == self.period)
+        self.value[seeded] = self._sum[seeded] / self.period
+        active = mask & (self.count > self.period)
+        self.value[active] += self.alpha * (x[active] - self.value[active])
+
+
+class WindowState:
+    """
+    Последние period значений каждого инструмента в кольцевом буфере.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.buffer = np.empty((0, period))
+        self.position = np.empty(0, dtype=np.int64)
+        self.count = np.empty(0, dtype=np.int64)
+
+    def grow(self, k: int):
+        self.buffer = np.concatenate([self.buffer, np.zeros((k, self.period))])
+        self.position = np.concatenate([self.position, np.zeros(k, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(k, dtype=np.int64)])
+
+    def update(self, x: np.ndarray, mask: np.ndarray):
+        rows = np.flatnonzero(mask)
+        self.buffer[rows, self.position[rows]] = x[rows]
+        self.position[rows] = (self.position[rows] + 1) % self.period
+        self.count[rows] += 1
+
+    def mean(self, rows: np.ndarray) -> np.ndarray:
+        result = self.buffer[rows].mean(axis=1)
+        result[self.count[rows] < self.period] = np.nan
+        return result
+
+    def std(self, rows: np.ndarray) -> np.ndarray:
+        result = self.buffer[rows].std(axis=1)
+        result[self.count[rows] < self.period] = np.nan
+        return result
+
+
+class IndicatorBook:
+    """
+    Состояние индикаторов сразу для многих инструментов (строк).
+    Каждая новая свеча - один шаг O(1) на инструмент, окно заново не пересчитывается;
+    полный расчёт - те же шаги по всей истории.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.last_close = np.empty(0)
+        self.avg_gain = EmaState(RSI_PERIOD, alpha=1 / RSI_PERIOD)
+        self.avg_loss = EmaState(RSI_PERIOD, alpha=1 / RSI_PERIOD)
+        self.ema = EmaState(EMA_PERIOD)
+        self.macd_fast = EmaState(MACD_FAST)
+        self.macd_slow = EmaState(MACD_SLOW)
+        self.macd_signal = EmaState(MACD_SIGNAL)
+        self.sma = WindowState(SMA_PERIOD)
+        self.bollinger = WindowState(BOLLINGER_PERIOD)
+
+    def _states(self):
+        return (self.avg_gain, self.avg_loss, self.ema, self.macd_fast, self.macd_slow,
+                self.macd_signal, self.sma, self.bollinger)
+
+    def grow(self, k: int) -> np.ndarray:
+        """
+        Добавить k пустых строк.
+        :return: индексы новых строк
+        """
+        self.last_close = np.concatenate([self.last_close, np.full(k, np.nan)])
+        for state in self._states():
+            state.grow(k)
+        self.size += k
+        return np.arange(self.size - k, self.size)
+
+    def update(self, x: np.ndarray, mask: np.ndarray):
+        """
+        Один шаг: x - цены закрытия по всем строкам, mask - у каких строк есть новая свеча.
+        """
+        with np.errstate(invalid="ignore"):
+            has_previous = mask & ~np.isnan(self.last_close)
+            delta = x - self.last_close
+            self.avg_gain.update(np.where(delta > 0, delta, 0.0), has_previous)
+            self.avg_loss.update(np.where(delta < 0, -delta, 0.0), has_previous)
+
+            self.ema.update(x, mask)
+            self.macd_fast.update(x, mask)
+            self.macd_slow.update(x, mask)
+            macd = self.macd_fast.value - self.macd_slow.value
+            self.macd_signal.update(macd, mask & ~np.isnan(macd))
+
+            self.sma.update(x, mask)
+            self.bollinger.update(x, mask)
+        self.last_close[mask] = x[mask]
+
+    def feed(self, rows: np.ndarray, closes: np.ndarray):
+        """
+        Прогнать пачку свечей. closes[i] - новые цены строки rows[i] по порядку,
+        хвост короче самой длинной серии заполнен nan.
+        """
+        for step in range(closes.shape[1]):
+            column = closes[:, step]
+            valid = ~np.isnan(column)
+            x = np.full(self.size, np.nan)
+            x[rows[valid]] = column[valid]
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows[valid]] = True
+            self.update(x, mask)
+
+    def snapshot(self, rows: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Текущие значения индикаторов по строкам rows, nan - не хватает истории.
+        """
+        gain = self.avg_gain.value[rows]
+        loss = self.avg_loss.value[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+        rsi[np.isnan(gain) | np.isnan(loss)] = np.nan
+
+        macd = self.macd_fast.value[rows] - self.macd_slow.value[rows]
+        signal = self.macd_signal.value[rows]
+        middle = self.bollinger.mean(rows)
+        deviation = self.bollinger.std(rows)
+        return {
+            "close": self.last_close[rows],
+            "rsi": rsi,
+            "sma": self.sma.mean(rows),
+            "ema": self.ema.value[rows],
+            "macd": macd,
+            "macd_signal": signal,
+            "macd_histogram": macd - signal,
+            "bollinger_upper": middle + BOLLINGER_WIDTH * deviation,
+            "bollinger_middle": middle,
+            "bollinger_lower": middle - BOLLINGER_WIDTH * deviation,
+        }
+
+
+def compute_indicators(closes: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Полный расчёт по матрице цен закрытия (строки - инструменты, хвост nan).
+    """
+    book = IndicatorBook()
+    rows = book.grow(closes.shape[0])
+    book.feed(rows, closes)
+    return book.snapshot(rows)
@@ -0,0 +1,302 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from loguru import logger
+
+from src.config import LIVE_PORTFOLIO_IDLE_TIMEOUT, LIVE_PORTFOLIO_SOURCE
+from src.fonds.client import stream_client
+from src.fonds.index import instrument_index
+from src.fonds.money import quotation_to_nano, nano_to_float, multiply_nano, sum_nano
+from src.fonds.utils import fetch_portfolios, build_positions
+
+LIVE_PORTFOLIO_LOAD_TIMEOUT = 30
+RECONNECT_MAX_DELAY = 60
+
+
+class BrokerStreams:
+    """
+    Портфель и последние цены из стримов брокера.
+    Каждый стрим идёт по своему каналу, а не через client_pool: подписка
+    длится часами и иначе навсегда заняла бы слот семафора токена.
+    """
+
+    async def load(self, token: str) -> list:
+        return [portfolio for _, portfolio in await fetch_portfolios([token])]
+
+    async def portfolios(self, token: str, account_ids: list[str]):
+        async with stream_client(token) as client:
+            async for response in client.operations_stream.portfolio_stream(accounts=account_ids):
+                if response.portfolio is not None:
+                    yield response.portfolio
+
+    async def last_prices(self, token: str, instrument_uids: list[str]):
+        from tinkoff.invest import LastPriceInstrument
+
+        async with stream_client(token) as client:
+            stream = client.create_market_data_stream()
+            stream.last_price.subscribe([LastPriceInstrument(instrument_id=uid) for uid in instrument_uids])
+            try:
+                async for response in stream:
+                    if response.last_price is not None:
+                        yield response.last_price
+            finally:
+                stream.stop()
+
+
+class FakeStreams:
+    """
+    Локальный источник без брокера: заданный портфель и случайное блуждание цен.
+    Для разработки и тестов (LIVE_PORTFOLIO_SOURCE=fake).
+    :param positions: [(figi, instrument_uid, quantity, price, average_price)]
+    """
+
+    def __init__(self, positions: list[tuple] | None = None, tick_interval: float = 0.5, seed: int | None = None):
+        self.positions = positions or []
+        self.tick_interval = tick_interval
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def _quotation(value: float):
+        units = int(value)
+        return SimpleNamespace(units=units, nano=round((value - units) * 1e9))
+
+    def _portfolio(self):
+        return SimpleNamespace(account_id="fake", positions=[
+            SimpleNamespace(figi=figi, instrument_uid=uid,
+                            quantity=self._quotation(quantity),
+                            current_price=self._quotation(price),
+                            expected_yield=self._quotation((price - average) * quantity))
+            for figi, uid, quantity, price, average in self.positions
+        ])
+
+    async def load(self, token: str) -> list:
+        return [self._portfolio()]
+
+    async def portfolios(self, token: str, account_ids: list[str]):
+        # состав портфеля не меняется
+        await asyncio.Event().wait()
+        yield
+
+    async def last_prices(self, token: str, instrument_uids: list[str]):
+        prices = {uid: price for _, uid, _, price, _ in self.positions if uid in instrument_uids}
+        while prices:
+            await asyncio.sleep(self.tick_interval)
+            uid = self._random.choice(list(prices))
+            prices[uid] = round(max(0.01, prices[uid] * (1 + self._random.gauss(0, 0.002))), 2)
+            yield SimpleNamespace(instrument_uid=uid, price=self._quotation(prices[uid]))
+
+
+class LivePortfolio:
+    """
+    Позиции и цены всех счетов одного токена в памяти. Каждый тик цены меняет
+    total_price позиции и full_active_cost на разницу, без пересчёта портфеля.
+    """
+
+    def __init__(self, token: str, source):
+        self.token = token
+        self.source = source
+        self.positions: dict[str, dict] = {}
+        self.account_ids: list[str] = []
+        self._portfolios: dict[str, object] = {}
+        self.full_active_cost = 0.0
+        self._fixed: dict[str, list[int]] = {}
+        self._cost = 0
+        self.version = 0
+        self.watchers = 0
+        self.last_used = time.monotonic()
+        self.ready = asyncio.Event()
+        self.error: Exception | None = None
+        self._updated = asyncio.Event()
+        self._snapshot = None
+        self._snapshot_version = -1
+        self._task: asyncio.Task | None = None
+        self._prices_task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._prices_task, self._task):
+            if task is not None:
+                task.cancel()
+
+    def _changed(self):
+        self.version += 1
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def _apply_portfolios(self, portfolios: list, replace: bool = False):
+        """
+        Пересборка позиций после get_portfolio (replace - все счета) или
+        сообщения стрима портфеля (один счёт).
+        """
+        if replace:
+            self._portfolios = {}
+        for portfolio in portfolios:
+            self._portfolios[portfolio.account_id] = portfolio
+        raw = [position for portfolio in self._portfolios.values() for position in portfolio.positions]
+        instruments = await instrument_index.resolve_figis([position.figi for position in raw])
+        rows, fixed = build_positions(raw, instruments)
+        positions = {row["uid"]: row for row in rows}
+        # суммы ведём в целых nano, чтобы приращения по тикам не накапливали ошибку float
+        self._fixed = {
+            row["uid"]: [int(fixed["quantity"][index]), int(fixed["price"][index]),
+                         int(fixed["total"][index]), int(fixed["expected_yield"][index])]
+            for index, row in enumerate(rows)
+        }
+        self._cost = sum_nano(fixed["total"])
+
+        resubscribe = positions.keys() != self.positions.keys()
+        self.account_ids = list(self._portfolios)
+        self.positions = positions
+        self.full_active_cost = nano_to_float(self._cost)
+        self._changed()
+        if resubscribe:
+            self._restart_prices()
+
+    def apply_price(self, last_price):
+        position = self.positions.get(last_price.instrument_uid)
+        if position is None:
+            return
+        fixed = self._fixed[last_price.instrument_uid]
+        quantity, old_price, total, profit = fixed
+        price = quotation_to_nano(last_price.price)
+        if price == old_price:
+            return
+        delta = int(multiply_nano(price, quantity)) - total
+        fixed[1:] = [price, total + delta, profit + delta]
+        position["current_stock_price"] = nano_to_float(price)
+        position["total_price"] = nano_to_float(total + delta)
+        position["profit_rub"] = nano_to_float(profit + delta)
+        self._cost += delta
+        self.full_active_cost = nano_to_float(self._cost)
+        self._changed()
+
+    def snapshot(self) -> dict:
+        self.last_used = time.monotonic()
+        if self._snapshot_version != self.version:
+            self._snapshot = {
+                "details": {
+                    "full_active_cost": self.full_active_cost
+                },
+                "positions": [dict(position) for position in self.positions.values()]
+            }
+            self._snapshot_version = self.version
+        return self._snapshot
+
+    async def updates(self):
+        """
+        Снимок портфеля сразу и после каждого изменения. Если тики приходят
+        быстрее, чем клиент читает, промежуточные версии пропускаются.
+        """
+        self.watchers += 1
+        try:
+            while True:
+                updated = self._updated
+                yield self.snapshot()
+                await updated.wait()
+        finally:
+            self.watchers -= 1
+            self.last_used = time.monotonic()
+
+    def _restart_prices(self):
+        if self._prices_task is not None:
+            self._prices_task.cancel()
+        self._prices_task = asyncio.create_task(self._watch_prices(list(self.positions)))
+
+    async def _watch_prices(self, instrument_uids: list[str]):
+        if not instrument_uids:
+            return
+        delay = 1
+        while True:
+            try:
+                async for last_price in self.source.last_prices(self.token, instrument_uids):
+                    self.apply_price(last_price)
+                    delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"last price stream failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _run(self):
+        try:
+            await self._apply_portfolios(await self.source.load(self.token), replace=True)
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self.ready.set()
+
+        delay = 1
+        while True:
+            try:
+                async for portfolio in self.source.portfolios(self.token, self.account_ids):
+                    await self._apply_portfolios([portfolio])
+                    delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"portfolio stream failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            # за время обрыва могли пропустить сделки
+            try:
+                await self._apply_portfolios(await self.source.load(self.token), replace=True)
+            except Exception as e:
+                logger.error(f"portfolio reload failed: {e}")
+
+
+class LivePortfolios:
+    """
+    Подписки на портфели по токенам. Подписка создаётся при первом чтении
+    и закрывается, если её не читали дольше idle_timeout и никто не слушает updates().
+    """
+
+    def __init__(self, source=None, idle_timeout: float = LIVE_PORTFOLIO_IDLE_TIMEOUT):
+        self.source = source or (FakeStreams() if LIVE_PORTFOLIO_SOURCE == "fake" else BrokerStreams())
+        self.idle_timeout = idle_timeout
+        self._portfolios: dict[str, LivePortfolio] = {}
+        self._evictor: asyncio.Task | None = None
+
+    async def start(self):
+        if self._evictor is None:
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    async def close(self):
+        if self._evictor is not None:
+            self._evictor.cancel()
+            self._evictor = None
+        for token in list(self._portfolios):
+            await self._portfolios.pop(token).stop()
+
+    async def get(self, token: str) -> LivePortfolio:
+        portfolio = self._portfolios.get(token)
+        if portfolio is None:
+            portfolio = LivePortfolio(token, self.source)
+            self._portfolios[token] = portfolio
+            portfolio.start()
+        await asyncio.wait_for(portfolio.ready.wait(), LIVE_PORTFOLIO_LOAD_TIMEOUT)
+        if portfolio.error is not None:
+            # следующий запрос попробует подписаться заново
+            if self._portfolios.get(token) is portfolio:
+                del self._portfolios[token]
+            raise portfolio.error
+        return portfolio
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            now = time.monotonic()
+            idle = [
+                token for token, portfolio in self._portfolios.items()
+                if not portfolio.watchers and now - portfolio.last_used > self.idle_timeout
+            ]
+            for token in idle:
+                await self._portfolios.pop(token).stop()
+
+
+live_portfolios = LivePortfolios()
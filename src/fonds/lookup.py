@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+from cachetools import TTLCache
+from sqlalchemy import select, any_, bindparam, String, or_
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.config import LOOKUP_FUNDAMENTALS_TTL
+from src.fonds.client import client_pool
+from src.fonds.models import figi as figi_table
+from src.fonds.models import fundamental as fundamental_table
+from src.fonds.utils import (
+    RefreshStats, fetch_fundamentals_chunk, fundamentals_to_row,
+    FUNDAMENTALS_ASSETS_PER_REQUEST,
+)
+
+METRIC_COLUMNS = [column.name for column in fundamental_table.c if column.name != "asset_uid"]
+
+
+def _any(column, name: str, values: list[str]):
+    return column == any_(bindparam(name, values, type_=ARRAY(String)))
+
+
+# asset_uid -> фундаменталы от брокера или None, если у брокера их нет
+_fetched: TTLCache = TTLCache(maxsize=10_000, ttl=LOOKUP_FUNDAMENTALS_TTL)
+
+
+def is_asset_uid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+async def fetch_missing_fundamentals(asset_uids: list[str]) -> dict[str, dict | None]:
+    """
+    Фундаменталы asset_uid, которых нет в fundamental, у брокера: пачками по
+    FUNDAMENTALS_ASSETS_PER_REQUEST в одном GetAssetFundamentalsRequest, пачки параллельно.
+    В БД не пишутся - их подхватит плановое обновление, а до тех пор ответы
+    (и пустые тоже) держатся в памяти LOOKUP_FUNDAMENTALS_TTL.
+    :param asset_uids: только существующие в figi: брокер отклоняет всю пачку из-за одного неверного
+    :return: asset_uid -> фундаменталы или None
+    """
+    result = {asset_uid: _fetched[asset_uid] for asset_uid in asset_uids if asset_uid in _fetched}
+    asset_uids = [asset_uid for asset_uid in asset_uids if asset_uid not in result]
+    if not asset_uids:
+        return result
+    update_time = datetime.now(timezone.utc)
+    chunks = [asset_uids[x:x + FUNDAMENTALS_ASSETS_PER_REQUEST]
+              for x in range(0, len(asset_uids), FUNDAMENTALS_ASSETS_PER_REQUEST)]
+    # статистика на пачку: пустой ответ после сбоя не должен попасть в кеш как "фундаменталов нет"
+    stats = [RefreshStats(assets=len(chunk)) for chunk in chunks]
+    async with client_pool.client() as client:
+        responses = await asyncio.gather(*(fetch_fundamentals_chunk(client, chunk, chunk_stats)
+                                           for chunk, chunk_stats in zip(chunks, stats)))
+    for chunk, chunk_stats, response in zip(chunks, stats, responses):
+        rows = {row.pop("asset_uid"): row for row in
+                (fundamentals_to_row(statistic, update_time) for statistic in response)}
+        for asset_uid in chunk:
+            row = rows.get(asset_uid)
+            if row is not None or not chunk_stats.failed_chunks:
+                _fetched[asset_uid] = row
+            result[asset_uid] = row
+    return result
+
+
+def lookup_query(tickers: list[str], figis: list[str], asset_uids: list[str]):
+    """
+    figi LEFT JOIN fundamental по любому из списков: BitmapOr индексов
+    ix_figi_ticker, ix_figi_figi и ix_figi_asset_uid.
+    """
+    metrics = [fundamental_table.c[name] for name in METRIC_COLUMNS]
+    return (select(figi_table, *metrics).select_from(figi_table).
+            outerjoin(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
+            where(or_(_any(figi_table.c.ticker, "tickers", tickers),
+                      _any(figi_table.c.figi, "figis", figis),
+                      _any(figi_table.c.asset_uid, "asset_uids", asset_uids))))
+
+
+async def lookup(session, tickers: list[str], figis: list[str], asset_uids: list[str]) -> dict:
+    """
+    Инструменты с фундаменталами сразу по спискам тикеров, figi и asset_uid:
+    один запрос figi LEFT JOIN fundamental с ANY(...) и, если для запрошенных
+    asset_uid фундаменталов нет в БД, один заход к брокеру.
+    Тикеры ищутся без учёта регистра (у брокера они в верхнем), но в ответе
+    ключами остаются в том виде, в каком пришли.
+    :return: словари по каждому идентификатору; не найденные - [] или None
+    """
+    tickers = list(dict.fromkeys(tickers))
+    figis, asset_uids = list(dict.fromkeys(figis)), list(dict.fromkeys(asset_uids))
+    # как прислали и в верхнем регистре: сравнение с колонкой как есть, по индексу ix_figi_ticker
+    ticker_values = list(dict.fromkeys([*tickers, *(ticker.upper() for ticker in tickers)]))
+
+    query = lookup_query(ticker_values, figis, asset_uids)
+    rows = [dict(row) for row in (await session.execute(query)).mappings().all()]
+
+    instruments, fundamentals = [], {}
+    for row in rows:
+        metrics_row = {name: row.pop(name) for name in METRIC_COLUMNS}
+        if metrics_row["update_time"] is not None:
+            fundamentals[row["asset_uid"]] = metrics_row
+        instruments.append(row)
+
+    # к брокеру только за явно запрошенными asset_uid: у фондов и части бумаг
+    # фундаменталов нет совсем, и поиск по тикерам ходил бы за ними каждый раз.
+    # И только за теми, что есть в figi, - выдуманные uid не тратят общий лимит брокера
+    known = {row["asset_uid"] for row in instruments}
+    missing = [asset_uid for asset_uid in asset_uids
+               if asset_uid not in fundamentals and asset_uid in known and is_asset_uid(asset_uid)]
+    fundamentals.update(await fetch_missing_fundamentals(missing))
+
+    def with_fundamentals(row):
+        return {**row, "fundamentals": fundamentals.get(row["asset_uid"])}
+
+    by_ticker, by_asset_uid = {}, {}
+    for row in instruments:
+        by_ticker.setdefault(row["ticker"], []).append(with_fundamentals(row))
+        by_asset_uid.setdefault(row["asset_uid"], []).append(row)
+    by_figi = {row["figi"]: with_fundamentals(row) for row in instruments}
+
+    return {
+        "tickers": {ticker: by_ticker.get(ticker) or by_ticker.get(ticker.upper(), []) for ticker in tickers},
+        "figis": {figi: by_figi.get(figi) for figi in figis},
+        "asset_uids": {
+            asset_uid: {"instruments": by_asset_uid.get(asset_uid, []), "fundamentals": fundamentals.get(asset_uid)}
+            for asset_uid in asset_uids
+        },
+    }
@@ -1,5 +1,6 @@
 from enum import Enum
-from sqlalchemy import MetaData, Table, Column, String, Boolean, Float, DateTime
+from sqlalchemy import MetaData, Table, Column, String, Boolean, Float, DateTime, Index, Integer, BigInteger, text
+from sqlalchemy import and_, true, literal_column
 
 
 metadata = MetaData()
@@ -12,13 +13,22 @@ figi = Table(
     Column("figi", String),
     Column("name", String),
     Column("class_code", String),
-    Column("uid", String),
+    Column("uid", String, primary_key=True),
     Column("asset_uid", String),
     Column("sector", String),
     Column("api_trade_available_flag", Boolean),
     Column("exchange", String),
     Column("buy_available_flag", Boolean),
-    Column("sell_available_flag", Boolean)
+    Column("sell_available_flag", Boolean),
+    Index("ix_figi_ticker", "ticker"),
+    Index("ix_figi_figi", "figi"),
+    Index("ix_figi_asset_uid", "asset_uid"),
+    # GIN индексы pg_trgm для search_db (ix_figi_name_trgm, ix_figi_ticker_trgm) - только в миграции,
+    # они же обслуживают запросы по lower(name)
+    # условие должно совпадать с tradable_clause(), иначе планировщик не возьмёт индекс
+    Index("ix_figi_tradable_sector", "sector", "asset_uid",
+          postgresql_where=text("buy_available_flag = true AND sell_available_flag = true "
+                                "AND exchange NOT LIKE '%close%'")),
 )
 
 
@@ -32,9 +42,73 @@ fundamental = Table(
     Column("ev_to_ebitda_mrq", Float),
     Column("roe", Float),
     Column("total_debt_to_equity_mrq", Float),
-    Column("update_time", DateTime(timezone=True))
+    Column("update_time", DateTime(timezone=True)),
+    Index("ix_fundamental_pe_ratio_ttm", "pe_ratio_ttm", "asset_uid"),
+    Index("ix_fundamental_price_to_sales_ttm", "price_to_sales_ttm", "asset_uid"),
+    Index("ix_fundamental_price_to_book_ttm", "price_to_book_ttm", "asset_uid"),
+    Index("ix_fundamental_ev_to_ebitda_mrq", "ev_to_ebitda_mrq", "asset_uid"),
+    Index("ix_fundamental_roe", "roe", "asset_uid"),
+    Index("ix_fundamental_total_debt_to_equity_mrq", "total_debt_to_equity_mrq", "asset_uid"),
+    Index("ix_fundamental_update_time", "update_time"),
 )
 
+# история фундаменталов, строка пишется только если показатели изменились;
+# партиции по месяцам создаёт history.ensure_history_partitions
+fundamental_history = Table(
+    "fundamental_history",
+    metadata,
+    Column("asset_uid", String, primary_key=True),
+    Column("recorded_at", DateTime(timezone=True), primary_key=True),
+    Column("pe_ratio_ttm", Float),
+    Column("price_to_sales_ttm", Float),
+    Column("price_to_book_ttm", Float),
+    Column("ev_to_ebitda_mrq", Float),
+    Column("roe", Float),
+    Column("total_debt_to_equity_mrq", Float),
+    postgresql_partition_by="RANGE (recorded_at)",
+)
+
+# закрытые свечи для технических индикаторов, пишет technical.candles_updater
+candle = Table(
+    "candle",
+    metadata,
+    Column("uid", String, primary_key=True),
+    Column("interval", String, primary_key=True),
+    Column("time", DateTime(timezone=True), primary_key=True),
+    Column("open", Float),
+    Column("high", Float),
+    Column("low", Float),
+    Column("close", Float),
+    Column("volume", BigInteger),
+)
+
+# материализованные представления создаются миграциями вручную,
+# поэтому их metadata не отдаётся в autogenerate
+views_metadata = MetaData()
+
+share_ranking = Table(
+    "share_ranking",
+    views_metadata,
+    Column("sector", String),
+    Column("metric", String),
+    Column("rank", Integer),
+    Column("value", Float),
+    Column("sort_value", Float),
+    Column("uid", String),
+)
+
+
+def tradable_clause():
+    """
+    Инструменты, доступные для торговли. Условие записано литералами,
+    чтобы совпадать с предикатом частичного индекса ix_figi_tradable_sector.
+    """
+    return and_(
+        figi.c.buy_available_flag == true(),
+        figi.c.sell_available_flag == true(),
+        figi.c.exchange.not_like(literal_column("'%close%'")),
+    )
+
 
 class Sectors(Enum):
     consumer = 'consumer'
@@ -61,3 +135,8 @@ class Fundamental(Enum):
     ev_to_ebitda_mrq = "ev/ebitda"
     roe = "roe"
     total_debt_to_equity_mrq = "debt/equity"
+
+
+class CandlesInterval(Enum):
+    day = "day"
+    hour = "hour"
@@ -0,0 +1,274 @@
+import asyncio
+import random
+import sys
+import time
+
+from grpc import StatusCode
+from grpc.aio import AioRpcError
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.config import BROKER_MAX_TRIES, BROKER_BREAKER_THRESHOLD, BROKER_BREAKER_RESET
+
+# лимиты брокера в минуту по группам сервисов
+RATE_LIMITS = {
+    "instruments": 200,
+    "market_data": 600,
+    "operations": 200,
+    "users": 100,
+}
+RATE_LIMIT_PERIOD = 60
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# временные сбои брокера: повторяем с backoff и считаем в circuit breaker
+TRANSIENT_CODES = {StatusCode.UNAVAILABLE, StatusCode.DEADLINE_EXCEEDED, StatusCode.INTERNAL}
+
+broker_requests_total = Counter(
+    "broker_requests_total",
+    "Вызовы API брокера по исходу (ok, error, throttled, retried, rejected)",
+    ["group", "outcome"],
+)
+broker_throttle_seconds = Histogram(
+    "broker_throttle_seconds",
+    "Ожидание токена лимитера перед вызовом брокера",
+    ["group"],
+)
+broker_circuit_open = Gauge(
+    "broker_circuit_open",
+    "1 - circuit breaker открыт, вызовы брокера отклоняются",
+)
+
+
+class BrokerUnavailable(Exception):
+    """
+    Circuit breaker открыт: брокер недавно отвечал ошибками, вызов не делался.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"broker is unavailable, retry after {retry_after:.0f} sec")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Общий на процесс лимитер группы сервисов: rate запросов за period,
+    без всплесков больше rate. Ожидающие обслуживаются по очереди.
+    RESOURCE_EXHAUSTED ставит на паузу всех, а не только получившего ошибку.
+    """
+
+    def __init__(self, rate: int, period: float = RATE_LIMIT_PERIOD):
+        self.period = period
+        self.resize(rate)
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def resize(self, rate: int):
+        self.rate = max(1, rate)
+        self.fill_rate = self.rate / self.period
+
+    def _refill(self, now: float):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """
+        :return: сколько секунд ждали
+        """
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - started
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def sync(self, remaining: int | None):
+        """
+        Подстроиться под остаток лимита из метаданных ответа брокера.
+        """
+        if remaining is None:
+            return
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold временных сбоев подряд вызовы брокера reset_timeout
+    секунд отклоняются сразу (BrokerUnavailable), затем пропускается один
+    пробный вызов: успех закрывает breaker, сбой открывает снова.
+    """
+
+    def __init__(self, failure_threshold: int = BROKER_BREAKER_THRESHOLD,
+                 reset_timeout: float = BROKER_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> bool:
+        """
+        :return: True - вызов пробный, после него обязателен record_* или release_probe
+        """
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            retry_after = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise BrokerUnavailable(max(retry_after, 1.0))
+        if state == "half_open":
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """
+        Конец пробного вызова. Если он не дал ответа брокера (отменён, упал не
+        на gRPC), исход неизвестен: состояние не меняем, следующий вызов станет пробным.
+        """
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.opened_at is not None:
+            logger.info("broker circuit closed")
+            self.opened_at = None
+            broker_circuit_open.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.error(f"broker circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._probing = False
+            broker_circuit_open.set(1)
+
+
+buckets = {group: TokenBucket(rate) for group, rate in RATE_LIMITS.items()}
+breaker = CircuitBreaker()
+
+
+def _int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def broker_status(error: Exception) -> tuple[StatusCode, int | None, int | None] | None:
+    """
+    Код ответа и лимиты (x-ratelimit-remaining, x-ratelimit-reset) из ошибки
+    SDK брокера (AioRequestError) или голого gRPC (AioRpcError, например у стримов).
+    :return: None - ошибка не от брокера
+    """
+    if isinstance(error, AioRpcError):
+        # пары (ключ, значение): и grpc.aio.Metadata, и кортеж
+        metadata = dict(tuple(error.trailing_metadata() or ()))
+        return error.code(), _int(metadata.get("x-ratelimit-remaining")), _int(metadata.get("x-ratelimit-reset"))
+    # SDK импортируется лениво: пока он не загружен, его ошибок быть не может
+    exceptions = sys.modules.get("tinkoff.invest.exceptions")
+    if exceptions is not None and isinstance(error, exceptions.AioRequestError):
+        metadata = error.metadata
+        if metadata is None:
+            return error.code, None, None
+        return error.code, metadata.ratelimit_remaining, metadata.ratelimit_reset
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Экспоненциальная задержка с полным jitter, чтобы повторы не шли волной.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def call_broker(call, group: str = "instruments", tries: int = BROKER_MAX_TRIES, on_retry=None):
+    """
+    Вызов API брокера через общий лимитер группы и circuit breaker.
+    RESOURCE_EXHAUSTED ставит группу на паузу до сброса лимита, временные
+    сбои повторяются с backoff; результат удачного повтора возвращается.
+    :param call: функция без аргументов, возвращающая корутину вызова
+    :param on_retry: вызывается перед каждым повтором (для статистики)
+    :raises AioRequestError: постоянная ошибка или попытки кончились (AioRpcError для голого gRPC)
+    :raises BrokerUnavailable: breaker открыт
+    """
+    bucket = buckets[group]
+    for attempt in range(tries):
+        try:
+            probe = breaker.before_call()
+        except BrokerUnavailable:
+            broker_requests_total.labels(group, "rejected").inc()
+            raise
+
+        delay = 0.0
+        try:
+            broker_throttle_seconds.labels(group).observe(await bucket.acquire())
+            result = await call()
+        except Exception as error:
+            status = broker_status(error)
+            if status is None:
+                raise
+            code, remaining, reset = status
+            bucket.sync(remaining)
+            last_attempt = attempt == tries - 1
+            if code == StatusCode.RESOURCE_EXHAUSTED:
+                # брокер ответил, с ним всё в порядке - кончился лимит
+                breaker.record_success()
+                reset = reset if reset is not None else RATE_LIMIT_PERIOD
+                bucket.pause(reset + random.uniform(0, 1))
+                broker_requests_total.labels(group, "throttled").inc()
+                logger.info(f"{group} ratelimit exhausted, paused for {reset} sec")
+                if last_attempt:
+                    raise
+            elif code in TRANSIENT_CODES:
+                breaker.record_failure()
+                broker_requests_total.labels(group, "retried").inc()
+                if last_attempt:
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                breaker.record_success()
+                broker_requests_total.labels(group, "error").inc()
+                raise
+        else:
+            breaker.record_success()
+            broker_requests_total.labels(group, "ok").inc()
+            return result
+        finally:
+            # отмена или не-gRPC ошибка посреди пробы не должна навсегда оставить breaker в half_open.
+            # До backoff: пока ждём, пробным может стать чужой вызов
+            if probe:
+                breaker.release_probe()
+
+        await asyncio.sleep(delay)
+        if on_retry is not None:
+            on_retry()
+
+
+def stats() -> dict:
+    return {
+        "circuit": breaker.state,
+        "failures": breaker.failures,
+        "paused": {group: max(0.0, round(bucket.paused_until - time.monotonic(), 1))
+                   for group, bucket in buckets.items()},
+    }
@@ -1,14 +1,33 @@
-from fastapi import APIRouter, Depends
-from fastapi_cache.decorator import cache
-from sqlalchemy import select, func, desc, not_
+import asyncio
+import importlib.util
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from grpc import StatusCode
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.auth.config import current_user
 from src.auth.models import User
-from src.database import get_async_session
-from src.fonds.models import figi as figi_table, Sectors, Fundamental
+from src.auth.tokens import get_broker_tokens, add_broker_token, remove_broker_token, mask_token
+from src.cache import cached, response_cache
+from src.database import get_async_session, get_read_session
+from src.pagination import encode_cursor, decode_cursor
+from src.fonds.models import figi as figi_table, Sectors, Fundamental, CandlesInterval, share_ranking
 from src.fonds.models import fundamental as fundamental_table
-from src.fonds.utils import fundamentals, get_positions
+from src.fonds.export import ExportFormat, MEDIA_TYPES, export_stream
+from src.fonds.history import get_history, HISTORY_BUCKETS
+from src.fonds.client import client_pool
+from src.fonds.index import instrument_index
+from src.fonds.live import live_portfolios
+from src.fonds.lookup import lookup
+from src.fonds.schemas import ScreenRequest, BrokerTokenAdd, BatchLookup
+from src.fonds.screener import screener_snapshot
+from src.fonds.search import search_instruments
+from src.fonds.technical import technical_engine
+from src.fonds.utils import fundamentals, get_positions, broker_accounts
 
 router = APIRouter(
     prefix="/fonds",
@@ -16,102 +35,271 @@ router = APIRouter(
 )
 
 
+def top_shares_query(sector: Sectors, fundamental: Fundamental, limit: int, offset: int = 0,
+                     cursor: str | None = None):
+    # порядок заранее посчитан в share_ranking после обновления фундаменталов,
+    # страница - это срез индекса по (sector, metric, ...)
+    query = (select(figi_table, fundamental_table, share_ranking.c.sort_value).select_from(share_ranking).
+             join(figi_table, figi_table.c.uid == share_ranking.c.uid).
+             join(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
+             where((share_ranking.c.sector == sector.name) &
+                   (share_ranking.c.metric == fundamental.name)))
+
+    if cursor is not None:
+        sort_value, uid = decode_cursor(cursor, 2)
+        query = (query.where(tuple_(share_ranking.c.sort_value, share_ranking.c.uid) > tuple_(sort_value, uid)).
+                 order_by(share_ranking.c.sort_value, share_ranking.c.uid))
+    else:
+        query = (query.where(share_ranking.c.rank.between(offset + 1, offset + limit)).
+                 order_by(share_ranking.c.rank))
+    return query.limit(limit)
+
+
 @router.get("/get_top_shares_by_sector")
-@cache(expire=30)
 async def get_top_shares_by_sector(
         sector: Sectors,
         fundamental: Fundamental,
-        limit: int = 10,
-        offset: int = 0,
-        session: AsyncSession = Depends(get_async_session),
+        limit: int = Query(10, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+        cursor: str | None = None,
+        session: AsyncSession = Depends(get_read_session),
         user: User = Depends(current_user)
 ):
-    # todo: add indexes for queries
-    match fundamental.name:
-
-        case "pe_ratio_ttm" | "ev_to_ebitda_mrq" | "total_debt_to_equity_mrq":
-            query = (select(figi_table, fundamental_table).select_from(figi_table).
-                     join(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
-                     where((figi_table.c.buy_available_flag == True) &
-                           (figi_table.c.sell_available_flag == True) &
-                           (not_(figi_table.c.exchange.contains("close"))) &
-                           (figi_table.c.sector == sector.name) &
-                           (fundamental_table.c[fundamental.name] > 0)).
-                     order_by(fundamental_table.c[fundamental.name])).limit(limit).offset(offset)
-
-        case "price_to_sales_ttm" | "price_to_book_ttm":
-            query = (select(figi_table, fundamental_table).select_from(figi_table).
-                     join(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
-                     where((figi_table.c.buy_available_flag == True) &
-                           (figi_table.c.sell_available_flag == True) &
-                           (not_(figi_table.c.exchange.contains("close"))) &
-                           (figi_table.c.sector == sector.name) &
-                           (fundamental_table.c[fundamental.name] < 1) &
-                           (fundamental_table.c[fundamental.name] > 0)).
-                     order_by(fundamental_table.c[fundamental.name])).limit(limit).offset(offset)
-
-        case "roe":
-            query = (select(figi_table, fundamental_table).select_from(figi_table).
-                     join(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
-                     where((figi_table.c.buy_available_flag == True) &
-                           (figi_table.c.sell_available_flag == True) &
-                           (not_(figi_table.c.exchange.contains("close"))) &
-                           (figi_table.c.sector == sector.name) &
-                           (fundamental_table.c[fundamental.name] > 0)).
-                     order_by(desc(fundamental_table.c[fundamental.name]))).limit(limit).offset(offset)
-
-        case _:
-            return {"error": "not found case", "detail": fundamental.name}
-
-    shares = await session.execute(query)
-
-    return shares.mappings().all()
+    """
+    Страница рейтинга сектора по показателю. Следующую страницу лучше брать
+    по next_cursor: курсор (sort_value, uid) не съезжает при пересчёте рейтинга,
+    offset оставлен для совместимости.
+    """
+    shares = await session.execute(top_shares_query(sector, fundamental, limit, offset, cursor))
+    items = [dict(row) for row in shares.mappings().all()]
+
+    next_cursor = None
+    if len(items) == limit:
+        next_cursor = encode_cursor(items[-1]["sort_value"], items[-1]["uid"])
+    for item in items:
+        item.pop("sort_value")
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.post("/screen")
+async def screen(request: ScreenRequest, user: User = Depends(current_user)):
+    """
+    Отбор акций по нескольким показателям с взвешенным скором по перцентильным
+    рангам. Считается по снимку figi x fundamental в памяти.
+    """
+    await screener_snapshot.ensure_fresh()
+    return screener_snapshot.screen(
+        sectors=[sector.name for sector in request.sectors],
+        exchanges=request.exchanges,
+        filters={metric.name: (bounds.min, bounds.max) for metric, bounds in request.filters.items()},
+        weights={metric.name: weight for metric, weight in request.weights.items()},
+        tradable_only=request.tradable_only,
+        limit=request.limit,
+    )
+
+
+async def get_live_portfolio(api_token: str):
+    """
+    Подписка на портфель токена с ошибками загрузки в виде HTTP ответов:
+    брокер отклонил токен - 400, не успел или недоступен - 504/503.
+    """
+    from tinkoff.invest.exceptions import AioRequestError
+
+    try:
+        return await live_portfolios.get(api_token)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="broker portfolio load timed out")
+    except AioRequestError as error:
+        if error.code in (StatusCode.UNAUTHENTICATED, StatusCode.PERMISSION_DENIED):
+            raise HTTPException(status_code=400, detail="broker rejected the token")
+        raise HTTPException(status_code=503, detail=f"broker error: {error.code.name}")
 
 
 @router.get("/profile_info")
-@cache(expire=30)
-async def profile_info(api_token: str, session: AsyncSession = Depends(get_async_session),
-                       user: User = Depends(current_user)):
-    data = await get_positions(api_token)
+async def profile_info(api_token: str, user: User = Depends(current_user)):
+    """
+    Портфель из памяти: позиции и цены держит подписка на стримы брокера,
+    первый запрос по токену ждёт начальной загрузки.
+    """
+    portfolio = await get_live_portfolio(api_token)
+    return portfolio.snapshot()
+
+
+@router.get("/profile_info/stream")
+async def profile_info_stream(api_token: str, user: User = Depends(current_user)):
+    """
+    Тот же портфель через Server-Sent Events: событие на каждое изменение цены или позиций.
+    """
+    portfolio = await get_live_portfolio(api_token)
+
+    async def events():
+        async for snapshot in portfolio.updates():
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/portfolio")
+@cached(lambda user, **_: f"portfolio:{user.id}", lambda **_: ("all",), ttl=10, shared=False)
+async def portfolio(session: AsyncSession = Depends(get_async_session), user: User = Depends(current_user)):
+    """
+    Портфель по всем счетам всех сохранённых токенов пользователя:
+    позиции сложены по figi, стоимость - общая и по каждому счёту.
+    """
+    tokens = await get_broker_tokens(session, user.id)
+    if not tokens:
+        raise HTTPException(status_code=404, detail="no broker tokens, add one via POST /fonds/tokens")
+    return await get_positions(tokens=tokens)
+
+
+@router.get("/tokens")
+async def list_tokens(session: AsyncSession = Depends(get_async_session), user: User = Depends(current_user)):
+    tokens = await get_broker_tokens(session, user.id)
+    return [{"index": index, "token": mask_token(token)} for index, token in enumerate(tokens)]
+
 
-    return data
+@router.post("/tokens")
+async def add_token(new_token: BrokerTokenAdd, session: AsyncSession = Depends(get_async_session),
+                    user: User = Depends(current_user)):
+    """
+    Сохранить токен брокера (в БД он хранится зашифрованным).
+    Токен проверяется запросом списка счетов.
+    """
+    from tinkoff.invest.exceptions import AioRequestError
+
+    try:
+        async with client_pool.client(new_token.token) as client:
+            accounts = await broker_accounts(client, new_token.token)
+    except AioRequestError:
+        raise HTTPException(status_code=400, detail="broker rejected the token")
+    await add_broker_token(session, user.id, new_token.token)
+    await response_cache.invalidate(f"portfolio:{user.id}")
+    return {"status": "success", "accounts": len(accounts)}
+
+
+@router.delete("/tokens/{index}")
+async def delete_token(index: int, session: AsyncSession = Depends(get_async_session),
+                       user: User = Depends(current_user)):
+    if not await remove_broker_token(session, user.id, index):
+        raise HTTPException(status_code=404, detail="token not found")
+    await response_cache.invalidate(f"portfolio:{user.id}")
+    return {"status": "success"}
 
 
 @router.get("/sectors")
-@cache(expire=30)
-async def get_all_sectors(session: AsyncSession = Depends(get_async_session), user: User = Depends(current_user)):
+@cached("instruments", lambda **_: ("sectors",), ttl=300)
+async def get_all_sectors(session: AsyncSession = Depends(get_read_session), user: User = Depends(current_user)):
     query = select(figi_table.c.sector).distinct()
     sectors = await session.execute(query)
     return sectors.mappings().all()
 
 
 @router.get("/get_fundamentals_by_asset_uid")
-@cache(expire=30)
+@cached("fundamentals", lambda asset_uid, **_: (asset_uid,), ttl=300, stale_ttl=600)
 async def get_fundamentals_by_asset_uid(asset_uid: str, session: AsyncSession = Depends(get_async_session),
                                         user: User = Depends(current_user)):
     response = await fundamentals([asset_uid])
     return response
 
 
+@router.get("/search")
+async def search(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50),
+                 user: User = Depends(current_user)):
+    """
+    Автодополнение по тикеру, названию и figi: точные совпадения, префиксы,
+    затем нечёткие (по триграммам) - "сбер", "GAZP", "газпрм".
+    """
+    return await search_instruments(q, limit)
+
+
+@router.post("/lookup")
+async def batch_lookup(request: BatchLookup, session: AsyncSession = Depends(get_read_session),
+                       user: User = Depends(current_user)):
+    """
+    Пакетный вариант get_data_by_ticker / get_fundamentals_by_asset_uid:
+    до BATCH_LOOKUP_MAX идентификаторов каждого вида за один запрос.
+    Ответ - словари по тикеру, figi и asset_uid.
+    """
+    return await lookup(session, request.tickers, request.figis, request.asset_uids)
+
+
 @router.get("/get_data_by_ticker")
-@cache(expire=30)
+@cached("instruments", lambda ticker, **_: ("ticker", ticker.upper()), ttl=300, stale_ttl=300)
 async def get_data_by_ticker(ticker: str, session: AsyncSession = Depends(get_async_session),
                              user: User = Depends(current_user)):
-    query = select(figi_table).where(figi_table.c.ticker == ticker.upper())
-    sectors = await session.execute(query)
-    data = sectors.mappings().all()
+    data = await instrument_index.by_ticker(ticker)
     if data:
         return data
     return {"detail": "Not Found", "info": f"{ticker}", "method": "get_data_by_ticker"}
 
 
 @router.get("/get_data_by_name")
-@cache(expire=30)
+@cached("instruments", lambda name, **_: ("name", name.lower()), ttl=300, stale_ttl=300)
 async def get_data_by_name(name: str, session: AsyncSession = Depends(get_async_session),
                            user: User = Depends(current_user)):
-    query = select(figi_table).where(func.lower(figi_table.c.name) == name.lower())
-    sectors = await session.execute(query)
-    data = sectors.mappings().all()
+    data = await instrument_index.by_name(name)
     if data:
         return data
     return {"detail": "Not Found", "info": f"{name}", "method": "get_data_by_name"}
+
+
+@router.get("/export")
+async def export(request: Request, export_format: ExportFormat = ExportFormat.ndjson,
+                 user: User = Depends(current_user)):
+    """
+    Выгрузка всей вселенной figi x fundamental потоком (ndjson, csv или arrow ipc).
+    Сжимается gzip, если клиент его принимает.
+    """
+    if export_format == ExportFormat.arrow and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="arrow export requires pyarrow")
+
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f'attachment; filename="universe.{export_format.value}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_stream(export_format, gzip), media_type=MEDIA_TYPES[export_format],
+                             headers=headers)
+
+
+@router.get("/fundamentals_history")
+@cached("fundamentals", lambda fundamental, bucket, asset_uid, sector, start, end, **_: (
+    "history", fundamental.name, bucket, asset_uid, sector and sector.name, start, end), ttl=300)
+async def fundamentals_history(
+        fundamental: Fundamental,
+        asset_uid: str | None = None,
+        sector: Sectors | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        bucket: str = Query("week", enum=list(HISTORY_BUCKETS)),
+        user: User = Depends(current_user)
+):
+    """
+    История показателя по бумаге (asset_uid) или по сектору (медиана), сжатая до bucket.
+    По умолчанию - последний год.
+    """
+    if (asset_uid is None) == (sector is None):
+        raise HTTPException(status_code=400, detail="pass exactly one of asset_uid or sector")
+    if bucket not in HISTORY_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(HISTORY_BUCKETS)}")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=365)
+    return await get_history(fundamental.name, start, end, bucket,
+                             asset_uid=asset_uid, sector=sector.name if sector else None)
+
+
+@router.get("/technical")
+async def technical(ticker: list[str] = Query(...),
+                    interval: CandlesInterval = CandlesInterval.day,
+                    user: User = Depends(current_user)):
+    """
+    RSI, SMA/EMA, MACD и полосы Боллинджера по последней закрытой свече.
+    Считаются локально по свечам из БД, сразу по всем запрошенным инструментам.
+    """
+    if len(ticker) > 100:
+        raise HTTPException(status_code=400, detail="too many tickers, max 100")
+    instruments = [instrument for name in ticker for instrument in await instrument_index.by_ticker(name)]
+    if not instruments:
+        raise HTTPException(status_code=404, detail="instruments not found")
+    values = await technical_engine.indicators([instrument["uid"] for instrument in instruments], interval)
+    return [{"ticker": instrument["ticker"], **value} for instrument, value in zip(instruments, values)]
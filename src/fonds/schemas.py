@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from src.fonds.models import Sectors, Fundamental
 
 
 class TaskAdd(BaseModel):
@@ -6,3 +8,30 @@ class TaskAdd(BaseModel):
     figi: str
     name: str
     class_code: str
+
+
+class MetricFilter(BaseModel):
+    min: float | None = None
+    max: float | None = None
+
+
+class ScreenRequest(BaseModel):
+    sectors: list[Sectors] = []
+    exchanges: list[str] = []
+    filters: dict[Fundamental, MetricFilter] = {}
+    weights: dict[Fundamental, float] = {}
+    tradable_only: bool = True
+    limit: int = Field(20, ge=1, le=500)
+
+
+class BrokerTokenAdd(BaseModel):
+    token: str = Field(min_length=1)
+
+
+BATCH_LOOKUP_MAX = 500
+
+
+class BatchLookup(BaseModel):
+    tickers: list[str] = Field([], max_length=BATCH_LOOKUP_MAX)
+    figis: list[str] = Field([], max_length=BATCH_LOOKUP_MAX)
+    asset_uids: list[str] = Field([], max_length=BATCH_LOOKUP_MAX)
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import select, func
+
+from src.database import scoped_session
+from src.fonds.models import figi as figi_table, Fundamental, tradable_clause
+from src.fonds.models import fundamental as fundamental_table
+
+METRICS = [metric.name for metric in Fundamental]
+# для этих показателей лучше меньшее значение, неположительные считаются отсутствующими
+LOWER_IS_BETTER = {"pe_ratio_ttm", "price_to_sales_ttm", "price_to_book_ttm",
+                   "ev_to_ebitda_mrq", "total_debt_to_equity_mrq"}
+# как часто сверять версию снимка с max(update_time) в БД
+SNAPSHOT_RECHECK_SECONDS = 30
+# версия снимка пустой таблицы fundamental (max(update_time) = NULL)
+EMPTY_VERSION = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class ScreenerSnapshot:
+    """
+    Колоночный снимок соединения figi x fundamental в памяти процесса.
+    Строки - инструменты, показатели лежат в матрице float64 (nan - нет данных).
+    Перечитывается, когда fundamentals_updater записал новые данные или
+    figi_updater обновил инструменты (события fundamentals и instruments).
+    """
+
+    def __init__(self):
+        self.uid = np.empty(0, dtype=object)
+        self.ticker = np.empty(0, dtype=object)
+        self.name = np.empty(0, dtype=object)
+        self.sector = np.empty(0, dtype=object)
+        self.exchange = np.empty(0, dtype=object)
+        self.tradable = np.empty(0, dtype=bool)
+        self.metrics = np.empty((0, len(METRICS)), dtype=np.float64)
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._checked_at = 0.0
+        self.version = None
+
+    async def ensure_fresh(self):
+        if self.version is not None and time.monotonic() - self._checked_at < SNAPSHOT_RECHECK_SECONDS:
+            return
+        async with self._lock:
+            if self.version is not None and time.monotonic() - self._checked_at < SNAPSHOT_RECHECK_SECONDS:
+                return
+            async with scoped_session(read_only=True) as s:
+                version = (await s.execute(select(func.max(fundamental_table.c.update_time)))).scalar() \
+                    or EMPTY_VERSION
+                if self.version is None or version != self.version:
+                    await self._load(s, version)
+            self._checked_at = time.monotonic()
+
+    async def _load(self, session, version):
+        query = (select(figi_table.c.uid, figi_table.c.ticker, figi_table.c.name,
+                        figi_table.c.sector, figi_table.c.exchange, tradable_clause().label("tradable"),
+                        *[fundamental_table.c[metric] for metric in METRICS]).
+                 select_from(figi_table).
+                 join(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid))
+        rows = (await session.execute(query)).all()
+
+        columns = list(zip(*rows)) if rows else [()] * (6 + len(METRICS))
+        self.uid = np.array(columns[0], dtype=object)
+        self.ticker = np.array(columns[1], dtype=object)
+        self.name = np.array(columns[2], dtype=object)
+        self.sector = np.array(columns[3], dtype=object)
+        self.exchange = np.array(columns[4], dtype=object)
+        self.tradable = np.array(columns[5], dtype=bool)
+        metrics = np.array(columns[6:], dtype=np.float64).reshape(len(METRICS), len(rows)).T
+        for index, metric in enumerate(METRICS):
+            if metric in LOWER_IS_BETTER:
+                metrics[metrics[:, index] <= 0, index] = np.nan
+        self.metrics = metrics
+        self.version = version
+
+    def screen(self, sectors=None, exchanges=None, filters=None, weights=None,
+               tradable_only=True, limit=20) -> list[dict]:
+        """
+        Отбор и ранжирование всей вселенной за один проход.
+        :param filters: {metric: (min, max)}, границы включительно, None - без границы
+        :param weights: {metric: вес} для итогового скора из перцентильных рангов
+        """
+        mask = np.ones(len(self.uid), dtype=bool)
+        if tradable_only:
+            mask &= self.tradable
+        if sectors:
+            mask &= np.isin(self.sector, list(sectors))
+        if exchanges:
+            mask &= np.isin(self.exchange, list(exchanges))
+        for metric, (low, high) in (filters or {}).items():
+            values = self.metrics[:, METRICS.index(metric)]
+            mask &= ~np.isnan(values)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        score = np.zeros(len(candidates), dtype=np.float64)
+        total_weight = sum(abs(weight) for weight in (weights or {}).values()) or 1.0
+        for metric, weight in (weights or {}).items():
+            values = self.metrics[candidates, METRICS.index(metric)]
+            score += weight * percentile_rank(values, higher_is_better=metric not in LOWER_IS_BETTER)
+        score /= total_weight
+
+        k = min(limit, len(candidates))
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top], kind="stable")]
+
+        result = []
+        for position in top:
+            row = candidates[position]
+            result.append({
+                "uid": self.uid[row],
+                "ticker": self.ticker[row],
+                "name": self.name[row],
+                "sector": self.sector[row],
+                "exchange": self.exchange[row],
+                "score": round(float(score[position]), 6),
+                "fundamentals": {
+                    Fundamental[metric].value: None if np.isnan(value) else float(value)
+                    for metric, value in zip(METRICS, self.metrics[row])
+                },
+            })
+        return result
+
+
+def percentile_rank(values: np.ndarray, higher_is_better: bool) -> np.ndarray:
+    """
+    Перцентильный ранг в [0, 1], где 1 - лучшее значение; nan получают 0.
+    """
+    valid = ~np.isnan(values)
+    ranks = np.zeros(len(values), dtype=np.float64)
+    count = int(valid.sum())
+    if count == 0:
+        return ranks
+    order = np.argsort(values[valid], kind="stable")
+    if not higher_is_better:
+        order = order[::-1]
+    positions = np.empty(count, dtype=np.float64)
+    positions[order] = np.arange(count)
+    ranks[valid] = positions / (count - 1) if count > 1 else 1.0
+    return ranks
+
+
+screener_snapshot = ScreenerSnapshot()
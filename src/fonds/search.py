@@ -0,0 +1,199 @@
+import asyncio
+import bisect
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import select, func, or_, case
+
+from src.config import SEARCH_BACKEND
+from src.database import scoped_session
+from src.fonds.index import instrument_index
+from src.fonds.models import figi as figi_table, tradable_clause
+
+# классы совпадений, меньше - выше в выдаче
+MATCH_EXACT = 0
+MATCH_TICKER_PREFIX = 1
+MATCH_NAME_PREFIX = 2
+MATCH_WORD_PREFIX = 3
+MATCH_FUZZY = 4
+MATCH_NAMES = {MATCH_EXACT: "exact", MATCH_TICKER_PREFIX: "ticker", MATCH_NAME_PREFIX: "name",
+               MATCH_WORD_PREFIX: "word", MATCH_FUZZY: "fuzzy"}
+# сколько ключей из диапазона префикса смотреть, для коротких запросов диапазон огромный
+PREFIX_SCAN_LIMIT = 200
+FUZZY_THRESHOLD = 0.3
+
+
+def normalize(value: str | None) -> str:
+    return " ".join((value or "").lower().replace("ё", "е").split())
+
+
+def trigrams(value: str) -> set[str]:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class SearchState:
+    rows: list[dict]
+    tradable: np.ndarray
+    # отсортированные (ключ, класс совпадения, строка) - плоский префиксный индекс
+    keys: list[str]
+    entries: list[tuple[int, int]]
+    exact: dict[str, list[int]]
+    # по полю (name, ticker): триграмма -> номера строк и число триграмм у каждой строки
+    trigram_fields: list[tuple[dict[str, np.ndarray], np.ndarray]]
+
+
+def build_state(rows: list[dict]) -> SearchState:
+    pairs, exact = [], {}
+    grams: list[dict[str, list[int]]] = [{}, {}]
+    trigram_count = np.zeros((2, len(rows)), dtype=np.int64)
+    for row_id, row in enumerate(rows):
+        ticker, name = normalize(row["ticker"]), normalize(row["name"])
+        for value in (ticker, normalize(row["figi"])):
+            if value:
+                exact.setdefault(value, []).append(row_id)
+        if ticker:
+            pairs.append((ticker, MATCH_TICKER_PREFIX, row_id))
+        if name:
+            pairs.append((name, MATCH_NAME_PREFIX, row_id))
+            for word in name.split()[1:]:
+                pairs.append((word, MATCH_WORD_PREFIX, row_id))
+        for field, value in enumerate((name, ticker)):
+            row_grams = trigrams(value) if value else set()
+            trigram_count[field, row_id] = len(row_grams)
+            for gram in row_grams:
+                grams[field].setdefault(gram, []).append(row_id)
+
+    pairs.sort()
+    return SearchState(
+        rows=rows,
+        tradable=np.array([bool(row["buy_available_flag"] and row["sell_available_flag"] and
+                                "close" not in (row["exchange"] or "")) for row in rows], dtype=bool),
+        keys=[key for key, _, _ in pairs],
+        entries=[(match, row_id) for _, match, row_id in pairs],
+        exact=exact,
+        trigram_fields=[
+            ({gram: np.array(ids, dtype=np.int64) for gram, ids in grams[field].items()}, trigram_count[field])
+            for field in range(2)
+        ],
+    )
+
+
+class SearchIndex:
+    """
+    Автодополнение по ticker, name и figi в памяти процесса: точные совпадения,
+    префиксы по отсортированным ключам (bisect) и нечёткий поиск по триграммам.
+    Строится по строкам instrument_index и подменяется целиком, когда тот перезагружен.
+    """
+
+    def __init__(self):
+        self._state: SearchState | None = None
+        self._generation = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_fresh(self) -> SearchState:
+        await instrument_index.ensure_loaded()
+        if self._generation == instrument_index.generation:
+            return self._state
+        async with self._lock:
+            generation, rows = instrument_index.generation, instrument_index.rows
+            if self._generation != generation:
+                # сборка ~100 мс на несколько тысяч строк, не держим ей event loop
+                self._state = await asyncio.to_thread(build_state, rows)
+                self._generation = generation
+        return self._state
+
+    async def search(self, query: str, limit: int = 10) -> list[dict]:
+        return self.search_state(await self.ensure_fresh(), query, limit)
+
+    @staticmethod
+    def search_state(state: SearchState, query: str, limit: int) -> list[dict]:
+        query = normalize(query)
+        if not query:
+            return []
+        best: dict[int, tuple] = {}
+
+        def offer(row_id: int, match: int, score: float):
+            rank = (match, -score, not state.tradable[row_id], len(state.rows[row_id]["name"] or ""))
+            if row_id not in best or rank < best[row_id]:
+                best[row_id] = rank
+
+        for row_id in state.exact.get(query, []):
+            offer(row_id, MATCH_EXACT, 1.0)
+
+        start = bisect.bisect_left(state.keys, query)
+        end = min(bisect.bisect_right(state.keys, query + "\uffff"), start + PREFIX_SCAN_LIMIT)
+        for match, row_id in state.entries[start:end]:
+            offer(row_id, match, 1.0)
+
+        if len(best) < limit:
+            # как similarity() в pg_trgm: общие триграммы / все триграммы пары, лучшее из полей
+            query_grams = trigrams(query)
+            similarity = np.zeros(len(state.rows))
+            for postings, counts in state.trigram_fields:
+                found = [postings[gram] for gram in query_grams if gram in postings]
+                if found:
+                    shared = np.bincount(np.concatenate(found), minlength=len(state.rows))
+                    similarity = np.maximum(similarity, shared / (len(query_grams) + counts - shared))
+            candidates = np.flatnonzero(similarity >= FUZZY_THRESHOLD)
+            top = candidates[np.argsort(-similarity[candidates], kind="stable")[:limit]]
+            for row_id in top:
+                offer(int(row_id), MATCH_FUZZY, float(similarity[row_id]))
+
+        ranked = sorted(best.items(), key=lambda item: item[1])[:limit]
+        return [
+            {**_suggestion(state.rows[row_id]), "match": MATCH_NAMES[rank[0]]}
+            for row_id, rank in ranked
+        ]
+
+
+def _suggestion(row: dict) -> dict:
+    return {key: row[key] for key in ("uid", "ticker", "name", "figi", "class_code", "sector", "exchange")}
+
+
+def search_db_query(query: str, limit: int = 10):
+    """
+    Запрос search_db для уже нормализованной строки: префиксы и % по
+    lower(name)/lower(ticker) идут по GIN индексам ix_figi_name_trgm и ix_figi_ticker_trgm.
+    """
+    name = func.lower(figi_table.c.name)
+    ticker = func.lower(figi_table.c.ticker)
+    match = case(
+        (or_(ticker == query, figi_table.c.figi == query.upper()), MATCH_EXACT),
+        (ticker.startswith(query, autoescape=True), MATCH_TICKER_PREFIX),
+        (name.startswith(query, autoescape=True), MATCH_NAME_PREFIX),
+        else_=MATCH_FUZZY,
+    ).label("match")
+    similarity = func.greatest(func.similarity(name, query), func.similarity(ticker, query)).label("score")
+    return (select(figi_table, match, similarity).
+            where(or_(ticker.startswith(query, autoescape=True),
+                      name.startswith(query, autoescape=True),
+                      # figi у брокера в верхнем регистре: сравнение по ix_figi_figi
+                      figi_table.c.figi == query.upper(),
+                      name.op("%")(query),
+                      ticker.op("%")(query))).
+            order_by(match, similarity.desc(), tradable_clause().desc(), func.length(figi_table.c.name)).
+            limit(limit))
+
+
+async def search_db(query: str, limit: int = 10) -> list[dict]:
+    """
+    Тот же поиск через pg_trgm, когда индекс в памяти держать не хочется
+    (SEARCH_BACKEND=postgres). Использует GIN индексы из миграции.
+    """
+    query = normalize(query)
+    if not query:
+        return []
+    async with scoped_session(read_only=True) as s:
+        rows = (await s.execute(search_db_query(query, limit))).mappings().all()
+    return [{**_suggestion(row), "match": MATCH_NAMES[row["match"]]} for row in rows]
+
+
+search_index = SearchIndex()
+
+
+async def search_instruments(query: str, limit: int = 10) -> list[dict]:
+    if SEARCH_BACKEND == "postgres":
+        return await search_db(query, limit)
+    return await search_index.search(query, limit)
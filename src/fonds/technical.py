@@ -0,0 +1,241 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import select, func, text, bindparam, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from src.cache import response_cache
+from src.database import scoped_session, worker_session_maker
+from src.fonds.client import client_pool
+from src.fonds.indicators import IndicatorBook
+from src.fonds.models import candle as candle_table, CandlesInterval, tradable_clause
+from src.fonds.models import figi as figi_table
+from src.fonds.money import quotations_to_array
+from src.fonds.resilience import call_broker, BrokerUnavailable
+from src.fonds.utils import batch
+
+# имена tinkoff.invest.CandleInterval, SDK импортируется только при загрузке свечей
+CANDLE_INTERVALS = {
+    CandlesInterval.day: "CANDLE_INTERVAL_DAY",
+    CandlesInterval.hour: "CANDLE_INTERVAL_HOUR",
+}
+CANDLE_COLUMNS = ["uid", "interval", "time", "open", "high", "low", "close", "volume"]
+# глубина истории при первой загрузке инструмента
+CANDLES_HISTORY = {
+    CandlesInterval.day: timedelta(days=365),
+    CandlesInterval.hour: timedelta(days=30),
+}
+# сколько последних свечей брать для прогрева индикаторов, EMA/RSI к этому моменту сходятся
+CANDLES_WARMUP = 250
+CANDLES_CONCURRENCY = 4
+# как часто проверять в БД новые свечи отслеживаемых инструментов
+TECHNICAL_RECHECK_SECONDS = 30
+
+
+async def fetch_candles(client, uid: str, interval: CandlesInterval, since: datetime) -> list[dict]:
+    """
+    Закрытые свечи инструмента начиная с since. Незакрытая текущая свеча не пишется,
+    иначе её пришлось бы переписывать и откатывать индикаторы.
+    """
+    from tinkoff.invest import CandleInterval
+    from tinkoff.invest.exceptions import AioRequestError
+
+    async def load():
+        return [candle async for candle in client.get_all_candles(instrument_id=uid, from_=since,
+                                                                  interval=CandleInterval[CANDLE_INTERVALS[interval]])
+                if candle.is_complete]
+
+    try:
+        candles = await call_broker(load, group="market_data")
+    except AioRequestError as error:
+        logger.error(f"candles for {uid} are not loaded: {error.code}")
+        candles = []
+    except BrokerUnavailable as error:
+        logger.error(f"candles for {uid} are not loaded: {error}")
+        candles = []
+
+    prices = {name: quotations_to_array([getattr(candle, name) for candle in candles])
+              for name in ("open", "high", "low", "close")}
+    return [
+        {
+            "uid": uid,
+            "interval": interval.name,
+            "time": candle.time,
+            **{name: float(column[index]) for name, column in prices.items()},
+            "volume": candle.volume,
+        }
+        for index, candle in enumerate(candles)
+    ]
+
+
+async def write_candles(rows: list[dict]):
+    if not rows:
+        return
+    async with worker_session_maker() as session:
+        for start, end in await batch(len(CANDLE_COLUMNS), len(rows)):
+            # закрытая свеча не меняется, повтор границы since просто пропускаем
+            await session.execute(insert(candle_table).values(rows[start:end]).on_conflict_do_nothing())
+        await session.commit()
+
+
+async def candles_updater(interval: CandlesInterval = CandlesInterval.day,
+                          concurrency: int = CANDLES_CONCURRENCY) -> int:
+    """
+    Догрузка свечей по торгуемым инструментам: для каждого с последней
+    сохранённой свечи, для новых - за CANDLES_HISTORY.
+    :return: сколько свечей получено
+    """
+    async with worker_session_maker() as session:
+        last_times = dict((await session.execute(
+            select(candle_table.c.uid, func.max(candle_table.c.time)).
+            where(candle_table.c.interval == interval.name).
+            group_by(candle_table.c.uid)
+        )).all())
+        uids = (await session.execute(select(figi_table.c.uid).where(tradable_clause()))).scalars().all()
+
+    default_since = datetime.now(timezone.utc) - CANDLES_HISTORY[interval]
+    semaphore = asyncio.Semaphore(concurrency)
+    total = 0
+
+    async def worker(client, uid):
+        nonlocal total
+        async with semaphore:
+            rows = await fetch_candles(client, uid, interval, last_times.get(uid, default_since))
+            await write_candles(rows)
+            total += len(rows)
+
+    async with client_pool.client() as client:
+        await asyncio.gather(*(worker(client, uid) for uid in uids))
+
+    # API процессы по этому событию подтягивают новые свечи в индикаторы
+    await response_cache.invalidate("candles")
+    logger.info(f"candles refresh finished ({interval.name}): {len(uids)} instruments, {total} candles")
+    return total
+
+
+def _closes_matrix(rows, positions: dict[str, int], count: int):
+    """
+    Свечи (uid, time, close), отсортированные по времени, в матрицу
+    count x max_len: строка - инструмент, хвост nan.
+    """
+    series = [[] for _ in range(count)]
+    times = [None] * count
+    for uid, moment, close in rows:
+        series[positions[uid]].append(close)
+        times[positions[uid]] = moment
+    closes = np.full((count, max((len(values) for values in series), default=0)), np.nan)
+    for row, values in enumerate(series):
+        closes[row, :len(values)] = values
+    return closes, times
+
+
+class TechnicalEngine:
+    """
+    Технические индикаторы по свечам из БД, в памяти процесса.
+    Инструмент прогревается по последним CANDLES_WARMUP свечам при первом
+    запросе, дальше на каждую новую свечу делается один шаг IndicatorBook.
+    """
+
+    def __init__(self):
+        self._books: dict[CandlesInterval, IndicatorBook] = {}
+        self._rows: dict[CandlesInterval, dict[str, int]] = {}
+        self._last_time: dict[CandlesInterval, dict[str, datetime]] = {}
+        self._checked_at: dict[CandlesInterval, float] = {}
+        self._locks: dict[CandlesInterval, asyncio.Lock] = {}
+
+    def invalidate(self):
+        self._checked_at.clear()
+
+    def _book(self, interval: CandlesInterval) -> IndicatorBook:
+        if interval not in self._books:
+            self._books[interval] = IndicatorBook()
+            self._rows[interval] = {}
+            self._last_time[interval] = {}
+            self._locks[interval] = asyncio.Lock()
+        return self._books[interval]
+
+    async def _warm_up(self, session, interval: CandlesInterval, uids: list[str]):
+        book = self._book(interval)
+        rows = self._rows[interval]
+        numbered = (select(candle_table.c.uid, candle_table.c.time, candle_table.c.close,
+                           func.row_number().over(partition_by=candle_table.c.uid,
+                                                  order_by=candle_table.c.time.desc()).label("n")).
+                    where((candle_table.c.interval == interval.name) &
+                          candle_table.c.uid.in_(uids)).
+                    subquery())
+        result = await session.execute(
+            select(numbered.c.uid, numbered.c.time, numbered.c.close).
+            where(numbered.c.n <= CANDLES_WARMUP).
+            order_by(numbered.c.time)
+        )
+        new_rows = book.grow(len(uids))
+        positions = {uid: index for index, uid in enumerate(uids)}
+        closes, times = _closes_matrix(result.all(), positions, len(uids))
+        book.feed(new_rows, closes)
+        for uid, row, moment in zip(uids, new_rows, times):
+            rows[uid] = int(row)
+            if moment is not None:
+                self._last_time[interval][uid] = moment
+
+    async def _catch_up(self, session, interval: CandlesInterval):
+        book = self._book(interval)
+        rows = self._rows[interval]
+        if not rows:
+            return
+        last_time = self._last_time[interval]
+        uids = list(rows)
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        # только свечи новее последней учтённой у каждого инструмента
+        result = await session.execute(
+            text("SELECT c.uid, c.time, c.close FROM candle c "
+                 "JOIN unnest(:uids, :times) AS t(uid, last_time) "
+                 "ON c.uid = t.uid AND c.time > t.last_time "
+                 "WHERE c.interval = :interval ORDER BY c.time").
+            bindparams(bindparam("uids", uids, type_=ARRAY(String)),
+                       bindparam("times", [last_time.get(uid, epoch) for uid in uids],
+                                 type_=ARRAY(DateTime(timezone=True))),
+                       interval=interval.name)
+        )
+        candles = result.all()
+        if not candles:
+            return
+        updated = list(dict.fromkeys(uid for uid, _, _ in candles))
+        positions = {uid: index for index, uid in enumerate(updated)}
+        closes, times = _closes_matrix(candles, positions, len(updated))
+        book.feed(np.array([rows[uid] for uid in updated]), closes)
+        for uid, moment in zip(updated, times):
+            last_time[uid] = moment
+
+    async def indicators(self, uids: list[str], interval: CandlesInterval = CandlesInterval.day) -> list[dict]:
+        """
+        Последние значения индикаторов по инструментам, None - не хватает истории.
+        """
+        book = self._book(interval)
+        async with self._locks[interval]:
+            missing = [uid for uid in dict.fromkeys(uids) if uid not in self._rows[interval]]
+            recheck = time.monotonic() - self._checked_at.get(interval, 0.0) >= TECHNICAL_RECHECK_SECONDS
+            if missing or recheck:
+                async with scoped_session(read_only=True) as s:
+                    if recheck:
+                        await self._catch_up(s, interval)
+                        self._checked_at[interval] = time.monotonic()
+                    if missing:
+                        await self._warm_up(s, interval, missing)
+
+        rows = np.array([self._rows[interval][uid] for uid in uids], dtype=np.int64)
+        values = book.snapshot(rows)
+        return [
+            {
+                "uid": uid,
+                "time": self._last_time[interval].get(uid),
+                **{name: None if np.isnan(column[index]) else round(float(column[index]), 6)
+                   for name, column in values.items()},
+            }
+            for index, uid in enumerate(uids)
+        ]
+
+
+technical_engine = TechnicalEngine()
@@ -1,53 +1,69 @@
 import asyncio
 import datetime
 import math
+import time
+from dataclasses import dataclass, field
+from operator import attrgetter
+from typing import Iterable, Iterator
 
+from cachetools import TTLCache
 from grpc import StatusCode
-from numpy import nan
-from tinkoff.invest import AsyncClient, InstrumentStatus
-from pandas import DataFrame
-from datetime import datetime, timezone
-from tqdm import tqdm
+import numpy as np
+from datetime import datetime, timezone, timedelta
 from loguru import logger
-from sqlalchemy import insert, delete, select, RowMapping
+from sqlalchemy import insert, delete, select, text, func, RowMapping
 from sqlalchemy.dialects.postgresql import insert
-from tinkoff.invest.schemas import (
-    GetTechAnalysisRequest, IndicatorType,
-    IndicatorInterval, TypeOfPrice, Deviation, Quotation,
-    Smoothing, GetAssetFundamentalsRequest
-)
-from tinkoff.invest.exceptions import AioRequestError
-
-from src.database import scoped_session, get_async_session
-from src.config import TINKOFF_API_KEY
+
+from src.cache import response_cache
+from src.config import PORTFOLIO_CONCURRENCY, BROKER_ACCOUNTS_TTL
+from src.database import get_async_session, engine_worker, worker_session_maker
+from src.fonds.client import client_pool
+from src.fonds.history import changed_rows, write_history, HISTORY_METRICS
+from src.fonds.index import instrument_index
+from src.fonds.money import positions_to_nano, nano_to_float, nano_to_number, sum_nano
 from src.fonds.models import figi as figi_table
 from src.fonds.models import fundamental as fundamental_table
+from src.fonds.resilience import call_broker, buckets, RATE_LIMITS, BrokerUnavailable
 
 from pprint import pprint as pp
 
+# tinkoff.invest импортируется внутри функций: API процесс стартует без SDK брокера,
+# он подгружается в фоне (client_pool.start) или с первым запросом к брокеру
+
 PSQL_QUERY_ALLOWED_MAX_ARGS = 32767
 
 
-async def figi_updater():
-    columns = ['name', 'figi', 'ticker', 'class_code',
-               'uid', 'sector', 'api_trade_available_flag',
-               'asset_uid', 'exchange', 'buy_available_flag',
-               'sell_available_flag']
-    async with AsyncClient(TINKOFF_API_KEY) as client:
-        shares = await client.instruments.shares(instrument_status=InstrumentStatus.INSTRUMENT_STATUS_BASE)
+FIGI_COLUMNS = ['name', 'figi', 'ticker', 'class_code',
+                'uid', 'sector', 'api_trade_available_flag',
+                'asset_uid', 'exchange', 'buy_available_flag',
+                'sell_available_flag']
+
+
+async def figi_updater(mode: str = "diff"):
+    """
+    Обновление таблицы figi.
+    :param mode: "diff" - записать только изменения по uid, "swap" - полная перезаливка
+    """
+    from tinkoff.invest import InstrumentStatus
 
-    shares_df = DataFrame(shares.instruments, columns=columns)
+    async with client_pool.client() as client:
+        shares = await call_broker(
+            lambda: client.instruments.shares(instrument_status=InstrumentStatus.INSTRUMENT_STATUS_BASE)
+        )
 
-    # shares_available = shares_df[(shares_df['buy_available_flag'] == True) &
-    #                              (shares_df['sell_available_flag'] == True) &
-    #                              (~shares_df['exchange'].str.contains('close'))]
-    #
-    # shares_available = shares_available.drop(['exchange', 'buy_available_flag', 'sell_available_flag'], axis=1)
+    await insert_figi_to_db(instrument_records(shares.instruments), mode)
+    await refresh_share_ranking()
+    # API процессы по этому событию перестраивают индекс инструментов и сбрасывают кеши
+    await response_cache.invalidate("instruments")
 
-    shares_dict = shares_df.to_dict(orient='records')
 
-    batched_shares_indexes = await batch(len(columns), len(shares_dict))
-    await insert_figi_to_db(shares_dict, batched_shares_indexes)
+def instrument_records(instruments: Iterable) -> Iterator[tuple]:
+    """
+    Инструменты из ответа брокера сразу в кортежи колонок FIGI_COLUMNS для COPY.
+    Генератор: кортеж создаётся, когда COPY его читает, промежуточной таблицы нет.
+    """
+    row = attrgetter(*FIGI_COLUMNS)
+    return (row(instrument) for instrument in instruments)
 
 
 async def batch(args_per_row, total_records):
@@ -65,183 +81,419 @@ async def batch(args_per_row, total_records):
     return indexes_args_batches
 
 
-async def insert_figi_to_db(shares_dict, batched_indexes):
-    async with scoped_session() as session:
-        stmt_delete = delete(figi_table)
-        await session.execute(stmt_delete)
+async def insert_figi_to_db(shares_records: Iterable[tuple], mode: str = "diff"):
+    """
+    Загрузка инструментов через временную staging таблицу.
+    Строки идут в неё по COPY (временная таблица не пишет WAL), затем в одной
+    транзакции переносятся в figi, поэтому читатели до коммита видят старые
+    данные, а не пустую или наполовину заполненную таблицу, и не блокируются.
+    mode="diff" (плановое обновление) обновляет только изменившиеся инструменты,
+    добавляет новые и удаляет исключённые из листинга, сопоставляя их по uid.
+    mode="swap" заменяет содержимое figi целиком через DELETE: TRUNCATE взял бы
+    ACCESS EXCLUSIVE и остановил всех читателей figi на время перезаливки,
+    а от DELETE остаются только dead tuples для autovacuum.
+    """
+    if mode not in ("diff", "swap"):
+        raise ValueError(f"unknown figi refresh mode: {mode}")
+
+    columns = ", ".join(FIGI_COLUMNS)
+    staged_columns = ", ".join(f"s.{column}" for column in FIGI_COLUMNS)
+
+    async with engine_worker.begin() as conn:
+        raw_connection = await conn.get_raw_connection()
+        driver = raw_connection.driver_connection
+
+        await driver.execute("CREATE TEMP TABLE figi_staging (LIKE figi) ON COMMIT DROP")
+        await driver.copy_records_to_table("figi_staging", records=shares_records, columns=FIGI_COLUMNS)
+
+        if mode == "swap":
+            await driver.execute("DELETE FROM figi")
+            await driver.execute(f"INSERT INTO figi ({columns}) SELECT {columns} FROM figi_staging")
+            return
+
+        assignments = ", ".join(f"{column} = s.{column}" for column in FIGI_COLUMNS if column != "uid")
+        await driver.execute(
+            "DELETE FROM figi f WHERE NOT EXISTS (SELECT 1 FROM figi_staging s WHERE s.uid = f.uid)"
+        )
+        await driver.execute(
+            f"UPDATE figi f SET {assignments} FROM figi_staging s "
+            f"WHERE f.uid = s.uid AND ({', '.join(f'f.{column}' for column in FIGI_COLUMNS)}) "
+            f"IS DISTINCT FROM ({staged_columns})"
+        )
+        await driver.execute(
+            f"INSERT INTO figi ({columns}) SELECT {staged_columns} FROM figi_staging s "
+            "WHERE NOT EXISTS (SELECT 1 FROM figi f WHERE f.uid = s.uid)"
+        )
+
+
+FUNDAMENTAL_COLUMNS = ['asset_uid', 'pe_ratio_ttm', 'price_to_sales_ttm',
+                       'price_to_book_ttm', 'ev_to_ebitda_mrq', 'roe',
+                       'total_debt_to_equity_mrq', 'update_time']
+# GetAssetFundamentals принимает до 100 asset_uid за один запрос
+FUNDAMENTALS_ASSETS_PER_REQUEST = 100
+FUNDAMENTALS_CONCURRENCY = 4
+
+
+@dataclass
+class RefreshStats:
+    assets: int = 0
+    requests: int = 0
+    retries: int = 0
+    failed_chunks: int = 0
+    rows: int = 0
+    changed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def retried(self):
+        self.requests += 1
+        self.retries += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def report(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "assets": self.assets,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failed_chunks": self.failed_chunks,
+            "rows": self.rows,
+            "changed": self.changed,
+            "elapsed_sec": round(elapsed, 2),
+            "rows_per_sec": round(self.rows / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def fundamentals_to_row(statistic, update_time: datetime) -> dict:
+    return {
+        "asset_uid": statistic.asset_uid,
+        "pe_ratio_ttm": statistic.pe_ratio_ttm,
+        "price_to_sales_ttm": statistic.price_to_sales_ttm,
+        "price_to_book_ttm": statistic.price_to_book_ttm,
+        "ev_to_ebitda_mrq": statistic.ev_to_ebitda_mrq,
+        "roe": statistic.roe,
+        "total_debt_to_equity_mrq": statistic.total_debt_to_equity_mrq,
+        "update_time": update_time
+    }
+
 
-        for start, end in batched_indexes:
-            stmt_insert = insert(figi_table).values(shares_dict[start:end])
-            await session.execute(stmt_insert)
+async def fetch_fundamentals_chunk(client, asset_uids: list[str], stats: RefreshStats):
+    """
+    Один запрос GetAssetFundamentals на пачку asset_uid через общий клиент.
+    Лимит, повторы и circuit breaker - в resilience.call_broker.
+    :return: список StatisticResponse (может быть пустым)
+    """
+    from tinkoff.invest.schemas import GetAssetFundamentalsRequest
+    from tinkoff.invest.exceptions import AioRequestError
+
+    stats.requests += 1
+    try:
+        result = await call_broker(
+            lambda: client.instruments.get_asset_fundamentals(GetAssetFundamentalsRequest(assets=asset_uids)),
+            on_retry=stats.retried,
+        )
+        return result.fundamentals
+    except AioRequestError as error:
+        if error.code == StatusCode.NOT_FOUND:
+            return []
+        logger.error(f"fundamentals request failed: {error.code} {error.details}")
+    except BrokerUnavailable as error:
+        logger.error(f"fundamentals request skipped: {error}")
+
+    stats.failed_chunks += 1
+    logger.error(f"something wrong, chunk of {len(asset_uids)} assets skipped")
+    return []
+
+
+async def get_stale_asset_uids(session, stale_after: timedelta | None = None,
+                               shard: int = 0, shards: int = 1) -> list[str]:
+    """
+    asset_uid, которым нужно обновление: ещё без фундаменталов или с update_time
+    старше stale_after. Сначала те, что не загружались, потом самые старые.
+    При shards > 1 возвращается только доля shard из всего множества.
+    """
+    update_time = fundamental_table.c.update_time
+    query = (select(figi_table.c.asset_uid, update_time).distinct().
+             select_from(figi_table).
+             outerjoin(fundamental_table, figi_table.c.asset_uid == fundamental_table.c.asset_uid).
+             where(figi_table.c.asset_uid != "").
+             order_by(update_time.asc().nulls_first(), figi_table.c.asset_uid))
+    if stale_after is not None:
+        query = query.where(update_time.is_(None) | (update_time < datetime.now(timezone.utc) - stale_after))
+    if shards > 1:
+        # abs(hashtext) падает на -2^31, старший бит просто отбрасываем
+        query = query.where(func.hashtext(figi_table.c.asset_uid).op("&")(2147483647) % shards == shard)
+
+    result = await session.execute(query)
+    return [row.asset_uid for row in result.all()]
+
+
+async def fundamentals_updater(stale_after: timedelta | None = None,
+                               shard: int = 0,
+                               shards: int = 1,
+                               assets_per_request: int = FUNDAMENTALS_ASSETS_PER_REQUEST,
+                               concurrency: int = FUNDAMENTALS_CONCURRENCY,
+                               finalize: bool = True):
+    """
+    Массовое обновление фундаментальных показателей: asset_uid пакуются по
+    assets_per_request в один GetAssetFundamentalsRequest, запросы идут
+    параллельно (не более concurrency одновременно) через один клиент,
+    результаты пишутся в fundamental батчами.
+    :param stale_after: обновлять только записи старше, None - все
+    :param shard: номер доли asset_uid для этого воркера из shards
+    :param finalize: пересчитать рейтинги и сбросить кеши; при шардировании
+        делается один раз после всех долей
+    :return: статистика прогона
+    """
+    async with worker_session_maker() as session:
+        asset_uid_list = await get_stale_asset_uids(session, stale_after, shard, shards)
+
+    stats = RefreshStats(assets=len(asset_uid_list))
+    chunks = [asset_uid_list[x:x + assets_per_request] for x in range(0, len(asset_uid_list), assets_per_request)]
+    semaphore = asyncio.Semaphore(concurrency)
+    update_time = datetime.now().astimezone(timezone.utc)
+
+    async def worker(client, chunk):
+        async with semaphore:
+            return await fetch_fundamentals_chunk(client, chunk, stats)
+
+    # лимит брокера общий на токен, делим его между долями только на время прогона:
+    # bucket общий на процесс, и остальным запросам воркера нужен полный лимит
+    bucket = buckets["instruments"]
+    bucket.resize(RATE_LIMITS["instruments"] // shards)
+    try:
+        async with client_pool.client() as client:
+            responses = await asyncio.gather(*(worker(client, chunk) for chunk in chunks))
+    finally:
+        bucket.resize(RATE_LIMITS["instruments"])
+
+    rows = [fundamentals_to_row(statistic, update_time) for response in responses for statistic in response]
+
+    async with worker_session_maker() as session:
+        # история пишется в той же транзакции, что и upsert
+        changed = await changed_rows(session, rows)
+        await write_history(session, changed, await batch(len(HISTORY_METRICS) + 2, len(changed)))
+        await upsert_fundamentals(session, rows)
+    stats.rows = len(rows)
+    stats.changed = len(changed)
+
+    if finalize:
+        await finalize_fundamentals_refresh()
+
+    logger.info(f"fundamentals refresh finished (shard {shard}/{shards}): {stats.report()}")
+    return stats
+
+
+async def prune_fundamentals(retention: timedelta):
+    """
+    Удалить фундаменталы, которые не обновлялись дольше retention,
+    и записи по asset_uid, которых больше нет в figi.
+    """
+    listed = select(figi_table.c.asset_uid).where(figi_table.c.asset_uid == fundamental_table.c.asset_uid)
+    async with worker_session_maker() as session:
+        result = await session.execute(
+            delete(fundamental_table).where(
+                (fundamental_table.c.update_time < datetime.now(timezone.utc) - retention) |
+                ~listed.exists()
+            )
+        )
         await session.commit()
+    logger.info(f"pruned {result.rowcount} stale fundamentals")
+    return result.rowcount
 
 
-async def fundamentals_updater():
-    async with scoped_session() as session:
-        query = select(figi_table.c.asset_uid)
-        result = await session.execute(query)
-
-        result = result.mappings().all()
-        asset_uid_list = list(set([v for share in result for v in share.values()]))
-        for asset_uid in tqdm(asset_uid_list):
-            fundamentals_data = await fundamentals(asset_uid)
-            if not fundamentals_data:
-                continue
-            data = {
-                "asset_uid": asset_uid,
-                "pe_ratio_ttm": fundamentals_data[0].pe_ratio_ttm,
-                "price_to_sales_ttm": fundamentals_data[0].price_to_sales_ttm,
-                "price_to_book_ttm": fundamentals_data[0].price_to_book_ttm,
-                "ev_to_ebitda_mrq": fundamentals_data[0].ev_to_ebitda_mrq,
-                "roe": fundamentals_data[0].roe,
-                "total_debt_to_equity_mrq": fundamentals_data[0].total_debt_to_equity_mrq,
-                "update_time": datetime.now().astimezone(timezone.utc)
-            }
-
-            await upsert_implementation(session, data)
-
-    # todo: delete old data bu update_time, f.e. with delta=day
-
-
-async def upsert_implementation(session, data):
-    stmt = insert(fundamental_table).values(data)
-    stmt = stmt.on_conflict_do_update(
-        index_elements=[fundamental_table.c.asset_uid],
-        set_=data
-    )
-    await session.execute(stmt)
+async def finalize_fundamentals_refresh():
+    await refresh_share_ranking()
+    # API процессы по этому событию сбрасывают кеши и снимок скринера
+    await response_cache.invalidate("fundamentals")
+
+
+async def refresh_share_ranking():
+    """
+    Пересчёт share_ranking - отсортированных списков акций по каждой паре
+    (сектор, показатель). Вызывается после обновления figi и fundamental,
+    читатели во время пересчёта видят предыдущую версию.
+    """
+    async with worker_session_maker() as session:
+        await session.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY share_ranking"))
+        await session.commit()
+
+
+async def upsert_fundamentals(session, rows: list[dict]):
+    """
+    Многострочный upsert в fundamental, размер батча считается через batch().
+    """
+    if not rows:
+        return
+    for start, end in await batch(len(FUNDAMENTAL_COLUMNS), len(rows)):
+        stmt = insert(fundamental_table).values(rows[start:end])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[fundamental_table.c.asset_uid],
+            set_={column: stmt.excluded[column] for column in FUNDAMENTAL_COLUMNS if column != "asset_uid"}
+        )
+        await session.execute(stmt)
     await session.commit()
 
 
-async def get_ticker_by_figi(figi_value: str):
-    async with scoped_session() as s:
-        query = select(figi_table).where(figi_table.c.figi == figi_value)
-        ticker = await s.execute(query)
-        ticker = ticker.mappings().all()
-    return ticker
+_accounts_cache: TTLCache = TTLCache(maxsize=1000, ttl=BROKER_ACCOUNTS_TTL)
+
+
+async def broker_accounts(client, token: str | None = None) -> list:
+    """
+    Открытые счета токена. Список кешируется, чтобы сбор портфеля
+    в обычном случае стоил один параллельный круг get_portfolio.
+    """
+    from tinkoff.invest import AccountStatus
+
+    accounts = _accounts_cache.get(token)
+    if accounts is None:
+        data = await call_broker(client.users.get_accounts, group="users")
+        accounts = [account for account in data.accounts if account.status == AccountStatus.ACCOUNT_STATUS_OPEN]
+        _accounts_cache[token] = accounts
+    return accounts
 
 
-async def get_positions(api_key=None):
+def build_positions(raw_positions: list, instruments: dict[str, dict]) -> tuple[list[dict], dict[str, np.ndarray]]:
     """
-    Получить активные позиции по API_KEY
-    :return:
+    Позиции портфеля в ответ API, одинаковые figi с разных счетов складываются.
+    Денежные поля переводятся одной пачкой в фиксированную точку
+    (money.positions_to_nano), позиции без инструмента в figi пропускаются.
+    :return: (позиции, колонки nano по тем же позициям)
     """
-    async with AsyncClient(TINKOFF_API_KEY) as client:
-        data = await client.users.get_accounts()
-        data_broker = list(filter(lambda x: x.name == "Брокерский счёт", data.accounts))
-        if len(data_broker) > 1:
-            # TODO: do some... :)
-            ...
-        portfolio = await client.operations.get_portfolio(account_id=data_broker[0].id)
+    raw_positions = [position for position in raw_positions if position.figi in instruments]
+    first = {}
+    for position in raw_positions:
+        first.setdefault(position.figi, position)
+    groups = {figi: index for index, figi in enumerate(first)}
+    group = np.fromiter((groups[position.figi] for position in raw_positions), dtype=np.int64,
+                        count=len(raw_positions))
+
+    per_position = positions_to_nano(raw_positions)
+    # dtype=object, если стоимость позиции не влезла в int64 (money.multiply_nano)
+    fixed = {name: np.zeros(len(first), dtype=column.dtype) for name, column in per_position.items()}
+    for name in ("quantity", "expected_yield", "total"):
+        np.add.at(fixed[name], group, per_position[name])
+    # цена у одной бумаги на всех счетах одна
+    fixed["price"][group] = per_position["price"]
+
     positions = []
-    for position in portfolio.positions:
-        ticker = await get_ticker_by_figi(position.figi)
-        if not ticker:
-            continue
-        data = {
-            "quantity": position.quantity.units,
+    for index, position in enumerate(first.values()):
+        ticker = instruments[position.figi]
+        positions.append({
+            "quantity": nano_to_number(fixed["quantity"][index]),
             "figi": position.figi,
-            "current_stock_price": float(f"{position.current_price.units}.{position.current_price.nano}"),
-            "ticker": ticker[0]["ticker"],
-            "name": ticker[0]["name"],
-            "market_class_code": ticker[0]["class_code"],
-            "profit_rub": float(f"{position.expected_yield.units}.{position.expected_yield.nano}"),
+            "current_stock_price": nano_to_float(fixed["price"][index]),
+            "ticker": ticker["ticker"],
+            "name": ticker["name"],
+            "market_class_code": ticker["class_code"],
+            "profit_rub": nano_to_float(fixed["expected_yield"][index]),
             "uid": position.instrument_uid,
-            "asset_uid": ticker[0]["asset_uid"]
-        }
-        data["total_price"] = data["current_stock_price"] * data["quantity"]
-        positions.append(data)
+            "asset_uid": ticker["asset_uid"],
+            "total_price": nano_to_float(fixed["total"][index]),
+        })
+    return positions, fixed
 
-    data = {
-        "details": {
-            "full_active_cost": sum(pos["total_price"] for pos in positions)
-        },
-        "positions": positions
-    }
-    return data
 
-
-async def technical():
+async def fetch_portfolios(tokens: list[str | None], concurrency: int = PORTFOLIO_CONCURRENCY) -> list[tuple]:
     """
-    Технические индикаторы
-
-    :return:
+    Портфели всех открытых счетов всех токенов. Запросы идут параллельно
+    (не более concurrency одновременно), счёт, доступный по двум токенам, берётся один раз.
+    :return: [(счёт, ответ get_portfolio)]
     """
-    async with AsyncClient(TINKOFF_API_KEY) as client:
-        # a = await client.instruments.share_by(id_type=1, id='BBG006L8G4H1')
+    semaphore = asyncio.Semaphore(concurrency)
 
-        from datetime import datetime
-        share = await client.instruments.share_by(id_type=1, id='BBG006L8G4H1')
+    async def portfolio(client, account):
+        async with semaphore:
+            return account, await call_broker(lambda: client.operations.get_portfolio(account_id=account.id),
+                                              group="operations")
 
-        req = GetTechAnalysisRequest(indicator_type=IndicatorType.INDICATOR_TYPE_RSI,
-                                     instrument_uid=share.instrument.uid,
-                                     from_=datetime.fromtimestamp(1709774073),
-                                     to=datetime.now(),
-                                     interval=IndicatorInterval.INDICATOR_INTERVAL_10_MIN,
-                                     type_of_price=TypeOfPrice.TYPE_OF_PRICE_CLOSE,
-                                     length=10,
-                                     deviation=Deviation(deviation_multiplier=Quotation(units=10, nano=10)),
-                                     smoothing=Smoothing(fast_length=12, slow_length=26, signal_smoothing=9)
-                                     )
+    async def token_portfolios(token):
+        async with client_pool.client(token) as client:
+            accounts = await broker_accounts(client, token)
+            return await asyncio.gather(*(portfolio(client, account) for account in accounts))
 
-        a = await client.market_data.get_tech_analysis(request=req)
+    results = await asyncio.gather(*(token_portfolios(token) for token in dict.fromkeys(tokens)))
+    unique = {}
+    for account, response in (item for result in results for item in result):
+        unique.setdefault(account.id, (account, response))
+    return list(unique.values())
 
-        pp(a)
 
-
-async def fundamentals(asset_uid, try_number=0):
+async def get_positions(api_key=None, tokens: list[str] | None = None):
     """
-    фундаментальные показатели
-    :return:
+    Активные позиции по всем счетам токена api_key (по умолчанию TINKOFF_API_KEY)
+    или сразу нескольких токенов tokens.
+    :return: позиции, сложенные по figi, общая стоимость и стоимость по каждому счёту
     """
-    if try_number == 3:
-        logger.error("something wrong, 3 tries over")
-        return
+    portfolios = await fetch_portfolios(tokens or [api_key])
+    instruments = await instrument_index.resolve_figis(
+        [position.figi for _, portfolio in portfolios for position in portfolio.positions]
+    )
+    positions, fixed = build_positions(
+        [position for _, portfolio in portfolios for position in portfolio.positions], instruments
+    )
 
-    async with AsyncClient(TINKOFF_API_KEY) as client:
-        try:
-            result = await client.instruments.get_asset_fundamentals(GetAssetFundamentalsRequest(assets=[asset_uid]))
-            return result.fundamentals
+    accounts = []
+    for account, portfolio in portfolios:
+        _, account_fixed = build_positions(portfolio.positions, instruments)
+        accounts.append({
+            "account_id": account.id,
+            "name": account.name,
+            "full_active_cost": nano_to_float(sum_nano(account_fixed["total"])),
+        })
 
-        except AioRequestError as error:
+    data = {
+        "details": {
+            "full_active_cost": nano_to_float(sum_nano(fixed["total"]))
+        },
+        "accounts": accounts,
+        "positions": positions
+    }
+    return data
 
-            if error.code == StatusCode.NOT_FOUND:
-                return
 
-            if error.code == StatusCode.RESOURCE_EXHAUSTED:
-                logger.info(f"available requests exhausted, wait {error.metadata.ratelimit_reset} sec")
-                await asyncio.sleep(error.metadata.ratelimit_reset + 0.5)
-                try_number += 1
-                await fundamentals(asset_uid, try_number)
+async def fundamentals(asset_uids: list[str]) -> list:
+    """
+    Фундаментальные показатели по списку asset_uid одним запросом.
+    :return: список StatisticResponse, [] если брокер их не знает
+    :raises BrokerUnavailable: брокер недоступен (circuit breaker открыт)
+    """
+    from tinkoff.invest.schemas import GetAssetFundamentalsRequest
+    from tinkoff.invest.exceptions import AioRequestError
 
-        except Exception as e:
-            logger.error(f"Unrecognized error {e}")
-            return
+    async with client_pool.client() as client:
+        try:
+            result = await call_broker(
+                lambda: client.instruments.get_asset_fundamentals(GetAssetFundamentalsRequest(assets=asset_uids))
+            )
+        except AioRequestError as error:
+            if error.code == StatusCode.NOT_FOUND:
+                return []
+            raise
+    return result.fundamentals
 
 
 async def fundamentals_filter(shares_list: list[RowMapping]):
-    uids = []
-    print(len(shares_list))
-    for ind, share in enumerate(shares_list):
-        uids.append(share["asset_uid"])
-    # uids = ['f38554e3-991b-4a7e-8433-b8b22af20e2e', 'f23101b4-d088-40c5-a4fb-f7b57d6d8579', '302fedfd-cba9-4c71-92b8-2141fafb2206', '0294caae-bcfe-4988-8f7d-0c6b0d21da96', '56e205f0-d4b5-41f9-a628-b32cc75761b5', '9893c8b6-451d-4d5c-ab30-00 5e1a08685a', 'd7333221-9f0e-44c7-ae46-68db907df52f', 'c228f2a9-30fe-41a7-91d1-1b3178cc55ce', '2213a2b9-efbb-4882-a0da-b4057095b949', '29b0cb42-0523-4695-88b3-5be935cc79b6', '644919d5-b2d7-43f5-94da-6ddc3f59e89d', '45aeefa1-5da7- 4591-9138-14c60e2207a8', 'cc314b75-fdb8-4357-8fa6-212a28d9f5cc', '09cb3d96-ad1a-42cd-8189-e905c1dee9bd', 'de2695aa-7c6b-4258-a2c2-1cda46a66bb0', '7014e94d-e029-4a66-9764-8aad5ebed2f0', 'bd420453-642c-4659-8ceb-b3c937c633ef', '0d 248d75-e945-4432-b66b-9d52db845f18', 'a6406d6f-a99c-421d-8e02-28ff459ba6ec', 'f6245a09-c759-401e-9ce5-8940f6fd03d7', '5ab96097-e550-4f39-803b-ec4d613c86e9', '42df7b99-1eb5-4f5e-b3a9-389077f7b32b', 'b647e8d7-46de-4f29-bb5a-a1e594 063b2d', 'c0fe5f6a-9f3c-49b4-b55e-05ea216a3591', 'ae6d35f1-d00e-467a-9cd4-ea014bf59e35', 'eeb20996-130c-488b-9b84-0c87ab87d6e8', 'c5a8a9c2-e7ef-46aa-9ae9-299ac9bddf97', '2131a331-8f5c-4d77-98d2-03766b7da76d', '4721cad5-1f0b-4568 -bb76-29bce6c30d09', '2c3eb30c-7769-49fa-918a-6faa1de09fb2', 'b08e7d37-f2cc-4c54-a3a1-a6d704af79da', '5f274cd8-82a2-4e76-9ea1-32c1a0bcb35d', 'a2e2c08b-b477-44a7-a86d-671925eedd81', '95ed74b8-29f0-4f1e-8547-f5eff1669cb3', 'fc2cfd 46-de14-41d6-b40c-70c9d825ffc3', '6474a6b8-91d1-4073-9296-ed63e476ea63', '0111e04b-f72c-48b6-86a3-ae3c8386b9f4', 'ee36e9c2-150a-4b3f-a8d6-8363cdcaae3d', 'f12b5aa9-6a18-4083-a427-8cbd1ae57375', 'ba426f3a-3489-4011-9884-8ac8d332b2 1f', '2abaa5d7-bbbc-4290-b615-deb71ebe5d34', 'a675f47a-30d2-4547-ba73-89fc38161802', '359437db-6282-4afe-a14e-e970ebd46548', '6f4daabf-3fe7-4a61-960e-30dd13fc2bc1', 'fe8d49a4-3321-449b-bd08-02efbac878fe', 'ca30c58b-7fe1-4f62-b86 7-890d1da27f71', 'f26bf959-46e3-4cb8-a931-f42b29af771e', '8da3a687-6e16-4042-9426-2951bf39ba71', 'e27bce44-4411-4e65-9aa7-e2346810af62', 'c8c7634c-b3cf-4a5d-81d8-2a26fd4acc8b', 'd0be351e-8fd3-4246-8b8d-5227b6d02a64', 'b5f712dc-1 c29-4456-b7b0-bc078da0fbe7', '7116c2c1-4ea7-4e62-9388-4bf6953b8421', 'aabc6dd3-1485-4e60-9f75-504b29955dcf', '18db1f5d-44c5-4d81-ad50-24a75f145807', '274bb3f4-3694-4e75-953d-093645b5a8d5', '92ad8b41-a201-4b1b-93cc-dac5fc9c1a6c', '31e26969-afe4-4ae7-ae41-97aeb6700a58', '6adb85f1-45e1-4991-b1c2-effa2844930c', '10f22986-8676-430b-aa06-e447ed166019', 'e841731c-5139-46ad-9a38-74de3286111a', '9d96907e-fa9c-4ff2-9c55-a1308f2713ef', 'a4ad7065-b11b-472d-920d-5a 91a7bd2e4b', '56f63236-214f-4a6b-aeda-c0708a6bdf97', 'c49d95bd-0d22-4199-9366-2df079115ba1', '50885683-e22d-427d-851d-12a9d8bb8042', '6b7385a4-95f4-4bd7-b979-b1cdae283bbf', '7d85059e-8d5d-4095-8d47-caa9aed076d2', 'da3b178d-1c71- 4fbc-81fc-ef6aa9926dbb', '015cea6c-1eb1-4104-98d7-5aece584da7e', 'd6375d52-90e1-434b-90fc-857cf13fe886', 'fff2e4e6-c833-4c1c-b534-76eee85a2690', '41e68af5-54b0-483c-a417-5b85458daeea', '9d9adb56-2235-488f-aead-7f34c696156f', 'ff 1a4ab7-8f50-49b7-91c8-b8b4c46996f6', 'e53c5dfc-11b3-4412-8cc6-b64b1e85929a', '2e38ded5-8510-4592-8fb4-5e48d85dadda', '0ea8e619-c8d2-47c5-8737-9e175dd2c7ae', '19a10303-cd20-48d3-ac01-3daacbf34c37', 'd1dc11b2-2e42-479f-a82f-2d37ce 0942af', '0d9d9375-3ca1-417c-8f77-378af0b581ed', '0d02ede1-cbaa-4da2-9dbd-650beb619999', '48cdfa02-db5c-4297-a853-d3d1e21cf8ae', '77b111a2-2a75-4f92-b130-9fbf8924b8da', '798d25f1-71e8-4105-bd2b-78e47359a2c1', 'c4fca878-fa7d-4db5 -84d1-4c3f8b1fbe27', 'b47831a7-e8ed-44eb-913f-1492a2708386', 'b23bfb81-94c2-4e08-9d81-8dfb37231cdf', '078500bf-38a9-4387-8750-28cd5dbc909e', 'eaf3c6a4-4d05-4698-aac1-ba9bf8ac02f7', '15a2656f-9105-4520-877f-c81e7a8d028b', 'e83b24 95-f461-49d2-9f20-b736a197f655', '2946b587-cc32-419d-9ff0-a7e959c916d5', 'f7ebb244-2fee-48f4-b05c-cf470f98a86a', '8e66a612-ce91-4eda-946b-2c15129f8036', 'bdff2b97-ac83-46da-87f2-7d065a57e7f5', '18a3c96d-827e-40b4-82b6-cb9a2ca42867', '7fe69b86-1095-48e9-91b9-ca7f742cc977', 'e520461a-87f0-4422-b2fe-9b1b577a85a4', 'b59fd4cd-a098-48a9-b4d9-b3180013b96b']
-    # uids = ['4203f66a-32e6-46e3-8f44-805aad16d28b', '2c7be540-a8de-4339-89a6-83621f0ea12c', 'f169ac12-2376-4001-9008-abddfbdabb5f', 'fa0d05e7-f8fd-4c67-8030-6961227e6095', 'd2d1e10b-ba5d-4a29-92d2-8572fcceeff9']
-    print(len(uids))
-    fundamentals_share = await fundamentals(uids)
-    print(len(fundamentals_share))
-    for i in range(len(shares_list)):
-        data = dict(shares_list[i])
-        data["fundamentals"] = fundamentals_share[i]
-        shares_list[i] = data
-
-    # todo: sorting/filtering by fund fields
+    uids = list(dict.fromkeys(share["asset_uid"] for share in shares_list))
+    by_uid = {}
+    for start in range(0, len(uids), FUNDAMENTALS_ASSETS_PER_REQUEST):
+        for statistic in await fundamentals(uids[start:start + FUNDAMENTALS_ASSETS_PER_REQUEST]):
+            by_uid[statistic.asset_uid] = statistic
+    # брокер отдаёт только найденные asset_uid и не обязательно в порядке запроса
+    shares_list = [{**share, "fundamentals": by_uid.get(share["asset_uid"])} for share in shares_list]
+
+    # сортировка/фильтрация по показателям - см. /fonds/screen
 
     return shares_list
 
 
 async def test():
+    from tinkoff.invest import InstrumentStatus
+
     sectors = []
-    async with AsyncClient(TINKOFF_API_KEY) as client:
+    async with client_pool.client() as client:
         s = await client.instruments.shares(instrument_status=InstrumentStatus.INSTRUMENT_STATUS_ALL)
     for i in s.instruments:
         if i.sector not in sectors:
@@ -251,7 +503,7 @@ async def test():
 
 
 async def test2():
-    async with AsyncClient(TINKOFF_API_KEY) as client:
+    async with client_pool.client() as client:
         s = await client.instruments.share_by(id_type=3, id='aab18c37-e7d1-43e0-a17e-7ba89ae01ecd')
         pp(s.instrument)
         s = await client.instruments.share_by(id_type=3, id='b71bd174-c72c-41b0-a66f-5f9073e0d1f5')
@@ -261,6 +513,7 @@ async def test2():
 
 
 if __name__ == "__main__":
+    # по расписанию запускаются из celery beat, см. src/tasks/tasks.py
     # asyncio.run(figi_updater())
     asyncio.run(fundamentals_updater())
     # asyncio.run(fundamentals())
@@ -1,17 +1,44 @@
-from fastapi import FastAPI
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app
 from redis import asyncio as aioredis
 
+from src.auth.cache import user_cache
 from src.auth.config import auth_backend, fastapi_users
 from src.auth.schemas import UserRead, UserCreate
+from src.cache import response_cache
+from src.config import REDIS_URL
 from src.tasks.router import router as tasks_router
 from src.fonds.router import router as fonds_router
+from src.fonds.client import client_pool
+from src.fonds.index import instrument_index
+from src.fonds.live import live_portfolios
+from src.fonds.resilience import BrokerUnavailable
+from src.fonds.screener import screener_snapshot
+from src.fonds.technical import technical_engine
+from src.monitoring import loop_monitor, current_route, route_template
 
 
 app = FastAPI(title="just a API")
 app.include_router(tasks_router)
 app.include_router(fonds_router)
+app.mount("/metrics", make_asgi_app())
+
+
+@app.middleware("http")
+async def route_context(request: Request, call_next):
+    # метрики запросов к БД размечаются шаблоном маршрута. scope["route"] выставит
+    # роутер уже внутри call_next, в другом контексте, поэтому сопоставляем здесь
+    current_route.set(route_template(app.router.routes, request.scope))
+    return await call_next(request)
+
+
+@app.exception_handler(BrokerUnavailable)
+async def broker_unavailable(request: Request, exc: BrokerUnavailable):
+    # circuit breaker открыт - отвечаем сразу, не дожидаясь таймаутов брокера
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(int(exc.retry_after))})
+
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend),
@@ -28,5 +55,23 @@ app.include_router(
 
 @app.on_event("startup")
 async def startup_event():
-    redis = aioredis.from_url("redis://localhost", encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    redis = aioredis.from_url(REDIS_URL, encoding="utf8", decode_responses=True)
+    await response_cache.start(redis)
+    response_cache.subscribe("instruments", instrument_index.invalidate)
+    response_cache.subscribe("fundamentals", screener_snapshot.invalidate)
+    # в снимке и данные figi: сектор, торгуемость, исключённые из листинга инструменты
+    response_cache.subscribe("instruments", screener_snapshot.invalidate)
+    response_cache.subscribe("candles", technical_engine.invalidate)
+    await user_cache.start(redis)
+    await client_pool.start()
+    await live_portfolios.start()
+    await loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await loop_monitor.stop()
+    await user_cache.close()
+    await response_cache.close()
+    await live_portfolios.close()
+    await client_pool.close()
@@ -0,0 +1,125 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+import traceback
+
+from loguru import logger
+from prometheus_client import Histogram, Counter, Gauge
+from starlette.routing import Match
+
+from src.config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+
+loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "Задержка event loop относительно ожидаемого пробуждения",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+loop_stalls_total = Counter(
+    "event_loop_stalls_total",
+    "Сколько раз event loop был заблокирован дольше порога",
+)
+
+# эндпоинт текущего запроса, выставляется middleware в main.py
+current_route = contextvars.ContextVar("current_route", default="background")
+# метка для путей, не совпавших ни с одним маршрутом (404, сканеры)
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(routes, scope) -> str:
+    """
+    Шаблон маршрута запроса (/fonds/tokens/{index}), а не сырой путь:
+    метка метрики не должна плодить ряды на каждый id и случайный 404.
+    """
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or UNMATCHED_ROUTE
+
+
+db_pool_checkout_wait_seconds = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание свободного соединения в пуле",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+db_pool_in_use = Gauge(
+    "db_pool_in_use_connections",
+    "Выданные из пула соединения",
+    ["engine"],
+)
+db_queries_total = Counter(
+    "db_queries_total",
+    "Запросы к БД по эндпоинтам",
+    ["engine", "route"],
+)
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения запросов к БД по эндпоинтам",
+    ["engine", "route"],
+)
+
+
+class LoopLagMonitor:
+    """
+    Следит за здоровьем event loop.
+    Корутина-пульс просыпается каждые interval секунд и пишет в гистограмму,
+    на сколько опоздала. Отдельный поток-сторож смотрит на время последнего
+    пульса и, если loop молчит дольше threshold, логирует стек потока loop -
+    там и будет блокирующий вызов (time.sleep, smtplib и т.п.).
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._pulse())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _pulse(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            loop_lag_seconds.observe(max(0.0, now - expected))
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+            # про одно зависание пишем один раз
+            reported = heartbeat
+            loop_stalls_total.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning(f"event loop blocked for more than {stalled:.3f} sec:\n{stack}")
+
+
+loop_monitor = LoopLagMonitor()
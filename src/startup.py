@@ -0,0 +1,102 @@
+"""
+Профиль холодного старта API процесса: что и сколько импортируется
+и через сколько после запуска интерпретатора отвечает первый запрос.
+
+    python -m src.startup                  # отчёт
+    python -m src.startup --budget 1500    # код выхода 1, если старт дольше бюджета (для CI)
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from src.config import STARTUP_BUDGET_MS
+
+# корень проекта: проба запускается как модуль src.startup_probe
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """
+    Строки вывода python -X importtime.
+    :return: [(модуль, собственное время мкс, с вложенными импортами мкс)]
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_startup(path: str = "/metrics/") -> dict:
+    """
+    Запустить API в новом процессе и снять времена старта.
+    Lifespan (Redis, пул брокера) не запускается - меряются импорты и сборка приложения.
+    :param path: эндпоинт первого запроса, по умолчанию не требующий БД и авторизации
+    """
+    spawned = time.time()
+    # проба в отдельном процессе, чтобы все импорты были холодными
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "src.startup_probe", path],
+                            capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(f"startup probe failed:\n{result.stderr[-2000:]}")
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    modules = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    # модули проекта с вложенными импортами - кто тянет тяжёлые зависимости
+    project = {name: cumulative for name, _, cumulative in modules if name.startswith("src.")}
+
+    return {
+        "interpreter_ms": (probe["imports_started"] - spawned) * 1000,
+        "import_ms": (probe["imported"] - probe["imports_started"]) * 1000,
+        "first_request_ms": (probe["responded"] - probe["imported"]) * 1000,
+        "cold_start_ms": (probe["responded"] - spawned) * 1000,
+        "status": probe["status"],
+        "modules": probe["modules"],
+        "packages_ms": {name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: -item[1])},
+        "project_ms": {name: us / 1000 for name, us in sorted(project.items(), key=lambda item: -item[1])},
+    }
+
+
+def print_report(report: dict, top: int):
+    print(f"interpreter start   {report['interpreter_ms']:8.1f} ms")
+    print(f"import src.main     {report['import_ms']:8.1f} ms  ({report['modules']} modules)")
+    print(f"first request       {report['first_request_ms']:8.1f} ms  (status {report['status']})")
+    print(f"cold start          {report['cold_start_ms']:8.1f} ms")
+    print(f"\ntop packages by own import time:")
+    for name, ms in list(report["packages_ms"].items())[:top]:
+        print(f"  {name:<40}{ms:8.1f} ms")
+    print(f"\nproject modules with nested imports:")
+    for name, ms in list(report["project_ms"].items())[:top]:
+        print(f"  {name:<40}{ms:8.1f} ms")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS, help="бюджет холодного старта, мс")
+    parser.add_argument("--path", default="/metrics/", help="эндпоинт первого запроса")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    report = profile_startup(args.path)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
+
+    if report["cold_start_ms"] > args.budget:
+        print(f"\ncold start {report['cold_start_ms']:.0f} ms is over budget {args.budget:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Проба холодного старта для src.startup: импорт приложения и первый запрос
+в чистом процессе. Запускается только как python -m src.startup_probe <path>.
+"""
+import asyncio
+import json
+import sys
+import time
+
+
+async def first_request(app, path: str) -> int:
+    """
+    Один GET через ASGI без сервера и lifespan.
+    :return: HTTP статус ответа
+    """
+    messages, requests = [], [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # клиент не отключается, пока ответ не отправлен
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "headers": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80)}
+    await app(scope, receive, send)
+    return next(message["status"] for message in messages if message["type"] == "http.response.start")
+
+
+def main(path: str):
+    imports_started = time.time()
+    from src.main import app
+    imported = time.time()
+
+    status = asyncio.run(first_request(app, path))
+    print(json.dumps({"imports_started": imports_started, "imported": imported,
+                      "responded": time.time(), "status": status, "modules": len(sys.modules)}))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,30 @@
+from celery import Celery
+
+from src.config import (
+    FIGI_REFRESH_INTERVAL, FUNDAMENTALS_REFRESH_INTERVAL, CANDLES_REFRESH_INTERVAL, CANDLES_HOUR_REFRESH_INTERVAL
+)
+
+# только приложение и расписание: API процесс ставит задачи по имени через send_task
+# и не импортирует src.tasks.tasks с обновлениями рыночных данных, SDK брокера и SMTP
+celery = Celery('tasks', broker='redis://localhost:6379', backend='redis://localhost:6379',
+                include=['src.tasks.tasks'])
+celery.conf.beat_schedule = {
+    "refresh-figi": {
+        "task": "src.tasks.tasks.refresh_figi",
+        "schedule": FIGI_REFRESH_INTERVAL,
+    },
+    "refresh-fundamentals": {
+        "task": "src.tasks.tasks.refresh_fundamentals",
+        "schedule": FUNDAMENTALS_REFRESH_INTERVAL,
+    },
+    "refresh-candles": {
+        "task": "src.tasks.tasks.refresh_candles",
+        "schedule": CANDLES_REFRESH_INTERVAL,
+        "args": ("day",),
+    },
+    "refresh-candles-hour": {
+        "task": "src.tasks.tasks.refresh_candles",
+        "schedule": CANDLES_HOUR_REFRESH_INTERVAL,
+        "args": ("hour",),
+    },
+}
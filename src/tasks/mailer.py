@@ -0,0 +1,127 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.message import EmailMessage
+
+import aiosmtplib
+from loguru import logger
+
+from src.config import (
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_USE_TLS,
+    SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_MAX_TRIES
+)
+
+SMTP_BACKOFF_MAX = 60
+
+
+@dataclass
+class PooledSMTP:
+    smtp: aiosmtplib.SMTP
+    sent: int = 0
+
+
+class SMTPPool:
+    """
+    Пул постоянных SMTP соединений одного воркера: TLS и логин делаются один раз
+    на соединение, дальше по нему уходит до max_messages писем подряд.
+    Соединение привязано к event loop, поэтому пул создаётся на каждый loop.
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 max_tries: int = SMTP_MAX_TRIES,
+                 hostname: str = SMTP_HOST, port: int = SMTP_PORT, use_tls: bool = SMTP_USE_TLS):
+        self.hostname = hostname
+        self.port = port
+        self.use_tls = use_tls
+        self.size = size
+        self.max_messages = max_messages
+        self.max_tries = max_tries
+        self._idle: list[PooledSMTP] = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def _connect(self) -> PooledSMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls)
+        await smtp.connect()
+        if SMTP_USER and SMTP_PASSWORD:
+            await smtp.login(SMTP_USER, SMTP_PASSWORD)
+        return PooledSMTP(smtp)
+
+    async def _acquire(self) -> PooledSMTP:
+        while self._idle:
+            pooled = self._idle.pop()
+            if pooled.smtp.is_connected:
+                return pooled
+        return await self._connect()
+
+    async def _discard(self, pooled: PooledSMTP):
+        try:
+            await pooled.smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            pooled.smtp.close()
+
+    async def _release(self, pooled: PooledSMTP):
+        if pooled.smtp.is_connected and pooled.sent < self.max_messages:
+            self._idle.append(pooled)
+        else:
+            await self._discard(pooled)
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._semaphore:
+            pooled = await self._acquire()
+            try:
+                yield pooled.smtp
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                # сервер отказал по конкретному письму, само соединение живо
+                await self._release(pooled)
+                raise
+            except BaseException:
+                await self._discard(pooled)
+                raise
+            pooled.sent += 1
+            await self._release(pooled)
+
+    async def send(self, message: EmailMessage) -> bool:
+        """
+        Отправка одного письма с экспоненциальной задержкой и джиттером
+        на временных ошибках (4xx, обрыв соединения). 5xx - сразу отказ.
+        """
+        for try_number in range(self.max_tries):
+            try:
+                async with self.connection() as smtp:
+                    await smtp.send_message(message)
+                return True
+
+            except aiosmtplib.SMTPRecipientsRefused as error:
+                if all(recipient.code >= 500 for recipient in error.recipients):
+                    logger.error(f"recipient {message['To']} refused: {error}")
+                    return False
+
+            except aiosmtplib.SMTPResponseException as error:
+                if error.code >= 500:
+                    logger.error(f"message to {message['To']} rejected: {error.code} {error.message}")
+                    return False
+
+            except (aiosmtplib.SMTPException, OSError) as error:
+                logger.info(f"smtp connection error: {error}")
+
+            delay = min(SMTP_BACKOFF_MAX, 2 ** try_number) + random.uniform(0, 1)
+            await asyncio.sleep(delay)
+
+        logger.error(f"message to {message['To']} not sent, {self.max_tries} tries over")
+        return False
+
+    async def send_batch(self, messages: list[EmailMessage]) -> dict:
+        """
+        Разослать пачку писем; не более size соединений одновременно,
+        каждое соединение отправляет письма одно за другим.
+        """
+        results = await asyncio.gather(*(self.send(message) for message in messages))
+        failed = [message["To"] for message, ok in zip(messages, results) if not ok]
+        return {"sent": len(messages) - len(failed), "failed": failed}
+
+    async def close(self):
+        while self._idle:
+            await self._discard(self._idle.pop())
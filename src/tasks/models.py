@@ -1,4 +1,4 @@
-from sqlalchemy import MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey
+from sqlalchemy import MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey, Index
 
 from src.auth.models import user
 
@@ -7,8 +7,10 @@ metadata = MetaData()
 task = Table(
     "task",
     metadata,
+    Column("id", Integer, primary_key=True),
     Column("name", String, nullable=False),
     Column("description", String),
-    Column("user_id", Integer, ForeignKey(user.c.id))
+    Column("user_id", Integer, ForeignKey(user.c.id)),
+    Index("ix_task_user_id_id", "user_id", "id"),
 )
 
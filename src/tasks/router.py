@@ -1,18 +1,16 @@
-import time
-
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 
 from src.auth.models import User
 from src.tasks.schemas import TaskAdd
 from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_cache.decorator import cache
-from celery.result import AsyncResult
 
+from src.cache import cached, response_cache
 from src.database import get_async_session
+from src.pagination import encode_cursor, decode_cursor
 from src.tasks.models import task as task_table
 from src.auth.config import current_user
-from src.tasks.tasks import send_email_report, test_celery_my
+from src.tasks.app import celery
 
 router = APIRouter(
     prefix="/tasks",
@@ -31,34 +29,46 @@ async def add_task(
     statement = insert(task_table).values(**data)
     await session.execute(statement)
     await session.commit()
+    await response_cache.invalidate(f"tasks:{user.id}")
     return {"status": "success"}
 
 
 @router.get("")
-@cache(expire=30)
-async def get_tasks(session: AsyncSession = Depends(get_async_session), user: User = Depends(current_user)):
-    time.sleep(5)
+@cached(lambda user, **_: f"tasks:{user.id}", lambda limit, cursor, **_: (limit, cursor), ttl=30)
+async def get_tasks(
+        limit: int = Query(50, ge=1, le=500),
+        cursor: str | None = None,
+        session: AsyncSession = Depends(get_async_session),
+        user: User = Depends(current_user)
+):
     query = select(task_table).where(task_table.c.user_id == user.id)
+    if cursor is not None:
+        last_id, = decode_cursor(cursor, 1)
+        query = query.where(task_table.c.id > last_id)
+    query = query.order_by(task_table.c.id).limit(limit)
+
     tasks = await session.execute(query)
-    return tasks.mappings().all()
+    items = tasks.mappings().all()
+    next_cursor = encode_cursor(items[-1]["id"]) if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/report")
 async def get_report(user: User = Depends(current_user)):
-    send_email_report.delay(user.id)
+    celery.send_task("src.tasks.tasks.send_email_report", args=[user.id])
     return {"status": 200, "data": "The email has been sent."}
 
 
 @router.get("/test_celery")
 async def test_celery(data: str):
-    task = test_celery_my.delay(data)
+    task = celery.send_task("src.tasks.tasks.test_celery_my", args=[data])
 
     return {"status": "10", "task": task.id}
 
 
 @router.get("/check_task")
 async def test_celery(task_id: str):
-    res = AsyncResult(task_id)
+    res = celery.AsyncResult(task_id)
 
     return {"task_id": task_id, "state": res.ready(), "result": res.result}
 
@@ -1,23 +1,136 @@
-import smtplib
 import asyncio
+import threading
 import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
 from email.message import EmailMessage
-from celery import Celery
+from celery import chord
+from celery.signals import worker_process_init, worker_process_shutdown
+from loguru import logger
+from redis import Redis
+from redis.exceptions import LockError
+from redis.lock import Lock
 from sqlalchemy import select
 
-from src.config import SMTP_PASSWORD, SMTP_HOST, SMTP_PORT, SMTP_USER
+from src.config import (
+    SMTP_USER, REDIS_URL, FUNDAMENTALS_STALE_AFTER, FUNDAMENTALS_RETENTION, FUNDAMENTALS_SHARDS, TASK_LOCK_TIMEOUT
+)
+from src.fonds.client import client_pool
+from src.fonds.utils import figi_updater, fundamentals_updater, prune_fundamentals, finalize_fundamentals_refresh
+from src.fonds.models import CandlesInterval
+from src.fonds.technical import candles_updater
+from src.tasks.app import celery
+from src.tasks.mailer import SMTPPool
 from src.tasks.models import task as task_table
 from src.auth.models import user as user_table
-from src.database import scoped_session
+from src.database import worker_session_maker
 
-celery = Celery('tasks', broker='redis://localhost:6379', backend='redis://localhost:6379')
-loop = asyncio.get_event_loop()
+# свой event loop и SMTP пул на каждый поток воркера (prefork и threads)
+_worker_state = threading.local()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    loop = getattr(_worker_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _worker_state.loop = loop
+        _worker_state.mailer = SMTPPool()
+    return loop
+
+
+def run_in_worker_loop(coro):
+    return get_worker_loop().run_until_complete(coro)
+
+
+def get_mailer() -> SMTPPool:
+    get_worker_loop()
+    return _worker_state.mailer
+
+
+@worker_process_init.connect
+def reset_worker_state(**kwargs):
+    # после fork не наследуем loop родителя
+    global _worker_state
+    _worker_state = threading.local()
+
+
+@worker_process_shutdown.connect
+def close_worker_state(**kwargs):
+    loop = getattr(_worker_state, "loop", None)
+    if loop is None or loop.is_closed():
+        return
+    loop.run_until_complete(_worker_state.mailer.close())
+    # каналы брокера этого loop (client_pool держит свои на каждый loop)
+    loop.run_until_complete(client_pool.close())
+    loop.close()
+
+
+def _task_lock(name: str, token: str | None = None) -> Lock:
+    lock = Redis.from_url(REDIS_URL).lock(f"task-lock:{name}", timeout=TASK_LOCK_TIMEOUT,
+                                          blocking=False, thread_local=False)
+    if token is not None:
+        lock.local.token = token
+    return lock
+
+
+class LockHeartbeat(threading.Thread):
+    """
+    Продлевает блокировки, пока задача работает: TTL короткий, чтобы блокировка
+    упавшего воркера быстро освобождалась, а долгий прогон её не терял.
+    """
+
+    def __init__(self, locks: list[Lock]):
+        super().__init__(daemon=True)
+        self.locks = locks
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(TASK_LOCK_TIMEOUT / 3):
+            for lock in self.locks:
+                try:
+                    lock.reacquire()
+                except LockError as e:
+                    logger.error(f"task lock {lock.name} is lost: {e}")
+
+
+@contextmanager
+def task_lock(name: str, release: bool = True, hold: tuple = ()):
+    """
+    Redis блокировка, чтобы два запуска одной задачи не шли одновременно.
+    Отдаёт токен блокировки или None, если она уже занята.
+    :param release: False - блокировка остаётся после выхода (кроме ошибки),
+        её снимает release_task_lock по токену
+    :param hold: (имя, токен) чужих блокировок, которые продлеваются вместе с этой
+    """
+    lock = _task_lock(name)
+    if not lock.acquire(token=uuid.uuid4().hex):
+        yield None
+        return
+    heartbeat = LockHeartbeat([lock, *(_task_lock(other, token) for other, token in hold if token)])
+    heartbeat.start()
+    failed = True
+    try:
+        yield lock.local.token.decode()
+        failed = False
+    finally:
+        heartbeat.stopped.set()
+        if release or failed:
+            lock.release()
+
+
+def release_task_lock(name: str, token: str):
+    try:
+        _task_lock(name, token).release()
+    except LockError:
+        # истекла или уже снята - следующий запуск её просто возьмёт
+        logger.info(f"task lock {name} is already released")
 
 
 def get_email_template(username: str, email: str, tasks: list):
     email_template = EmailMessage()
     email_template['Subject'] = 'test'
-    email_template['From'] = SMTP_USER
+    email_template['From'] = SMTP_USER or 'reports@localhost'
     email_template['To'] = email
 
     email_template.set_content(
@@ -29,24 +142,114 @@ def get_email_template(username: str, email: str, tasks: list):
     return email_template
 
 
-async def get_tasks(user_id: int):
-    async with scoped_session() as s:
-        query = select(task_table).where(task_table.c.user_id == user_id)
-        tasks = await s.execute(query)
-        tasks = tasks.mappings().all()
-        query = select(user_table).where(user_table.c.id == user_id)
-        user_data = await s.execute(query)
-        user_data = user_data.mappings().all()[0]
+async def get_reports(user_id: int | None = None) -> list[EmailMessage]:
+    """
+    Письма с задачами пользователей; пользователи и задачи берутся одним запросом.
+    :param user_id: только для этого пользователя, None - для всех активных
+    """
+    query = (select(user_table.c.id.label("uid"), user_table.c.username, user_table.c.email, task_table).
+             select_from(user_table).
+             outerjoin(task_table, task_table.c.user_id == user_table.c.id).
+             order_by(user_table.c.id, task_table.c.id))
+    if user_id is not None:
+        query = query.where(user_table.c.id == user_id)
+    else:
+        query = query.where(user_table.c.is_active == True)
+
+    async with worker_session_maker() as s:
+        rows = (await s.execute(query)).mappings().all()
+
+    users = {}
+    for row in rows:
+        report = users.setdefault(row["uid"], {"username": row["username"], "email": row["email"], "tasks": []})
+        if row["id"] is not None:
+            report["tasks"].append({column: row[column] for column in task_table.c.keys()})
+
+    return [get_email_template(report["username"], report["email"], report["tasks"]) for report in users.values()]
 
-    email_schema = get_email_template(user_data['username'], user_data['email'], tasks)
-    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        server.send_message(email_schema)
+
+async def send_reports(user_id: int | None = None) -> dict:
+    messages = await get_reports(user_id)
+    result = await get_mailer().send_batch(messages)
+    logger.info(f"email reports: {result['sent']} sent, {len(result['failed'])} failed")
+    return result
 
 
 @celery.task
 def send_email_report(user_id: int):
-    loop.run_until_complete(get_tasks(user_id))
+    return run_in_worker_loop(send_reports(user_id))
+
+
+@celery.task
+def send_email_report_all():
+    return run_in_worker_loop(send_reports())
+
+
+@celery.task
+def refresh_figi():
+    with task_lock("refresh-figi") as token:
+        if token is None:
+            logger.info("figi refresh is already running, skipped")
+            return "skipped"
+        # diff: по расписанию меняем только то, что изменилось у брокера
+        run_in_worker_loop(figi_updater(mode="diff"))
+    return "done"
+
+
+@celery.task
+def refresh_fundamentals():
+    """
+    Координатор: чистит устаревшие записи и раздаёт доли asset_uid воркерам,
+    рейтинги пересчитываются один раз, когда закончат все доли.
+    Блокировка прогона держится до finish_fundamentals_refresh, пока доли работают,
+    их heartbeat её продлевает; если доля упала и chord не завершился - истечёт сама.
+    """
+    with task_lock("refresh-fundamentals", release=False) as token:
+        if token is None:
+            logger.info("fundamentals refresh is already running, skipped")
+            return "skipped"
+        run_in_worker_loop(prune_fundamentals(timedelta(seconds=FUNDAMENTALS_RETENTION)))
+        shards = [refresh_fundamentals_shard.s(shard, FUNDAMENTALS_SHARDS, token)
+                  for shard in range(FUNDAMENTALS_SHARDS)]
+        chord(shards)(finish_fundamentals_refresh.si(token))
+    return "dispatched"
+
+
+@celery.task
+def refresh_fundamentals_shard(shard: int, shards: int, round_token: str | None = None):
+    with task_lock(f"refresh-fundamentals:{shard}", hold=(("refresh-fundamentals", round_token),)) as token:
+        if token is None:
+            logger.info(f"fundamentals shard {shard}/{shards} is already running, skipped")
+            return None
+        stats = run_in_worker_loop(fundamentals_updater(
+            stale_after=timedelta(seconds=FUNDAMENTALS_STALE_AFTER),
+            shard=shard,
+            shards=shards,
+            finalize=False,
+        ))
+    return stats.report()
+
+
+@celery.task
+def finish_fundamentals_refresh(round_token: str | None = None):
+    try:
+        run_in_worker_loop(finalize_fundamentals_refresh())
+    finally:
+        if round_token is not None:
+            release_task_lock("refresh-fundamentals", round_token)
+
+
+@celery.task
+def refresh_candles(interval: str = CandlesInterval.day.name):
+    """
+    :param interval: имя CandlesInterval, у каждого интервала своё расписание в beat
+    """
+    with task_lock(f"refresh-candles:{interval}") as token:
+        if token is None:
+            logger.info(f"candles refresh ({interval}) is already running, skipped")
+            return "skipped"
+        total = run_in_worker_loop(candles_updater(CandlesInterval[interval]))
+    return total
 
 
 @celery.task()
@@ -56,6 +259,3 @@ def test_celery_my(example):
     for _ in range(5):
         print(123)
     return example
-
-
-
@@ -0,0 +1,199 @@
+import asyncio
+import time
+
+import pytest
+from fastapi_users import exceptions
+
+from src.auth import config as auth_config
+from src.auth import manager as auth_manager
+from src.auth.cache import UserCache
+from src.auth.config import CachedJWTStrategy
+from src.auth.manager import UserManager
+from src.auth.models import User
+from src.cache import WRITE_IF_GENERATION
+
+
+class FakeRedis:
+    """
+    Redis в памяти: только команды, которые использует UserCache; eval понимает один скрипт - WRITE_IF_GENERATION.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, "0")) + 1)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    async def eval(self, script, numkeys, key, generation_key, value, ttl, generation):
+        assert script == WRITE_IF_GENERATION and numkeys == 2
+        if self.data.get(generation_key, "0") != str(generation):
+            return 0
+        self.data[key] = value
+        return 1
+
+
+class Users:
+    """
+    Вместо UserManager с БД: считает чтения, get может ждать события, чтобы вклинить invalidate() в середину чтения.
+    """
+
+    def __init__(self, user: User):
+        self.user = user
+        self.reads = 0
+        self.started = asyncio.Event()
+        self.release: asyncio.Event | None = None
+
+    def parse_id(self, value):
+        return int(value)
+
+    async def get(self, user_id):
+        self.reads += 1
+        self.started.set()
+        if self.release is not None:
+            await self.release.wait()
+        if user_id != self.user.id:
+            raise exceptions.UserNotExists()
+        return self.user
+
+
+def make_user(user_id: int = 1, is_active: bool = True) -> User:
+    return User(id=user_id, email=f"user{user_id}@example.com", username=f"user{user_id}", registered_at=None,
+                hashed_password="", is_active=is_active, is_superuser=False, is_verified=False)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = UserCache(maxsize=2, ttl=60)
+    # redis задаём напрямую: start() ещё запускает подписку на INVALIDATE_CHANNEL
+    cache._redis = FakeRedis()
+    monkeypatch.setattr(auth_config, "user_cache", cache)
+    monkeypatch.setattr(auth_manager, "user_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def strategy():
+    return CachedJWTStrategy(secret="secret", lifetime_seconds=3600)
+
+
+def test_second_read_is_cache_hit(cache, strategy):
+    users = Users(make_user())
+
+    async def scenario():
+        token = await strategy.write_token(users.user)
+        first = await strategy.read_token(token, users)
+        second = await strategy.read_token(token, users)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second is users.user
+    assert users.reads == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert "auth-user:1" in cache._redis.data
+
+
+def test_other_worker_reads_from_redis(cache, strategy):
+    users = Users(make_user())
+
+    async def scenario():
+        token = await strategy.write_token(users.user)
+        await strategy.read_token(token, users)
+        # другой воркер: свой LRU пустой, Redis общий
+        cache._local.clear()
+        return await strategy.read_token(token, users)
+
+    user = asyncio.run(scenario())
+    assert users.reads == 1
+    assert (user.id, user.email, user.is_active) == (1, "user1@example.com", True)
+
+
+@pytest.mark.parametrize("hook", ["on_after_update", "on_after_delete"])
+def test_manager_hooks_invalidate(cache, strategy, hook):
+    users = Users(make_user())
+    manager = UserManager(user_db=None)
+
+    async def scenario():
+        token = await strategy.write_token(users.user)
+        await strategy.read_token(token, users)
+        if hook == "on_after_update":
+            await manager.on_after_update(users.user, {"is_active": False})
+        else:
+            await manager.on_after_delete(users.user)
+        assert "auth-user:1" not in cache._redis.data
+        assert cache._redis.published == [("auth-user-invalidate", "1")]
+        await strategy.read_token(token, users)
+
+    asyncio.run(scenario())
+    assert users.reads == 2
+
+
+def test_local_entries_are_keyed_by_token_and_evicted(cache):
+    cache._redis = None
+    user = make_user()
+
+    async def scenario():
+        for token in ("first", "second", "third"):
+            await cache.set(user, token, None, await cache.generation(user.id))
+        return [await cache.get(user.id, token) is not None for token in ("first", "second", "third")]
+
+    # maxsize=2: запись самого старого токена вытеснена, пользователь при этом тот же
+    assert asyncio.run(scenario()) == [False, True, True]
+
+
+def test_token_expiry_limits_ttl(cache):
+    user = make_user()
+
+    async def scenario():
+        await cache.set(user, "expired", time.time() - 1, await cache.generation(user.id))
+        return await cache.get(user.id, "expired")
+
+    assert asyncio.run(scenario()) is None
+    assert cache._redis.data == {}
+
+
+def test_read_started_before_invalidate_is_not_cached(cache, strategy):
+    users = Users(make_user())
+
+    async def scenario():
+        token = await strategy.write_token(users.user)
+        users.release = asyncio.Event()
+        read = asyncio.create_task(strategy.read_token(token, users))
+        await users.started.wait()
+        # пользователя деактивировали, пока шло чтение из БД
+        await cache.invalidate(users.user.id)
+        users.release.set()
+        assert await read is users.user
+        return await cache.get(users.user.id, token)
+
+    assert asyncio.run(scenario()) is None
+    assert "auth-user:1" not in cache._redis.data
+
+
+def test_invalidate_from_other_worker_blocks_shared_write(cache):
+    user = make_user()
+
+    async def scenario():
+        generation = await cache.generation(user.id)
+        # сброс в другом процессе: поколение в Redis выросло, сообщение сюда ещё не дошло
+        await cache._redis.incr("auth-user-generation:1")
+        await cache.set(user, "token", None, generation)
+        return await cache.get(user.id, "token")
+
+    assert asyncio.run(scenario()) is None
+    assert "auth-user:1" not in cache._redis.data
@@ -0,0 +1,48 @@
+import asyncio
+
+from src.cache import ResponseCache
+
+
+async def stale_refresh_race():
+    cache = ResponseCache()
+    started, release = asyncio.Event(), asyncio.Event()
+    version = {"value": "old"}
+
+    async def compute():
+        value = version["value"]
+        started.set()
+        await release.wait()
+        return value
+
+    refresh = asyncio.create_task(cache.get_or_compute("portfolio:1", ("x",), compute, ttl=30, shared=False))
+    await started.wait()
+    # данные поменялись, неймспейс сброшен, пока вычисление ещё идёт
+    version["value"] = "new"
+    cache._drop_local("portfolio:1")
+    release.set()
+    assert await refresh == "old"
+
+    release.clear()
+    release.set()
+    return await cache.get_or_compute("portfolio:1", ("x",), compute, ttl=30, shared=False)
+
+
+def test_value_computed_before_invalidate_is_not_cached():
+    assert asyncio.run(stale_refresh_race()) == "new"
+
+
+async def cached_twice():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    first = await cache.get_or_compute("sectors", (), compute, ttl=30, shared=False)
+    second = await cache.get_or_compute("sectors", (), compute, ttl=30, shared=False)
+    return first, second
+
+
+def test_value_is_cached_without_invalidate():
+    assert asyncio.run(cached_twice()) == (1, 1)
@@ -0,0 +1,84 @@
+import asyncio
+
+from src.fonds.client import ClientPool
+
+
+class FakeClient:
+    def __init__(self, token):
+        self.token = token
+        self.closed = False
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+
+class Pool(ClientPool):
+    """
+    Пул без SDK брокера: вместо AsyncClient - заглушка с признаком закрытия.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = []
+
+    async def _open(self, token):
+        client = FakeClient(token)
+        self.opened.append(client)
+        return client, client
+
+
+def test_reuses_client_per_token():
+    pool = Pool()
+
+    async def scenario():
+        async with pool.client("a") as first:
+            pass
+        async with pool.client("a") as second:
+            pass
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second and len(pool.opened) == 1
+    assert pool.stats()["hits"] == 1 and pool.stats()["in_use"] == 0
+
+
+def test_evictor_skips_callers_waiting_for_semaphore():
+    pool = Pool(max_concurrency=1, idle_timeout=0)
+
+    async def scenario():
+        release = asyncio.Event()
+        entered = []
+
+        async def call(name):
+            async with pool.client("a") as client:
+                entered.append((name, client.closed))
+                await release.wait()
+
+        first = asyncio.create_task(call("first"))
+        second = asyncio.create_task(call("second"))
+        await asyncio.sleep(0.01)
+        # second зарезервировал клиента и ждёт семафор - канал не должен закрыться
+        assert pool.stats()["in_use"] == 2
+        await pool.evict_idle()
+        assert pool.evictions == 0
+        release.set()
+        await asyncio.gather(first, second)
+        await asyncio.sleep(0.001)
+        await pool.evict_idle()
+        return entered
+
+    assert asyncio.run(scenario()) == [("first", False), ("second", False)]
+    assert pool.evictions == 1 and pool.opened[0].closed
+
+
+def test_clients_are_per_event_loop():
+    pool = Pool()
+
+    async def use():
+        async with pool.client("a") as client:
+            return client
+
+    first = asyncio.run(use())
+    second = asyncio.run(use())
+    # канал первого loop нельзя использовать во втором
+    assert first is not second and len(pool.opened) == 2
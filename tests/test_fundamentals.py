@@ -0,0 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from src.fonds import utils
+from src.fonds.resilience import RATE_LIMITS
+
+
+class Session:
+    """
+    Запоминает запросы вместо выполнения.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return self
+
+    def all(self):
+        return []
+
+
+def test_shard_filter_does_not_overflow_on_int_min():
+    session = Session()
+    asyncio.run(utils.get_stale_asset_uids(session, shard=1, shards=4))
+    sql = str(session.queries[0].compile(dialect=asyncpg.dialect(), compile_kwargs={"literal_binds": True}))
+    # abs(-2147483648) в integer - ошибка "integer out of range", маска - нет
+    assert "(hashtext(figi.asset_uid) & 2147483647) % 4 = 1" in sql, sql
+    assert "abs(" not in sql
+
+
+@pytest.fixture
+def updater(monkeypatch):
+    """
+    fundamentals_updater без БД и брокера; fetch_fundamentals_chunk запоминает лимит bucket во время прогона.
+    """
+    rates = []
+    bucket = utils.buckets["instruments"]
+
+    @asynccontextmanager
+    async def session_maker():
+        yield Session()
+
+    @asynccontextmanager
+    async def client(token=None):
+        yield None
+
+    async def stale_asset_uids(session, stale_after, shard, shards):
+        return ["asset-1", "asset-2"]
+
+    async def fetch_chunk(client, asset_uids, stats):
+        rates.append(bucket.rate)
+        if updater.fail:
+            raise RuntimeError("boom")
+        return []
+
+    async def nothing(*args, **kwargs):
+        return []
+
+    monkeypatch.setattr(utils, "worker_session_maker", session_maker)
+    monkeypatch.setattr(utils.client_pool, "client", client)
+    monkeypatch.setattr(utils, "get_stale_asset_uids", stale_asset_uids)
+    monkeypatch.setattr(utils, "fetch_fundamentals_chunk", fetch_chunk)
+    for name in ("changed_rows", "write_history", "upsert_fundamentals"):
+        monkeypatch.setattr(utils, name, nothing)
+
+    def updater(shards: int, fail: bool = False):
+        updater.fail = fail
+        return asyncio.run(utils.fundamentals_updater(shard=0, shards=shards, assets_per_request=1,
+                                                      finalize=False))
+
+    updater.rates = rates
+    return updater
+
+
+def test_shard_share_of_rate_limit_is_restored(updater):
+    updater(shards=4)
+    assert updater.rates == [RATE_LIMITS["instruments"] // 4] * 2
+    assert utils.buckets["instruments"].rate == RATE_LIMITS["instruments"]
+
+
+def test_rate_limit_is_restored_after_failed_run(updater):
+    with pytest.raises(RuntimeError):
+        updater(shards=4, fail=True)
+    assert utils.buckets["instruments"].rate == RATE_LIMITS["instruments"]
@@ -0,0 +1,76 @@
+"""
+Запросы скринера должны идти по индексам из миграций, а не по seq scan.
+enable_seqscan = off: на пустой тестовой базе планировщику иначе выгоднее seq scan,
+а проверить нужно, что индекс вообще подходит под запрос.
+"""
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from src.fonds.models import figi as figi_table, Sectors, Fundamental, tradable_clause
+
+
+def explain(db, query) -> str:
+    # диалект asyncpg: без удвоения % (оператор pg_trgm и LIKE остаются как есть)
+    sql = str(query.compile(dialect=asyncpg.dialect(), compile_kwargs={"literal_binds": True}))
+
+    async def plan():
+        async with db.connection.transaction():
+            await db.connection.execute("SET LOCAL enable_seqscan = off")
+            return "\n".join(row[0] for row in await db.connection.fetch(f"EXPLAIN {sql}"))
+
+    return db.run(plan())
+
+
+@pytest.mark.parametrize("cursor", [None, "cursor"])
+def test_top_shares_uses_share_ranking_index(db, cursor):
+    from src.fonds.router import top_shares_query
+    from src.pagination import encode_cursor
+
+    if cursor is not None:
+        cursor = encode_cursor(1.5, "00000000-0000-0000-0000-000000000000")
+    plan = explain(db, top_shares_query(Sectors.it, Fundamental.pe_ratio_ttm, 10, 0, cursor))
+    index = "ux_share_ranking_page" if cursor is None else "ux_share_ranking_cursor"
+    assert index in plan, plan
+
+
+def test_tradable_sector_uses_partial_index(db):
+    query = select(figi_table.c.asset_uid).where(tradable_clause() & (figi_table.c.sector == Sectors.it.name))
+    plan = explain(db, query)
+    assert "ix_figi_tradable_sector" in plan, plan
+
+
+def test_figi_any_uses_figi_index(db):
+    from src.fonds.index import instruments_by_figi_query
+
+    plan = explain(db, instruments_by_figi_query(["BBG004730N88", "BBG004730RP0"]))
+    assert "ix_figi_figi" in plan, plan
+
+
+def test_lookup_by_ticker_uses_ticker_index(db):
+    from src.fonds.lookup import lookup_query
+
+    plan = explain(db, lookup_query(["SBER", "sber"], [], []))
+    assert "ix_figi_ticker" in plan, plan
+
+
+def test_lookup_combines_indexes(db):
+    from src.fonds.lookup import lookup_query
+
+    plan = explain(db, lookup_query(["SBER"], ["BBG004730RP0"], ["00000000-0000-0000-0000-000000000000"]))
+    for index in ("ix_figi_ticker", "ix_figi_figi", "ix_figi_asset_uid"):
+        assert index in plan, plan
+
+
+def test_search_lower_name_uses_trigram_indexes(db):
+    from src.fonds.search import search_db_query
+
+    plan = explain(db, search_db_query("газпр"))
+    for index in ("ix_figi_name_trgm", "ix_figi_ticker_trgm", "ix_figi_figi"):
+        assert index in plan, plan
+
+
+def test_lower_name_btree_is_dropped(db):
+    # lower(name) обслуживает ix_figi_name_trgm, отдельный btree не нужен
+    indexes = db.run(db.connection.fetch("SELECT indexname FROM pg_indexes WHERE tablename = 'figi'"))
+    assert "ix_figi_lower_name" not in {row["indexname"] for row in indexes}
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from src.fonds.indicators import (
+    IndicatorBook, compute_indicators, RSI_PERIOD, SMA_PERIOD, EMA_PERIOD,
+    MACD_FAST, MACD_SLOW, MACD_SIGNAL, BOLLINGER_PERIOD, BOLLINGER_WIDTH,
+)
+
+# пример RSI(14) из таблицы StockCharts ("Relative Strength Index"), значения RSI после 15-й свечи
+STOCKCHARTS_CLOSES = [44.3389, 44.0902, 44.1497, 43.6124, 44.3278, 44.8264, 45.0955, 45.4245, 45.8433, 46.0826,
+                      45.8931, 46.0328, 45.6140, 46.2820, 46.2820, 46.0028, 46.0328, 46.4116, 46.2222, 45.6439]
+STOCKCHARTS_RSI = [70.53, 66.32, 66.55, 69.41, 66.36, 57.97]
+
+
+def random_walk(length: int, seed: int) -> list[float]:
+    rng = np.random.default_rng(seed)
+    return list(np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, length))), 2))
+
+
+def ema_reference(values: list[float], period: int, alpha: float | None = None) -> float:
+    alpha = alpha if alpha is not None else 2 / (period + 1)
+    value = sum(values[:period]) / period
+    for x in values[period:]:
+        value += alpha * (x - value)
+    return value
+
+
+def reference(closes: list[float]) -> dict[str, float]:
+    deltas = [b - a for a, b in zip(closes, closes[1:])]
+    gain = ema_reference([max(delta, 0) for delta in deltas], RSI_PERIOD, 1 / RSI_PERIOD)
+    loss = ema_reference([max(-delta, 0) for delta in deltas], RSI_PERIOD, 1 / RSI_PERIOD)
+    macd_series = [ema_reference(closes[:n], MACD_FAST) - ema_reference(closes[:n], MACD_SLOW)
+                   for n in range(MACD_SLOW, len(closes) + 1)]
+    macd, signal = macd_series[-1], ema_reference(macd_series, MACD_SIGNAL)
+    window = closes[-BOLLINGER_PERIOD:]
+    middle = sum(window) / BOLLINGER_PERIOD
+    deviation = (sum((x - middle) ** 2 for x in window) / BOLLINGER_PERIOD) ** 0.5
+    return {
+        "close": closes[-1],
+        "rsi": 100 - 100 / (1 + gain / loss),
+        "sma": sum(closes[-SMA_PERIOD:]) / SMA_PERIOD,
+        "ema": ema_reference(closes, EMA_PERIOD),
+        "macd": macd,
+        "macd_signal": signal,
+        "macd_histogram": macd - signal,
+        "bollinger_upper": middle + BOLLINGER_WIDTH * deviation,
+        "bollinger_middle": middle,
+        "bollinger_lower": middle - BOLLINGER_WIDTH * deviation,
+    }
+
+
+def test_rsi_matches_published_example():
+    rsi = [compute_indicators(np.array([STOCKCHARTS_CLOSES[:n]]))["rsi"][0]
+           for n in range(RSI_PERIOD + 1, len(STOCKCHARTS_CLOSES) + 1)]
+    np.testing.assert_allclose(rsi, STOCKCHARTS_RSI, atol=0.005)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_indicators_match_reference(seed):
+    closes = random_walk(120, seed)
+    result = compute_indicators(np.array([closes]))
+    for name, expected in reference(closes).items():
+        assert result[name][0] == pytest.approx(expected, rel=1e-9), name
+
+
+def test_short_history_is_nan():
+    result = compute_indicators(np.array([random_walk(10, 4)]))
+    assert np.isnan(result["rsi"][0]) and np.isnan(result["sma"][0]) and np.isnan(result["macd"][0])
+    assert not np.isnan(result["close"][0])
+
+
+def test_rows_of_different_length():
+    short, long = random_walk(40, 5), random_walk(90, 6)
+    closes = np.full((2, 90), np.nan)
+    closes[0, :40], closes[1] = short, long
+    result = compute_indicators(closes)
+    for row, series in enumerate((short, long)):
+        assert result["ema"][row] == pytest.approx(reference(series)["ema"], rel=1e-9)
+
+
+def test_incremental_feed_matches_full_recompute():
+    closes = random_walk(150, 7)
+    book = IndicatorBook()
+    rows = book.grow(1)
+    for start in range(0, 150, 25):
+        book.feed(rows, np.array([closes[start:start + 25]]))
+    incremental = book.snapshot(rows)
+    full = compute_indicators(np.array([closes]))
+    for name in full:
+        np.testing.assert_allclose(incremental[name], full[name], rtol=1e-12, err_msg=name)
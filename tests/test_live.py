@@ -0,0 +1,125 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from src.fonds import live, router
+from src.fonds.live import FakeStreams, LivePortfolio, LivePortfolios
+
+# (figi, instrument_uid, quantity, price, average_price); рубли - дробное количество по цене 1
+POSITIONS = [
+    ("BBG000000001", "uid-1", 10, 250.5, 240.0),
+    ("BBG000000002", "uid-2", 3, 1234.56, 1300.0),
+    ("RUB000UTSTOM", "uid-rub", 1500.75, 1.0, 1.0),
+]
+TICKS = 300
+
+
+class HangingSource:
+    async def load(self, token):
+        await asyncio.Event().wait()
+
+
+class FailingSource:
+    def __init__(self, error):
+        self.error = error
+        self.loads = 0
+
+    async def load(self, token):
+        self.loads += 1
+        raise self.error
+
+
+def test_failed_load_is_retried_by_next_get():
+    source = FailingSource(RuntimeError("boom"))
+    portfolios = LivePortfolios(source=source)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await portfolios.get("token")
+        await portfolios.close()
+
+    asyncio.run(scenario())
+    assert source.loads == 2
+
+
+def test_load_timeout_is_504(monkeypatch):
+    pytest.importorskip("tinkoff.invest")
+    monkeypatch.setattr(live, "LIVE_PORTFOLIO_LOAD_TIMEOUT", 0.01)
+    portfolios = LivePortfolios(source=HangingSource())
+    monkeypatch.setattr(router, "live_portfolios", portfolios)
+
+    async def scenario():
+        try:
+            await router.get_live_portfolio("token")
+        finally:
+            await portfolios.close()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 504
+
+
+@pytest.mark.parametrize("code, status", [("UNAUTHENTICATED", 400), ("PERMISSION_DENIED", 400), ("UNAVAILABLE", 503)])
+def test_broker_error_on_load(monkeypatch, code, status):
+    pytest.importorskip("tinkoff.invest")
+    from grpc import StatusCode
+    from tinkoff.invest.exceptions import AioRequestError
+
+    portfolios = LivePortfolios(source=FailingSource(AioRequestError(StatusCode[code], "details", None)))
+    monkeypatch.setattr(router, "live_portfolios", portfolios)
+
+    async def scenario():
+        try:
+            await router.get_live_portfolio("token")
+        finally:
+            await portfolios.close()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == status
+
+
+def recompute(quantities: dict[str, Decimal], prices: dict[str, Decimal]) -> tuple[dict, Decimal]:
+    totals = {uid: quantities[uid] * prices[uid] for uid in quantities}
+    return totals, sum(totals.values())
+
+
+def test_ticks_match_full_recomputation(monkeypatch):
+    async def resolve_figis(figis):
+        return {figi: {"ticker": figi[-4:], "name": figi, "class_code": "TQBR", "asset_uid": figi}
+                for figi in figis}
+
+    monkeypatch.setattr(live.instrument_index, "resolve_figis", resolve_figis)
+    source = FakeStreams(POSITIONS, tick_interval=0, seed=7)
+    portfolio = LivePortfolio("token", source)
+    quantities = {uid: Decimal(str(quantity)) for _, uid, quantity, _, _ in POSITIONS}
+    prices = {uid: Decimal(str(price)) for _, uid, _, price, _ in POSITIONS}
+
+    def check():
+        totals, cost = recompute(quantities, prices)
+        for uid, position in portfolio.positions.items():
+            assert position["current_stock_price"] == float(prices[uid])
+            assert position["total_price"] == pytest.approx(float(totals[uid]), abs=1e-9)
+        assert portfolio.full_active_cost == pytest.approx(float(cost), abs=1e-9)
+
+    async def scenario():
+        await portfolio._apply_portfolios(await source.load("token"), replace=True)
+        # тики подаём сами, а не фоновой задачей подписки
+        await portfolio.stop()
+        check()
+        ticks = source.last_prices("token", list(prices))
+        for _ in range(TICKS):
+            last_price = await anext(ticks)
+            portfolio.apply_price(last_price)
+            prices[last_price.instrument_uid] = (Decimal(last_price.price.units)
+                                                 + Decimal(last_price.price.nano) / 1_000_000_000)
+            check()
+        await ticks.aclose()
+
+    asyncio.run(scenario())
+    # цены действительно менялись, а версия растёт на каждый изменивший цену тик
+    assert prices != {uid: Decimal(str(price)) for _, uid, _, price, _ in POSITIONS}
+    assert 0 < portfolio.version <= TICKS + 1
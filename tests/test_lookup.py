@@ -0,0 +1,116 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from src.fonds import lookup as lookup_module
+from src.fonds.lookup import lookup, METRIC_COLUMNS
+
+KNOWN = str(uuid.UUID(int=1))
+NO_FUNDAMENTALS = str(uuid.UUID(int=2))
+UNKNOWN = str(uuid.UUID(int=3))
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class Session:
+    """
+    Вместо БД - фиксированные строки figi без фундаменталов; фильтрует по тикерам и asset_uid из запроса.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query):
+        params = query.compile().params
+        return Result([
+            {**row, **{name: None for name in METRIC_COLUMNS}} for row in self.rows
+            if row["ticker"] in params["tickers"] or row["figi"] in params["figis"]
+            or row["asset_uid"] in params["asset_uids"]
+        ])
+
+
+class Broker:
+    def __init__(self, fail: bool = False):
+        self.requests = []
+        self.fail = fail
+
+    async def fetch_chunk(self, client, asset_uids, stats):
+        self.requests.append(list(asset_uids))
+        if self.fail:
+            stats.failed_chunks += 1
+            return []
+        return [SimpleNamespace(asset_uid=asset_uid, pe_ratio_ttm=5.0, price_to_sales_ttm=1.0, price_to_book_ttm=1.0,
+                                ev_to_ebitda_mrq=3.0, roe=10.0, total_debt_to_equity_mrq=0.5)
+                for asset_uid in asset_uids if asset_uid == KNOWN]
+
+
+ROWS = [
+    {"figi": "BBG000000001", "ticker": "SBER", "asset_uid": KNOWN},
+    {"figi": "BBG000000002", "ticker": "TMOS", "asset_uid": NO_FUNDAMENTALS},
+]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = Broker()
+
+    @asynccontextmanager
+    async def client(token=None):
+        yield None
+
+    monkeypatch.setattr(lookup_module, "fetch_fundamentals_chunk", broker.fetch_chunk)
+    monkeypatch.setattr(lookup_module.client_pool, "client", client)
+    monkeypatch.setattr(lookup_module, "_fetched", lookup_module.TTLCache(maxsize=100, ttl=60))
+    return broker
+
+
+def run_lookup(tickers=(), figis=(), asset_uids=()):
+    return asyncio.run(lookup(Session(ROWS), list(tickers), list(figis), list(asset_uids)))
+
+
+def test_only_known_valid_uids_reach_broker(broker):
+    result = run_lookup(asset_uids=[KNOWN, NO_FUNDAMENTALS, UNKNOWN, "not-a-uuid"])
+    assert broker.requests == [[KNOWN, NO_FUNDAMENTALS]]
+    assert result["asset_uids"][KNOWN]["fundamentals"]["pe_ratio_ttm"] == 5.0
+    assert result["asset_uids"][NO_FUNDAMENTALS]["fundamentals"] is None
+    assert result["asset_uids"][UNKNOWN] == {"instruments": [], "fundamentals": None}
+    assert result["asset_uids"]["not-a-uuid"] == {"instruments": [], "fundamentals": None}
+
+
+def test_broker_answers_are_cached_including_empty(broker):
+    run_lookup(asset_uids=[KNOWN, NO_FUNDAMENTALS])
+    result = run_lookup(asset_uids=[KNOWN, NO_FUNDAMENTALS])
+    assert len(broker.requests) == 1
+    assert result["asset_uids"][KNOWN]["fundamentals"]["roe"] == 10.0
+    assert result["asset_uids"][NO_FUNDAMENTALS]["fundamentals"] is None
+
+
+def test_failed_chunk_is_not_cached(broker):
+    broker.fail = True
+    run_lookup(asset_uids=[KNOWN])
+    broker.fail = False
+    result = run_lookup(asset_uids=[KNOWN])
+    assert len(broker.requests) == 2
+    assert result["asset_uids"][KNOWN]["fundamentals"] is not None
+
+
+def test_tickers_keyed_as_sent(broker):
+    result = run_lookup(tickers=["sber", "SBER", "Tmos", "NONE"])
+    assert list(result["tickers"]) == ["sber", "SBER", "Tmos", "NONE"]
+    assert [row["figi"] for row in result["tickers"]["sber"]] == ["BBG000000001"]
+    assert result["tickers"]["sber"] == result["tickers"]["SBER"]
+    assert [row["figi"] for row in result["tickers"]["Tmos"]] == ["BBG000000002"]
+    assert result["tickers"]["NONE"] == []
+    assert broker.requests == []
@@ -0,0 +1,120 @@
+import asyncio
+import socket
+from email.message import EmailMessage
+
+import pytest
+
+from src.tasks import mailer
+from src.tasks.mailer import SMTPPool
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+
+class Handler:
+    """
+    Отладочный SMTP сервер: запоминает письма и считает соединения (EHLO на каждое).
+    Адреса temp-* первый раз получают 451, reject-* - всегда 550.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.deferred = set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("reject"):
+            return "550 mailbox unavailable"
+        if address.startswith("temp") and address not in self.deferred:
+            self.deferred.add(address)
+            return "451 try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.extend(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    handler = Handler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    delays = []
+
+    def uniform(low, high):
+        delays.append(high)
+        return 0.0
+
+    # задержка повтора: min(SMTP_BACKOFF_MAX, 2 ** try) + джиттер
+    monkeypatch.setattr(mailer, "SMTP_BACKOFF_MAX", 0.01)
+    monkeypatch.setattr(mailer.random, "uniform", uniform)
+    return delays
+
+
+def message(to: str) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = "reports@example.com"
+    email["To"] = to
+    email["Subject"] = "report"
+    email.set_content("body")
+    return email
+
+
+def run_batch(server, addresses: list[str], **kwargs) -> dict:
+    pool = SMTPPool(hostname=server.hostname, port=server.port, use_tls=False, **kwargs)
+
+    async def scenario():
+        try:
+            return await pool.send_batch([message(address) for address in addresses])
+        finally:
+            await pool.close()
+
+    return asyncio.run(scenario())
+
+
+def test_batch_reuses_connections(server, backoffs):
+    addresses = [f"user{index}@example.com" for index in range(20)]
+    result = run_batch(server, addresses, size=2)
+    assert result == {"sent": 20, "failed": []}
+    assert sorted(server.handler.messages) == sorted(addresses)
+    # 20 писем по двум соединениям, без нового TLS/логина на каждое письмо
+    assert server.handler.connections <= 2
+    assert backoffs == []
+
+
+def test_connection_rotates_after_max_messages(server, backoffs):
+    run_batch(server, [f"user{index}@example.com" for index in range(6)], size=1, max_messages=2)
+    assert server.handler.connections == 3
+
+
+def test_temporary_failure_is_retried_with_backoff(server, backoffs):
+    result = run_batch(server, ["temp@example.com", "user@example.com"], size=1)
+    assert result == {"sent": 2, "failed": []}
+    assert server.handler.messages.count("temp@example.com") == 1
+    assert len(backoffs) == 1
+    # 4xx не рвёт соединение: повтор идёт по тому же
+    assert server.handler.connections == 1
+
+
+def test_permanent_failure_is_not_retried(server, backoffs):
+    result = run_batch(server, ["reject@example.com", "user@example.com"], size=1)
+    assert result == {"sent": 1, "failed": ["reject@example.com"]}
+    assert backoffs == []
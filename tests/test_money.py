@@ -0,0 +1,151 @@
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.fonds.money import (NANO, quotation_to_nano, quotations_to_nano, nano_to_number, nano_to_float,
+                             multiply_nano, positions_to_nano, sum_nano)
+
+CASES = 2000
+
+
+def random_quotation(rng: random.Random, max_units: int = 10_000_000):
+    """
+    Quotation как у брокера: units и nano одного знака, |nano| < 1e9.
+    """
+    units = rng.randint(0, max_units)
+    nano = rng.randrange(NANO)
+    if rng.random() < 0.5:
+        units, nano = -units, -nano
+    return SimpleNamespace(units=units, nano=nano)
+
+
+def exact(quotation) -> Decimal:
+    return Decimal(quotation.units) + Decimal(quotation.nano) / NANO
+
+
+def to_quotation(value: int):
+    # обратное преобразование: знак у units и nano общий
+    units = abs(value) // NANO
+    nano = abs(value) % NANO
+    sign = -1 if value < 0 else 1
+    return SimpleNamespace(units=sign * units, nano=sign * nano)
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20240519)
+
+
+def test_quotation_round_trip(rng):
+    for _ in range(CASES):
+        quotation = random_quotation(rng)
+        value = quotation_to_nano(quotation)
+        assert Decimal(value) / NANO == exact(quotation)
+        back = to_quotation(value)
+        assert (back.units, back.nano) == (quotation.units, quotation.nano)
+
+
+def test_batch_matches_scalar(rng):
+    quotations = [random_quotation(rng) for _ in range(CASES)]
+    batch = quotations_to_nano(quotations)
+    assert batch.dtype == np.int64
+    assert batch.tolist() == [quotation_to_nano(quotation) for quotation in quotations]
+
+
+def test_sum_has_no_float_drift(rng):
+    quotations = [random_quotation(rng, max_units=100_000) for _ in range(CASES)]
+    reference = sum(exact(quotation) for quotation in quotations)
+    assert Decimal(int(quotations_to_nano(quotations).sum())) / NANO == reference
+
+    # цена 0.1 миллион раз: float копит ошибку, nano - нет
+    dimes = [SimpleNamespace(units=0, nano=100_000_000)] * 1_000_000
+    assert int(quotations_to_nano(dimes).sum()) == 100_000 * NANO
+    assert sum(0.1 for _ in dimes) != 100_000
+
+
+def test_multiply_whole_quantity_is_exact(rng):
+    for _ in range(CASES):
+        price = random_quotation(rng, max_units=100_000)
+        quantity = rng.randint(-10_000, 10_000)
+        total = int(multiply_nano(quotation_to_nano(price), quantity * NANO))
+        assert Decimal(total) / NANO == exact(price) * quantity
+
+
+def test_multiply_fractional_quantity_rounds_to_nano(rng):
+    for _ in range(CASES):
+        price = random_quotation(rng, max_units=1_000)
+        quantity = random_quotation(rng, max_units=1_000)
+        total = int(multiply_nano(quotation_to_nano(price), quotation_to_nano(quantity)))
+        # одна ошибка округления float на дробной части количества
+        assert abs(Decimal(total) / NANO - exact(price) * exact(quantity)) <= Decimal(2) / NANO
+
+
+def test_multiply_arrays_matches_scalars(rng):
+    prices = quotations_to_nano([random_quotation(rng, max_units=100_000) for _ in range(CASES)])
+    quantities = np.array([rng.randint(0, 1_000) * NANO for _ in range(CASES)], dtype=np.int64)
+    totals = multiply_nano(prices, quantities)
+    assert totals.tolist() == [int(multiply_nano(int(price), int(quantity)))
+                               for price, quantity in zip(prices, quantities)]
+
+
+def test_multiply_beyond_int64_falls_back_to_python_int():
+    # 5000 за бумагу на 2 млн лотов: 1e19 nano, в int64 это уже отрицательное число
+    price, quantity = 5000 * NANO + 2, 2_000_000 * NANO + NANO // 2
+    expected = price * 2_000_000 + price // 2
+    assert multiply_nano(price, quantity) == expected
+    assert isinstance(multiply_nano(price, quantity), int)
+
+    totals = multiply_nano(np.array([price, NANO]), np.array([quantity, 3 * NANO]))
+    assert totals.dtype == object
+    assert totals.tolist() == [expected, 3 * NANO]
+    assert sum_nano(totals) == expected + 3 * NANO
+
+
+def test_multiply_within_int64_stays_int64():
+    assert multiply_nano(np.array([5000 * NANO]), np.array([1_000_000 * NANO])).dtype == np.int64
+    assert isinstance(multiply_nano(np.int64(NANO), np.int64(NANO)), np.int64)
+
+
+def test_sum_does_not_wrap():
+    assert sum_nano(np.array([2 ** 62, 2 ** 62], dtype=np.int64)) == 2 ** 63
+
+
+def quotation(units: int, nano: int = 0):
+    return SimpleNamespace(units=units, nano=nano)
+
+
+def test_positions_total():
+    positions = [
+        SimpleNamespace(quantity=quotation(3), current_price=quotation(0, 100_000_000),
+                        expected_yield=quotation(-1, -500_000_000)),
+        SimpleNamespace(quantity=quotation(0, 500_000_000), current_price=quotation(90),
+                        expected_yield=quotation(0)),
+    ]
+    fixed = positions_to_nano(positions)
+    assert fixed["total"].tolist() == [300_000_000, 45 * NANO]
+    assert nano_to_float(int(fixed["total"].sum())) == 45.3
+    assert fixed["expected_yield"].tolist() == [-1_500_000_000, 0]
+
+
+def test_nano_to_number_keeps_whole_values_int():
+    assert nano_to_number(7 * NANO) == 7 and isinstance(nano_to_number(7 * NANO), int)
+    assert nano_to_number(-7 * NANO) == -7
+    assert nano_to_number(1_500_000_000) == 1.5
+    assert nano_to_number(np.int64(2 * NANO)) == 2
+
+
+def test_positions_beyond_int64_keep_exact_totals():
+    from src.fonds.utils import build_positions
+
+    instrument = {"ticker": "T", "name": "T", "class_code": "TQBR", "asset_uid": "asset"}
+    positions = [
+        SimpleNamespace(figi=figi, instrument_uid=figi, quantity=quotation(2_000_000), current_price=quotation(5000),
+                        expected_yield=quotation(0))
+        for figi in ("A", "A", "B")
+    ]
+    rows, fixed = build_positions(positions, {"A": instrument, "B": instrument})
+    assert [row["total_price"] for row in rows] == [2e10, 1e10]
+    assert sum_nano(fixed["total"]) == 30_000_000_000 * NANO
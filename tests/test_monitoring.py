@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from fastapi import FastAPI
+from loguru import logger
+from prometheus_client import REGISTRY
+
+from src.monitoring import route_template, UNMATCHED_ROUTE, LoopLagMonitor
+
+app = FastAPI()
+
+
+@app.get("/fonds/tokens")
+async def tokens():
+    return []
+
+
+@app.delete("/fonds/tokens/{index}")
+async def delete_token(index: int):
+    return {}
+
+
+def scope(path: str, method: str = "GET") -> dict:
+    return {"type": "http", "path": path, "method": method, "root_path": "", "query_string": b""}
+
+
+def test_route_template_uses_path_template():
+    assert route_template(app.router.routes, scope("/fonds/tokens/3", "DELETE")) == "/fonds/tokens/{index}"
+    assert route_template(app.router.routes, scope("/fonds/tokens/4", "DELETE")) == "/fonds/tokens/{index}"
+    assert route_template(app.router.routes, scope("/fonds/tokens")) == "/fonds/tokens"
+
+
+def test_route_template_bounds_unknown_paths():
+    assert route_template(app.router.routes, scope("/wp-login.php")) == UNMATCHED_ROUTE
+    # метод не подошёл (405) - метка всё равно шаблон
+    assert route_template(app.router.routes, scope("/fonds/tokens/3", "GET")) == "/fonds/tokens/{index}"
+
+
+def test_watchdog_reports_blocked_loop():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.1)
+    stalls = REGISTRY.get_sample_value("event_loop_stalls_total")
+    lag = REGISTRY.get_sample_value("event_loop_lag_seconds_sum")
+    messages = []
+    sink = logger.add(messages.append, level="WARNING", format="{message}")
+
+    async def blocking_call():
+        time.sleep(0.5)
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.sleep(0.05)
+        await blocking_call()
+        await asyncio.sleep(0.05)
+        watchdog = monitor._watchdog
+        await monitor.stop()
+        watchdog.join(1)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        logger.remove(sink)
+
+    assert REGISTRY.get_sample_value("event_loop_stalls_total") == stalls + 1
+    assert REGISTRY.get_sample_value("event_loop_lag_seconds_sum") - lag >= 0.4
+    # в логе стек потока loop с блокирующим вызовом
+    assert len(messages) == 1 and "blocking_call" in messages[0]
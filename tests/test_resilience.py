@@ -0,0 +1,264 @@
+import asyncio
+import time
+
+import grpc
+import pytest
+from grpc import StatusCode
+from grpc.aio import AioRpcError, Metadata
+
+from src.fonds import resilience
+from src.fonds.resilience import CircuitBreaker, TokenBucket, BrokerUnavailable, call_broker
+
+RESET = 0.05
+
+
+def rpc_error(code: StatusCode, remaining: int | None = None, reset: int | None = None) -> AioRpcError:
+    trailing = Metadata()
+    if remaining is not None:
+        trailing.add("x-ratelimit-remaining", str(remaining))
+    if reset is not None:
+        trailing.add("x-ratelimit-reset", str(reset))
+    return AioRpcError(code, Metadata(), trailing, details=code.name)
+
+
+class Broker:
+    """
+    Вызов брокера по сценарию: ошибки из outcomes по очереди, потом "ok".
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.outcomes:
+            outcome = self.outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            await outcome()
+        return "ok"
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=RESET)
+    monkeypatch.setattr(resilience, "breaker", breaker)
+    monkeypatch.setattr(resilience, "buckets", {"instruments": TokenBucket(100)})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    # без случайной добавки к паузе после RESOURCE_EXHAUSTED
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: low)
+    return breaker
+
+
+def open_breaker(breaker):
+    with pytest.raises(AioRpcError):
+        asyncio.run(call_broker(Broker(rpc_error(StatusCode.UNAVAILABLE), rpc_error(StatusCode.UNAVAILABLE)),
+                                tries=2))
+    assert breaker.state == "open"
+
+
+def half_open(breaker):
+    open_breaker(breaker)
+    asyncio.run(asyncio.sleep(RESET * 1.2))
+    assert breaker.state == "half_open"
+
+
+def test_retries_after_resource_exhausted(breaker):
+    broker = Broker(rpc_error(StatusCode.RESOURCE_EXHAUSTED, remaining=0, reset=0))
+    retries = []
+    assert asyncio.run(call_broker(broker, on_retry=lambda: retries.append(1))) == "ok"
+    assert broker.calls == 2 and retries == [1]
+    # лимит - не сбой брокера
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_resource_exhausted_syncs_bucket(breaker):
+    bucket = resilience.buckets["instruments"]
+    with pytest.raises(AioRpcError):
+        asyncio.run(call_broker(Broker(rpc_error(StatusCode.RESOURCE_EXHAUSTED, remaining=0, reset=0)), tries=1))
+    assert bucket.tokens == 0
+
+
+def test_permanent_error_is_not_retried(breaker):
+    broker = Broker(rpc_error(StatusCode.NOT_FOUND))
+    with pytest.raises(AioRpcError):
+        asyncio.run(call_broker(broker))
+    assert broker.calls == 1 and breaker.state == "closed"
+
+
+def test_transient_error_is_retried(breaker):
+    broker = Broker(rpc_error(StatusCode.UNAVAILABLE))
+    assert asyncio.run(call_broker(broker)) == "ok"
+    assert broker.calls == 2 and breaker.failures == 0
+
+
+def test_open_half_open_closed(breaker):
+    open_breaker(breaker)
+    broker = Broker()
+    with pytest.raises(BrokerUnavailable):
+        asyncio.run(call_broker(broker))
+    assert broker.calls == 0
+
+    asyncio.run(asyncio.sleep(RESET * 1.2))
+    assert breaker.state == "half_open"
+    assert asyncio.run(call_broker(broker)) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens(breaker):
+    half_open(breaker)
+    with pytest.raises(AioRpcError):
+        asyncio.run(call_broker(Broker(rpc_error(StatusCode.UNAVAILABLE)), tries=1))
+    assert breaker.state == "open"
+
+
+def test_single_probe_in_half_open(breaker):
+    half_open(breaker)
+
+    async def scenario():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await release.wait()
+
+        probe = asyncio.create_task(call_broker(Broker(slow)))
+        await started.wait()
+        with pytest.raises(BrokerUnavailable):
+            await call_broker(Broker())
+        release.set()
+        return await probe
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_releases_half_open(breaker):
+    half_open(breaker)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        probe = asyncio.create_task(call_broker(Broker(hang)))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await call_broker(Broker())
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_non_grpc_probe_error_releases_half_open(breaker):
+    half_open(breaker)
+    with pytest.raises(RuntimeError):
+        asyncio.run(call_broker(Broker(RuntimeError("bug"))))
+    assert breaker.state == "half_open"
+    assert asyncio.run(call_broker(Broker())) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancel_while_waiting_for_bucket_releases_probe(breaker):
+    half_open(breaker)
+    bucket = resilience.buckets["instruments"]
+
+    async def scenario():
+        bucket.pause(60)
+        probe = asyncio.create_task(call_broker(Broker()))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        resilience.buckets["instruments"] = TokenBucket(100)
+        return await call_broker(Broker())
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+class GrpcBroker:
+    """
+    Настоящий grpc.aio сервер на localhost со своим event loop: на каждый вызов
+    отвечает ошибкой из outcomes (код, x-ratelimit-remaining, x-ratelimit-reset)
+    в trailing metadata, как брокер, а когда сценарий кончился - b"ok".
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.outcomes = []
+        self.calls = 0
+        self.loop.run_until_complete(self._start())
+
+    async def _start(self):
+        self.server = grpc.aio.server()
+        handler = grpc.unary_unary_rpc_method_handler(self._handle)
+        self.server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler("broker.Broker",
+                                                                                   {"Call": handler}),))
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        await self.server.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{port}")
+        self.stub = self.channel.unary_unary("/broker.Broker/Call")
+
+    async def _handle(self, request, context):
+        self.calls += 1
+        if not self.outcomes:
+            return b"ok"
+        code, remaining, reset = self.outcomes.pop(0)
+        await context.abort(code, code.name, trailing_metadata=(("x-ratelimit-remaining", str(remaining)),
+                                                                ("x-ratelimit-reset", str(reset))))
+
+    def call_broker(self, *outcomes, **kwargs):
+        self.outcomes = list(outcomes)
+        return self.loop.run_until_complete(call_broker(lambda: self.stub(b"request", timeout=5), **kwargs))
+
+    def close(self):
+        self.loop.run_until_complete(self.channel.close())
+        self.loop.run_until_complete(self.server.stop(None))
+        self.loop.close()
+
+
+@pytest.fixture
+def grpc_broker(breaker):
+    broker = GrpcBroker()
+    yield broker
+    broker.close()
+
+
+def test_grpc_resource_exhausted_is_retried(grpc_broker, breaker):
+    assert grpc_broker.call_broker((StatusCode.RESOURCE_EXHAUSTED, 0, 0)) == b"ok"
+    assert grpc_broker.calls == 2
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_grpc_ratelimit_metadata_pauses_bucket(grpc_broker, breaker):
+    bucket = resilience.buckets["instruments"]
+    with pytest.raises(AioRpcError) as error:
+        grpc_broker.call_broker((StatusCode.RESOURCE_EXHAUSTED, 0, 30), tries=1)
+    assert error.value.code() == StatusCode.RESOURCE_EXHAUSTED
+    # лимиты взяты из trailing metadata настоящего ответа
+    assert bucket.tokens == 0
+    assert bucket.paused_until - time.monotonic() == pytest.approx(30, abs=1)
+
+
+def test_grpc_unavailable_is_retried(grpc_broker, breaker):
+    assert grpc_broker.call_broker((StatusCode.UNAVAILABLE, 100, 60)) == b"ok"
+    assert grpc_broker.calls == 2
+    assert breaker.state == "closed"
+
+
+def test_grpc_unavailable_opens_breaker(grpc_broker, breaker):
+    with pytest.raises(AioRpcError) as error:
+        grpc_broker.call_broker((StatusCode.UNAVAILABLE, 100, 60), (StatusCode.UNAVAILABLE, 100, 60), tries=2)
+    assert error.value.code() == StatusCode.UNAVAILABLE
+    assert grpc_broker.calls == 2
+    assert breaker.state == "open"
+    with pytest.raises(BrokerUnavailable):
+        grpc_broker.call_broker()
+    assert grpc_broker.calls == 2
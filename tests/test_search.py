@@ -0,0 +1,61 @@
+import pytest
+
+from src.fonds.search import SearchIndex, build_state
+
+
+def instrument(ticker: str, name: str, figi: str, tradable: bool = True) -> dict:
+    return {"uid": f"uid-{ticker}", "ticker": ticker, "name": name, "figi": figi, "class_code": "TQBR",
+            "sector": "other", "exchange": "MOEX", "buy_available_flag": tradable, "sell_available_flag": tradable}
+
+
+ROWS = [
+    instrument("SBER", "Сбер Банк", "BBG004730N88"),
+    instrument("SBERP", "Сбер Банк - привилегированные акции", "BBG0047315Y7"),
+    instrument("GAZP", "Газпром", "BBG004730RP0"),
+    instrument("LKOH", "ЛУКОЙЛ", "BBG004731032"),
+    instrument("YNDX", "Яндекс", "BBG006L8G4H1", tradable=False),
+    instrument("MGNT", "Магнит", "BBG004RVFCY3"),
+]
+
+
+@pytest.fixture(scope="module")
+def state():
+    return build_state(ROWS)
+
+
+def search(state, query: str, limit: int = 10) -> list[tuple[str, str]]:
+    return [(row["ticker"], row["match"]) for row in SearchIndex.search_state(state, query, limit)]
+
+
+def test_exact_ticker_first(state):
+    assert search(state, "sber")[0] == ("SBER", "exact")
+    # остальные - по префиксу тикера
+    assert ("SBERP", "ticker") in search(state, "sber")
+    assert search(state, "GAZP", limit=1) == [("GAZP", "exact")]
+
+
+def test_exact_figi(state):
+    assert search(state, "bbg004731032", limit=1) == [("LKOH", "exact")]
+
+
+def test_name_prefix(state):
+    result = search(state, "Сбер")
+    assert result[:2] == [("SBER", "name"), ("SBERP", "name")]
+
+
+def test_word_prefix(state):
+    assert ("SBERP", "word") in search(state, "привилег")
+
+
+def test_typo(state):
+    assert search(state, "газпрм")[0] == ("GAZP", "fuzzy")
+    assert search(state, "ёндекс")[0][0] == "YNDX"
+
+
+def test_empty_query(state):
+    assert search(state, "") == []
+    assert search(state, "   ") == []
+
+
+def test_limit(state):
+    assert len(search(state, "с", limit=1)) == 1
@@ -0,0 +1,46 @@
+import json
+import runpy
+
+import pytest
+
+from src import startup
+from src.config import STARTUP_BUDGET_MS
+
+
+def run_main(argv: list[str]):
+    try:
+        startup.main(argv)
+    except RuntimeError as error:
+        # приложение не импортируется в этом окружении (нет зависимостей)
+        pytest.skip(str(error).splitlines()[0])
+
+
+def test_within_budget(capsys):
+    # бюджет по умолчанию - STARTUP_BUDGET_MS из настроек: выход с кодом 1 валит тест
+    run_main(["--json"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["cold_start_ms"] <= STARTUP_BUDGET_MS
+    assert report["status"] == 200
+    assert report["import_ms"] > 0 and report["cold_start_ms"] >= report["import_ms"]
+    assert "src.main" in report["project_ms"]
+
+
+def test_over_budget_exits_with_1(capsys):
+    with pytest.raises(SystemExit) as error:
+        run_main(["--budget", "1"])
+    assert error.value.code == 1
+    assert "over budget" in capsys.readouterr().err
+
+
+def test_import_does_not_run_probe(capsys):
+    # исполняем модуль заново, как при импорте, а не как python -m
+    runpy.run_module("src.startup_probe")
+    assert capsys.readouterr().out == ""
+
+
+def test_parse_importtime():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        120 |   json.decoder\n"
+              "import time:       300 |        420 | json\n"
+              "unrelated line\n")
+    assert startup.parse_importtime(stderr) == [("json.decoder", 120, 120), ("json", 300, 420)]
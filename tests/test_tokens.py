@@ -0,0 +1,23 @@
+import pytest
+from cryptography.fernet import Fernet
+
+from src.auth import tokens
+
+
+def test_round_trip():
+    assert tokens.decrypt_token(tokens.encrypt_token("t.secret")) == "t.secret"
+
+
+def test_refuses_to_start_without_key(monkeypatch):
+    monkeypatch.setattr(tokens, "BROKER_TOKEN_KEY", None)
+    monkeypatch.setattr(tokens, "SECRET_AUTH", None)
+    with pytest.raises(RuntimeError):
+        tokens._fernet()
+
+
+def test_dedicated_key_survives_secret_rotation(monkeypatch):
+    monkeypatch.setattr(tokens, "BROKER_TOKEN_KEY", Fernet.generate_key())
+    monkeypatch.setattr(tokens, "SECRET_AUTH", "old-secret")
+    encrypted = tokens._fernet().encrypt(b"t.secret")
+    monkeypatch.setattr(tokens, "SECRET_AUTH", "new-secret")
+    assert tokens._fernet().decrypt(encrypted) == b"t.secret"